@@ -15,9 +15,36 @@ import subprocess   # Para executar programas externos, como o PDB2PQR e o APBS.
 import os           # Para interagir com o sistema operacional, como manipular nomes de arquivos e caminhos.
 import tempfile     # Para criar diretórios temporários para os arquivos do APBS.
 import shutil       # Para remover os diretórios temporários.
+import signal       # Para encerrar o grupo de processos de uma ferramenta externa que passou do tempo limite.
 import csv          # Para ler e escrever arquivos no formato CSV.
+import itertools    # Para percorrer geradores de linhas sem montar listas intermediárias.
+import json         # Para o cabeçalho do cache de estruturas.
+import struct       # Para gravar o tamanho dos blocos no cache binário de estruturas.
+import hashlib      # Para identificar arquivos pelo conteúdo (cache de estruturas).
+import re           # Para dividir as linhas de arquivos mmCIF em tokens.
+import gzip         # Para ler e gravar arquivos .gz em fluxo.
+import bz2          # Para ler e gravar arquivos .bz2 em fluxo.
+import codecs       # Decodificação incremental do corpo dos downloads (filtro em fluxo).
+import sqlite3      # Para a memória persistente de sequências já calculadas (physchem --memo-db).
 import urllib.request # Para baixar arquivos da internet, especificamente os PDBs do RCSB.
+import urllib.parse # Para separar host e caminho das URLs de download.
+import http.client  # Conexões HTTP persistentes (keep-alive) para os downloads em lote.
+import threading    # Conexões por thread nos downloads concorrentes.
+import time         # Espera entre as tentativas de download (backoff).
+import glob         # Expansão dos padrões de arquivos do comando batch.
+import io           # Captura das mensagens de cada arquivo no comando batch.
+import contextlib   # Redirecionamento do stderr para o log de cada arquivo no comando batch.
+import queue        # Leitura da saída do processo persistente do PyMOL com tempo limite.
+import asyncio      # Execução concorrente dos processos do PDB2PQR e do APBS (apbs com vários arquivos).
+from array import array # Arrays compactos de números, usados para passar coordenadas aos processos.
 from collections import defaultdict # Um tipo de dicionário que cria um valor padrão para chaves que ainda não existem.
+from collections import deque # Fila das tarefas em andamento no modo em lote do physchem.
+from collections import OrderedDict # Cache LRU das sequências já calculadas.
+from concurrent.futures import ProcessPoolExecutor # Pool de processos para os cálculos paralelos (--jobs).
+from concurrent.futures import ThreadPoolExecutor # Pool de threads para os downloads concorrentes (fetchpdb --jobs).
+from concurrent.futures import as_completed # Resultados do comando batch na ordem em que terminam.
+from multiprocessing import shared_memory # Memória compartilhada entre os processos do pool.
+from multiprocessing import util as multiprocessing_util # Encerramento do PyMOL persistente ao sair (também nos processos do pool).
 
 # Importação opcional do módulo de visualização
 try:
@@ -26,6 +53,14 @@ try:
 except ImportError:
     HAS_VIZ = False
 
+# Importação opcional do NumPy, usado apenas pelos motores vetorizados.
+# Sem ele, o BioHub continua funcionando com os motores em Python puro.
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # Constantes e Dicionários de Dados 
 # Dicionário para converter o código de 3 letras de aminoácidos para 1 letra.
 THREE_TO_ONE = {
@@ -52,6 +87,15 @@ PKA_VALUES = {
     'C-term': 3.65, 'N-term': 8.0, 'D': 3.9, 'E': 4.07, 'H': 6.5, 'C': 8.5,
     'Y': 10.0, 'K': 10.0, 'R': 12.0
 }
+# Conjuntos de pKa selecionáveis com --pka-set. 'biohub' é o conjunto original (PKA_VALUES);
+# os demais são as tabelas clássicas usadas pelo EMBOSS e pelos livros-texto de bioquímica.
+PKA_SETS = {
+    'biohub': PKA_VALUES,
+    'emboss': {'C-term': 3.6, 'N-term': 8.6, 'D': 3.9, 'E': 4.1, 'H': 6.5, 'C': 8.5, 'Y': 10.1, 'K': 10.8, 'R': 12.5},
+    'lehninger': {'C-term': 2.34, 'N-term': 9.69, 'D': 3.86, 'E': 4.25, 'H': 6.0, 'C': 8.33, 'Y': 10.0, 'K': 10.5, 'R': 12.4},
+    'solomon': {'C-term': 2.4, 'N-term': 9.6, 'D': 3.9, 'E': 4.3, 'H': 6.0, 'C': 8.3, 'Y': 10.1, 'K': 10.5, 'R': 12.5},
+    'sillero': {'C-term': 3.2, 'N-term': 8.2, 'D': 4.0, 'E': 4.5, 'H': 6.4, 'C': 9.0, 'Y': 10.0, 'K': 10.4, 'R': 12.0},
+}
 # Raios de Van der Waals (em Angstroms) para diferentes elementos, usados no cálculo do SASA.
 VDW_RADII = {
     'H': 1.20, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'S': 1.80, 'P': 1.80, 'F': 1.47,
@@ -102,91 +146,634 @@ def print_banner():
     print("Autores: ACDS, AKNNA, LSRS, LHS & MADLA", file=sys.stderr)
     print("-" * 68, file=sys.stderr)
 
+# Arquivos comprimidos: a entrada é detectada pelos bytes iniciais (não pela extensão) e a
+# saída é comprimida quando o nome termina em .gz ou .bz2. Em ambos os casos a
+# (des)compressão acontece em fluxo, sem arquivo intermediário no disco.
+COMPRESSED_SUFFIXES = ('.gz', '.bz2')
+
+def strip_compression_suffix(filepath):
+    """Remove a extensão de compressão (.gz/.bz2) do nome, se houver."""
+    root, ext = os.path.splitext(filepath)
+    return root if ext.lower() in COMPRESSED_SUFFIXES else filepath
+
+def open_text(filepath, mode='r', **kwargs):
+    """
+    Abre um arquivo de texto como open(), descomprimindo gzip/bz2 na leitura e
+    comprimindo na escrita se o nome terminar em .gz ou .bz2.
+    """
+    if 'r' in mode:
+        with open(filepath, 'rb') as f:
+            magic = f.read(3)
+        if magic[:2] == b'\x1f\x8b':
+            return gzip.open(filepath, 'rt', **kwargs)
+        if magic == b'BZh':
+            return bz2.open(filepath, 'rt', **kwargs)
+        return open(filepath, mode, **kwargs)
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.gz':
+        return gzip.open(filepath, mode.replace('t', '') + 't', **kwargs)
+    if ext == '.bz2':
+        return bz2.open(filepath, mode.replace('t', '') + 't', **kwargs)
+    return open(filepath, mode, **kwargs)
+
 def print_exit_message():
     """Exibe uma mensagem de agradecimento ao final da execução..."""
     print("\n" + "=" * 69, file=sys.stderr)
     print("Obrigado por usar o BioHub! Essa aplicação foi feita com <3 e café...", file=sys.stderr)
     print("=" * 69, file=sys.stderr)
 
-def parse_pdb_atoms(pdb_filepath: str):
-    """Lê um arquivo PDB e extrai as coordenadas e informações de cada átomo."""
-    atoms = []
+class Structure:
+    """
+    Estrutura atômica armazenada em colunas (struct-of-arrays), em vez de um dicionário por átomo.
+
+    As coordenadas ficam em um array('f') com x, y, z intercalados. Nomes de átomo, resíduo e
+    elemento são índices em uma tabela de strings compartilhada (`names`), e cadeias e resíduos
+    são referenciados por índices inteiros. Dicionários por átomo só são gerados na saída,
+    com atom_record / atom_records.
+    """
+    def __init__(self):
+        self.names = []             # Tabela de strings internadas (átomos, resíduos e elementos).
+        self.chain_ids = []         # IDs das cadeias, na ordem em que aparecem.
+        self.serials = array('l')   # Número serial de cada átomo.
+        self.atom_name_ids = array('I')
+        self.res_name_ids = array('I')
+        self.element_ids = array('I')
+        self.chain_indices = array('I')
+        self.res_nums = array('l')
+        self.residue_indices = array('I') # Índice do resíduo (cadeia, número) de cada átomo.
+        self.hetero = array('B')    # 1 para linhas HETATM, 0 para ATOM.
+        self.coords = array('f')    # x, y, z de cada átomo, intercalados.
+        self.model_nums = array('l') # Número do MODEL de cada átomo (1 se o arquivo não tiver MODEL).
+        self.seqres = {}            # Cadeia -> lista de resíduos (3 letras) dos registros SEQRES.
+        self.header = defaultdict(str) # Título, classificação, data e organismo do cabeçalho.
+        self._name_index = {}
+        self._chain_index = {}
+        self._residue_index = {}
+
+    def __len__(self):
+        return len(self.serials)
+
+    @property
+    def n_residues(self):
+        return len(self._residue_index)
+
+    def _intern(self, name):
+        idx = self._name_index.get(name)
+        if idx is None:
+            idx = self._name_index[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return idx
+
+    def add_atom(self, serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero=False, model=1):
+        """Acrescenta um átomo ao final da estrutura."""
+        chain_idx = self._chain_index.get(chain_id)
+        if chain_idx is None:
+            chain_idx = self._chain_index[chain_id] = len(self.chain_ids)
+            self.chain_ids.append(chain_id)
+        residue_idx = self._residue_index.setdefault((chain_idx, res_num), len(self._residue_index))
+        self.serials.append(serial)
+        self.atom_name_ids.append(self._intern(atom_name))
+        self.res_name_ids.append(self._intern(res_name))
+        self.element_ids.append(self._intern(element))
+        self.chain_indices.append(chain_idx)
+        self.res_nums.append(res_num)
+        self.residue_indices.append(residue_idx)
+        self.hetero.append(1 if hetero else 0)
+        self.coords.extend((x, y, z))
+        self.model_nums.append(model)
+
+    def atom_name(self, i): return self.names[self.atom_name_ids[i]]
+    def res_name(self, i): return self.names[self.res_name_ids[i]]
+    def element(self, i): return self.names[self.element_ids[i]]
+    def chain_id(self, i): return self.chain_ids[self.chain_indices[i]]
+
+    def coordinates(self):
+        """
+        Retorna as coordenadas como uma lista de tuplas (x, y, z) em precisão dupla.
+        As coordenadas do PDB têm 3 casas decimais; o arredondamento recupera exatamente
+        o valor lido do arquivo, que o array('f') guarda com precisão simples.
+        """
+        c = self.coords
+        return [(round(c[k], 3), round(c[k+1], 3), round(c[k+2], 3)) for k in range(0, len(c), 3)]
+
+    def name_lookup(self, table, default=None):
+        """Mapeia cada entrada da tabela de nomes por `table` (ex.: nome do resíduo -> escala)."""
+        return [table.get(name, default) for name in self.names]
+
+    def models(self):
+        """Números dos modelos (MODEL) presentes na estrutura, na ordem em que aparecem."""
+        return list(dict.fromkeys(self.model_nums))
+
+    def select(self, indices):
+        """Nova estrutura só com os átomos em `indices`; SEQRES e cabeçalho são compartilhados."""
+        subset = Structure()
+        subset.seqres, subset.header = self.seqres, self.header
+        c = self.coords
+        for i in indices:
+            k = 3 * i
+            subset.add_atom(self.serials[i], self.atom_name(i), self.res_name(i), self.chain_id(i), self.res_nums[i],
+                            c[k], c[k+1], c[k+2], self.element(i), hetero=self.hetero[i], model=self.model_nums[i])
+        return subset
+
+    def select_model(self, model):
+        """Nova estrutura só com os átomos do modelo `model`."""
+        return self.select([i for i, m in enumerate(self.model_nums) if m == model])
+
+    def first_chain_indices(self):
+        """Índices dos átomos ATOM (sem HETATM) da primeira cadeia que aparece no arquivo."""
+        first_chain = None
+        indices = []
+        for i, hetero in enumerate(self.hetero):
+            if hetero: continue
+            chain_idx = self.chain_indices[i]
+            if first_chain is None: first_chain = chain_idx
+            if chain_idx == first_chain: indices.append(i)
+        return indices
+
+    def atom_record(self, i, **columns):
+        """Gera o dicionário de um átomo (mesmo formato de parse_pdb_atoms), com colunas extras opcionais."""
+        k = 3 * i
+        record = {
+            "atom_num": self.serials[i], "atom_name": self.atom_name(i), "res_name": self.res_name(i),
+            "chain_id": self.chain_id(i), "res_num": self.res_nums[i],
+            "x": round(self.coords[k], 3), "y": round(self.coords[k+1], 3), "z": round(self.coords[k+2], 3),
+            "element": self.element(i)
+        }
+        for key, values in columns.items(): record[key] = values[i]
+        return record
+
+    def atom_records(self, **columns):
+        """Gera a lista de dicionários de todos os átomos; usada apenas na saída (ex.: gráficos)."""
+        return [self.atom_record(i, **columns) for i in range(len(self))]
+
+    # Colunas numéricas gravadas no cache, na ordem em que aparecem no arquivo binário.
+    _ARRAY_FIELDS = ("serials", "atom_name_ids", "res_name_ids", "element_ids", "chain_indices",
+                     "res_nums", "residue_indices", "hetero", "coords", "model_nums")
+
+    def to_bytes(self):
+        """Serializa a estrutura: um cabeçalho JSON (tabelas de strings, SEQRES, cabeçalho) seguido dos arrays brutos."""
+        meta = {
+            "byteorder": sys.byteorder, "names": self.names, "chain_ids": self.chain_ids,
+            "residues": list(self._residue_index), "seqres": self.seqres, "header": dict(self.header),
+            "arrays": [[field, getattr(self, field).typecode, getattr(self, field).itemsize, len(getattr(self, field))]
+                       for field in self._ARRAY_FIELDS]
+        }
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        parts = [_STRUCTURE_CACHE_MAGIC, struct.pack('<I', len(meta_bytes)), meta_bytes]
+        parts.extend(getattr(self, field).tobytes() for field in self._ARRAY_FIELDS)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Reconstrói uma estrutura gravada por to_bytes. Levanta ValueError se o conteúdo não for compatível."""
+        if not data.startswith(_STRUCTURE_CACHE_MAGIC):
+            raise ValueError("formato de cache desconhecido")
+        offset = len(_STRUCTURE_CACHE_MAGIC)
+        (meta_len,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        meta = json.loads(data[offset:offset + meta_len].decode('utf-8'))
+        offset += meta_len
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError("cache gravado com outra ordem de bytes")
+        structure = cls()
+        for field, typecode, itemsize, count in meta["arrays"]:
+            values = array(typecode)
+            if values.itemsize != itemsize:
+                raise ValueError("cache gravado em outra plataforma")
+            end = offset + itemsize * count
+            values.frombytes(data[offset:end])
+            offset = end
+            setattr(structure, field, values)
+        structure.names = [sys.intern(name) for name in meta["names"]]
+        structure.chain_ids = meta["chain_ids"]
+        structure.seqres = meta["seqres"]
+        structure.header.update(meta["header"])
+        structure._name_index = {name: idx for idx, name in enumerate(structure.names)}
+        structure._chain_index = {chain: idx for idx, chain in enumerate(structure.chain_ids)}
+        structure._residue_index = {tuple(key): idx for idx, key in enumerate(meta["residues"])}
+        return structure
+
+# Cache persistente de estruturas já analisadas. Cada arquivo de entrada é identificado pelo
+# SHA-256 do seu conteúdo mais a versão do parser, então editar o PDB ou mudar o parser
+# invalida a entrada automaticamente. O diretório é limitado em tamanho (LRU por mtime).
+STRUCTURE_CACHE_VERSION = 2 # Incrementar sempre que parse_pdb_lines, parse_cif_lines ou Structure mudarem.
+STRUCTURE_CACHE_DIR = os.environ.get("BIOHUB_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "biohub", "structures"))
+STRUCTURE_CACHE_MAX_BYTES = int(float(os.environ.get("BIOHUB_CACHE_MAX_MB", "512")) * 1024 * 1024)
+_STRUCTURE_CACHE_MAGIC = b"BIOHUB-STRUCT\n" # Assinatura do formato binário.
+
+def _structure_cache_file(pdb_filepath):
+    """Caminho da entrada de cache de um arquivo, ou None se o arquivo não puder ser lido."""
+    digest = hashlib.sha256()
     try:
-        with open(pdb_filepath, 'r') as f:
+        with open(pdb_filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return os.path.join(STRUCTURE_CACHE_DIR, f"{digest.hexdigest()}-v{STRUCTURE_CACHE_VERSION}.bhs")
+
+def _load_cached_structure(cache_file):
+    """Lê uma estrutura do cache (ou None se não houver entrada válida) e a marca como usada recentemente."""
+    try:
+        with open(cache_file, 'rb') as f:
+            structure = Structure.from_bytes(f.read())
+        os.utime(cache_file) # Atualiza o mtime, que é o critério do LRU.
+        return structure
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Aviso: Entrada de cache inválida ignorada ({e}).", file=sys.stderr)
+        return None
+
+def _store_cached_structure(cache_file, structure):
+    """Grava uma estrutura no cache e remove as entradas menos usadas se o limite de tamanho for excedido."""
+    try:
+        os.makedirs(STRUCTURE_CACHE_DIR, exist_ok=True)
+        # Grava em um arquivo temporário e renomeia, para nunca deixar uma entrada pela metade.
+        fd, temp_path = tempfile.mkstemp(dir=STRUCTURE_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(structure.to_bytes())
+        os.replace(temp_path, cache_file)
+        _evict_structure_cache(STRUCTURE_CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"Aviso: Não foi possível gravar o cache de estruturas: {e}", file=sys.stderr)
+
+def _evict_structure_cache(max_bytes):
+    """Remove as entradas mais antigas (por mtime) até o cache caber em `max_bytes`."""
+    entries = []
+    with os.scandir(STRUCTURE_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".bhs"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _collect_header_line(info, line):
+    """Acumula em `info` os campos de cabeçalho (título, organismo, etc.) de uma linha PDB."""
+    if line.startswith("HEADER"):
+        info['classification'] = line[10:50].strip()
+        info['dep_date'] = line[50:59].strip()
+    elif line.startswith("TITLE"):
+        # O título pode ocupar várias linhas, então eu concateno.
+        info['title'] += line[10:80].strip() + " "
+    elif line.startswith("SOURCE"):
+        # Procuro especificamente pela linha com o nome científico do organismo.
+        if "ORGANISM_SCIENTIFIC" in line:
+            info['organism'] += line.split(":")[-1].strip().replace(';','') + " "
+
+def _finish_header(info):
+    """Limpa espaços extras que podem ter sido criados pela concatenação dos campos do cabeçalho."""
+    for key in info:
+        info[key] = ' '.join(info[key].split())
+    return info
+
+def _pdb_model_number(line, previous):
+    """
+    Lê o número de uma linha MODEL. Exportadores de dinâmica molecular às vezes gravam `MODEL 1` fora
+    das colunas 11-14 ou só `MODEL`; nesse caso uso o número do MODEL anterior + 1.
+    """
+    fields = line[5:].split()
+    try:
+        return int(fields[0])
+    except (IndexError, ValueError):
+        return previous + 1
+
+def iter_pdb_atoms(lines, structure=None):
+    """
+    Lê as linhas de um PDB em fluxo e gera um registro por átomo ATOM/HETATM:
+    (serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero, model).
+    Se `structure` for passada, o cabeçalho (HEADER/TITLE/SOURCE) e o SEQRES vão para ela na mesma passagem.
+    """
+    model, last_model = 1, 0
+    for line in lines:
+        # Linhas ATOM e HETATM contêm as informações dos átomos.
+        if line.startswith("ATOM") or line.startswith("HETATM"):
+            yield (
+                int(line[6:11]),            # Número serial do átomo
+                line[12:16].strip(),        # Nome do átomo (ex: CA, CB, N)
+                line[17:20].strip(),
+                line[21],
+                int(line[22:26]),
+                float(line[30:38]), float(line[38:46]), float(line[46:54]),
+                # Tento pegar o elemento da coluna 76-78; se não tiver, pego da 12-14.
+                line[76:78].strip().upper() or line[12:14].strip().upper(),
+                line.startswith("HETATM"), model
+            )
+        elif line.startswith("MODEL"):
+            model = last_model = _pdb_model_number(line, last_model)
+        elif structure is None:
+            continue
+        elif line.startswith("SEQRES"):
+            # Sequência depositada de cada cadeia, em códigos de 3 letras.
+            structure.seqres.setdefault(line[11], []).extend(line[19:70].split())
+        else:
+            _collect_header_line(structure.header, line)
+
+def parse_pdb_lines(lines) -> Structure:
+    """
+    Analisa as linhas de um PDB em uma única passagem: cabeçalho (HEADER/TITLE/SOURCE),
+    SEQRES, MODEL e os átomos ATOM/HETATM vão todos para a mesma Structure.
+    """
+    structure = Structure()
+    for serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero, model in iter_pdb_atoms(lines, structure):
+        structure.add_atom(serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero=hetero, model=model)
+    _finish_header(structure.header)
+    return structure
+
+# Leitura de mmCIF/PDBx. O formato não tem colunas fixas, então não sofre os limites do PDB
+# (mais de 99.999 átomos, IDs de cadeia com vários caracteres). A leitura é feita em fluxo,
+# linha a linha, sem carregar o arquivo inteiro na memória.
+_CIF_TOKEN = re.compile(r"""'.*?'(?=\s|$)|".*?"(?=\s|$)|\S+""")
+
+# Campos do mmCIF usados para montar as mesmas informações de cabeçalho do PDB.
+CIF_HEADER_FIELDS = {
+    "_struct.title": "title",
+    "_struct_keywords.pdbx_keywords": "classification",
+    "_pdbx_database_status.recvd_initial_deposition_date": "dep_date",
+    "_entity_src_gen.pdbx_gene_src_scientific_name": "organism",
+    "_entity_src_nat.pdbx_organism_scientific": "organism",
+    "_pdbx_entity_src_syn.organism_scientific": "organism",
+}
+_CIF_HEADER_CATEGORIES = {key.split('.')[0] for key in CIF_HEADER_FIELDS}
+
+def _cif_raw_tokens(text):
+    """Divide uma linha de dados mmCIF em tokens, mantendo as aspas."""
+    if "'" not in text and '"' not in text:
+        return text.split()
+    return _CIF_TOKEN.findall(text)
+
+def _cif_unquote(token):
+    if len(token) > 1 and token[0] in "'\"" and token[-1] == token[0]:
+        return token[1:-1]
+    return token
+
+class _CIFScanner:
+    """
+    Máquina de estados linha a linha para mmCIF. Cada chamada a feed() devolve os eventos
+    completados pela linha: ('item', chave, valor) para pares chave-valor e
+    ('row', categoria, colunas, valores) para cada linha de um loop_.
+    """
+    def __init__(self):
+        self.loop_columns = None   # Colunas do loop_ atual (None fora de loops).
+        self.loop_category = None  # Categoria do loop_ atual (ex: '_atom_site').
+        self.in_loop_header = False
+        self.pending_key = None    # Chave cujo valor vem na próxima linha.
+        self.text_block = None     # Linhas de um campo de texto delimitado por ';'.
+        self.row = []
+
+    def _end_loop(self):
+        self.loop_columns = self.loop_category = None
+        self.in_loop_header = False
+        self.row = []
+
+    def _values(self, values):
+        if self.pending_key is not None:
+            key, self.pending_key = self.pending_key, None
+            return [("item", key, values[0])]
+        if self.loop_columns:
+            self.in_loop_header = False
+            self.row.extend(values)
+            n_columns = len(self.loop_columns)
+            events = []
+            while len(self.row) >= n_columns:
+                events.append(("row", self.loop_category, self.loop_columns, self.row[:n_columns]))
+                self.row = self.row[n_columns:]
+            return events
+        return []
+
+    def feed(self, line):
+        if self.text_block is not None:
+            if line.startswith(';'):
+                text, self.text_block = ' '.join(self.text_block).strip(), None
+                return self._values([text])
+            self.text_block.append(line.strip())
+            return []
+        if line.startswith(';'):
+            self.text_block = [line[1:].strip()]
+            return []
+        stripped = line.strip()
+        if not stripped:
+            return []
+        if stripped.startswith('#') or stripped.startswith('data_'):
+            self._end_loop()
+            return []
+        if stripped.lower().startswith('loop_'):
+            self._end_loop()
+            self.loop_columns = []
+            self.in_loop_header = True
+            return []
+        if stripped.startswith('_'):
+            if self.in_loop_header:
+                self.loop_columns.append(stripped.split()[0])
+                self.loop_category = self.loop_columns[0].split('.')[0]
+                return []
+            self._end_loop()
+            parts = stripped.split(None, 1)
+            if len(parts) == 2:
+                return [("item", parts[0], _cif_unquote(_cif_raw_tokens(parts[1])[0]))]
+            self.pending_key = parts[0]
+            return []
+        return self._values([_cif_unquote(token) for token in _cif_raw_tokens(stripped)])
+
+def _collect_cif_header(info, key, value):
+    """Acumula em `info` um campo de cabeçalho do mmCIF, no mesmo formato de _collect_header_line."""
+    field = CIF_HEADER_FIELDS.get(key)
+    if field is None or value in ('?', '.'): return
+    if field == 'organism':
+        if value.upper() not in info['organism']: info['organism'] += value.upper() + " "
+    else:
+        info[field] = value
+
+def _atom_site_indices(columns):
+    """Posição de cada campo de _atom_site usado pelo BioHub (preferindo os campos 'auth_', como no PDB)."""
+    position = {name.split('.', 1)[1]: idx for idx, name in enumerate(columns)}
+    def pick(*names):
+        for name in names:
+            if name in position: return position[name]
+        return None
+    return {
+        "group": pick("group_PDB"), "serial": pick("id"), "element": pick("type_symbol"),
+        "atom_name": pick("auth_atom_id", "label_atom_id"), "res_name": pick("auth_comp_id", "label_comp_id"),
+        "chain": pick("auth_asym_id", "label_asym_id"), "res_num": pick("auth_seq_id", "label_seq_id"),
+        "x": pick("Cartn_x"), "y": pick("Cartn_y"), "z": pick("Cartn_z"),
+        "bfactor": pick("B_iso_or_equiv"), "occupancy": pick("occupancy"), "model": pick("pdbx_PDB_model_num"),
+    }
+
+def _cif_int(value, default=0):
+    return int(value) if value not in ('.', '?') else default
+
+def iter_cif_atom_sites(lines, structure=None):
+    """
+    Lê as linhas de um mmCIF em fluxo e gera um registro por átomo de _atom_site:
+    (serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero, model).
+    Se `structure` for passada, o cabeçalho e as sequências depositadas vão para ela na mesma passagem.
+    """
+    scanner = _CIFScanner()
+    columns_seen, idx = None, None
+    for line in lines:
+        for event in scanner.feed(line):
+            if event[0] == "item":
+                if structure is not None: _collect_cif_header(structure.header, event[1], event[2])
+                continue
+            _, category, columns, values = event
+            if category == "_atom_site":
+                if columns is not columns_seen:
+                    columns_seen, idx = columns, _atom_site_indices(columns)
+                element = values[idx["element"]] if idx["element"] is not None else "."
+                atom_name = values[idx["atom_name"]]
+                if element in ('.', '?'): element = atom_name[:1]
+                yield (
+                    int(values[idx["serial"]]), atom_name, values[idx["res_name"]], values[idx["chain"]],
+                    _cif_int(values[idx["res_num"]]),
+                    float(values[idx["x"]]), float(values[idx["y"]]), float(values[idx["z"]]),
+                    element.upper(), values[idx["group"]] == "HETATM" if idx["group"] is not None else False,
+                    _cif_int(values[idx["model"]], 1) if idx["model"] is not None else 1
+                )
+            elif structure is None:
+                continue
+            elif category == "_pdbx_poly_seq_scheme":
+                # Sequência depositada de cada cadeia (equivalente ao SEQRES do PDB).
+                row = dict(zip(columns, values))
+                chain = row.get("_pdbx_poly_seq_scheme.pdb_strand_id") or row.get("_pdbx_poly_seq_scheme.asym_id")
+                structure.seqres.setdefault(chain, []).append(row.get("_pdbx_poly_seq_scheme.mon_id"))
+            elif category in _CIF_HEADER_CATEGORIES:
+                for key, value in zip(columns, values):
+                    _collect_cif_header(structure.header, key, value)
+
+def parse_cif_lines(lines) -> Structure:
+    """Analisa as linhas de um mmCIF em uma única passagem, montando a mesma Structure do parser de PDB."""
+    structure = Structure()
+    for serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero, model in iter_cif_atom_sites(lines, structure):
+        structure.add_atom(serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero=hetero, model=model)
+    _finish_header(structure.header)
+    return structure
+
+def is_mmcif_file(filepath):
+    """Verifica se um arquivo é mmCIF pela extensão ou, na falta dela, pela primeira linha ('data_')."""
+    if strip_compression_suffix(filepath).lower().endswith(('.cif', '.mmcif')):
+        return True
+    try:
+        with open_text(filepath) as f:
             for line in f:
-                # Linhas ATOM e HETATM contêm as informações dos átomos.
-                if line.startswith("ATOM") or line.startswith("HETATM"):
-                    # Extraio as informações de cada coluna, convertendo para o tipo correto.
-                    atoms.append({
-                        "atom_num": int(line[6:11]),  # Número serial do átomo
-                        "atom_name": line[12:16].strip(),  # Nome do átomo (ex: CA, CB, N)
-                        "res_name": line[17:20].strip(), 
-                        "chain_id": line[21],
-                        "res_num": int(line[22:26]),
-                        "x": float(line[30:38]), 
-                        "y": float(line[38:46]), 
-                        "z": float(line[46:54]),
-                        # Tento pegar o elemento da coluna 76-78; se não tiver, pego da 12-14.
-                        "element": line[76:78].strip().upper() or line[12:14].strip().upper()
-                    })
+                if line.strip():
+                    return line.startswith('data_')
+    except OSError:
+        pass
+    return False
+
+def read_structure(pdb_filepath: str, use_cache: bool = False) -> Structure:
+    """
+    Lê um arquivo PDB (ou mmCIF) uma única vez e monta a estrutura com átomos, modelos, SEQRES e cabeçalho.
+    Com use_cache, uma estrutura já analisada antes é lida do cache binário, sem reprocessar o texto.
+    """
+    cache_file = _structure_cache_file(pdb_filepath) if use_cache else None
+    if cache_file:
+        structure = _load_cached_structure(cache_file)
+        if structure is not None: return structure
+    try:
+        parse_lines = parse_cif_lines if is_mmcif_file(pdb_filepath) else parse_pdb_lines
+        with open_text(pdb_filepath) as f:
+            structure = parse_lines(f)
     except FileNotFoundError:
         print(f"Erro: Arquivo não encontrado em '{pdb_filepath}'", file=sys.stderr)
-    return atoms
+        return Structure()
+    if cache_file and len(structure):
+        _store_cached_structure(cache_file, structure)
+    return structure
 
-def get_sequence_from_pdb(pdb_filepath: str) -> str:
-    """Extrai a sequência de aminoácidos da primeira cadeia de um arquivo PDB."""
-    sequence = ""
-    processed_residues = set() # Para não adicionar o mesmo resíduo várias vezes.
-    first_chain_id = None # Vou pegar a sequência apenas da primeira cadeia que encontrar.
+def iter_models(pdb_filepath: str):
+    """
+    Lê um arquivo PDB (ou mmCIF) em fluxo e gera (número do modelo, Structure), um modelo por vez.
+    Só um modelo fica na memória: cada um é entregue assim que o próximo começa. SEQRES e
+    cabeçalho são compartilhados entre os modelos.
+    """
+    iter_atoms = iter_cif_atom_sites if is_mmcif_file(pdb_filepath) else iter_pdb_atoms
+    shared = Structure() # Recebe o cabeçalho e o SEQRES, que vêm antes dos átomos.
+    current, current_model = None, None
     try:
-        with open(pdb_filepath, 'r') as pdb_file:
-            for line in pdb_file:
-                if line.startswith("ATOM"):
-                    current_chain_id = line[21]
-                    # Define a primeira cadeia encontrada como a cadeia de referência.
-                    if first_chain_id is None: first_chain_id = current_chain_id
-                    
-                    # Processo a linha apenas se ela pertencer à primeira cadeia.
-                    if current_chain_id == first_chain_id:
-                        res_id = (int(line[22:26]), line[21]) # Identificador único do resíduo (número, cadeia).
-                        if res_id not in processed_residues:
-                            res_name = line[17:20]
-                            # Converte o nome de 3 letras para 1 letra e adiciona à sequência.
-                            if res_name in THREE_TO_ONE:
-                                sequence += THREE_TO_ONE[res_name]
-                                processed_residues.add(res_id)
+        with open_text(pdb_filepath) as f:
+            for serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero, model in iter_atoms(f, shared):
+                if model != current_model:
+                    if current is not None: yield current_model, current
+                    current, current_model = Structure(), model
+                    current.seqres, current.header = shared.seqres, _finish_header(shared.header)
+                current.add_atom(serial, atom_name, res_name, chain_id, res_num, x, y, z, element, hetero=hetero, model=model)
     except FileNotFoundError:
         print(f"Erro: Arquivo não encontrado em '{pdb_filepath}'", file=sys.stderr)
-    return sequence
+        return
+    if current is not None: yield current_model, current
+
+def select_models(args):
+    """
+    Gera (modelo, Structure) conforme a opção --model dos comandos de estrutura: o primeiro
+    modelo por padrão, um modelo específico (N) ou todos ('all', lidos um por vez em fluxo).
+    """
+    if args.model == 'all':
+        yield from iter_models(args.pdb_file)
+        return
+    structure = read_structure(args.pdb_file, use_cache=not args.no_cache)
+    if not len(structure): return
+    models = structure.models()
+    if args.model is None:
+        model = models[0]
+        if len(models) > 1:
+            print(f"Aviso: O arquivo tem {len(models)} modelos; analisando apenas o modelo {model} "
+                  f"(use --model N ou --model all).", file=sys.stderr)
+    else:
+        model = int(args.model)
+        if model not in models:
+            print(f"Erro: Modelo {model} não encontrado. Modelos disponíveis: "
+                  f"{', '.join(map(str, models))}", file=sys.stderr)
+            return
+    yield model, (structure.select_model(model) if len(models) > 1 else structure)
+
+def model_arg(value):
+    """Tipo do argparse para --model: um número de modelo ou 'all'."""
+    if value == 'all' or value.isdigit():
+        return value
+    raise argparse.ArgumentTypeError("use um número de modelo ou 'all'")
+
+def parse_pdb_atoms(pdb_filepath: str):
+    """Lê um arquivo PDB e extrai as coordenadas e informações de cada átomo (um dicionário por átomo)."""
+    return read_structure(pdb_filepath).atom_records()
+
+def sequence_from_structure(structure: Structure) -> str:
+    """Monta a sequência de aminoácidos da primeira cadeia de uma estrutura."""
+    residues = {} # Índice do resíduo -> letra, na ordem em que aparecem.
+    one_letter = structure.name_lookup(THREE_TO_ONE)
+    for i in structure.first_chain_indices():
+        code = one_letter[structure.res_name_ids[i]]
+        # Converte o nome de 3 letras para 1 letra, uma vez por resíduo.
+        if code: residues.setdefault(structure.residue_indices[i], code)
+    return "".join(residues.values())
+
+def get_sequence_from_pdb(pdb_filepath: str, use_cache: bool = False) -> str:
+    """Extrai a sequência de aminoácidos da primeira cadeia de um arquivo PDB."""
+    return sequence_from_structure(read_structure(pdb_filepath, use_cache))
 
 def extract_pdb_header_info(pdb_filepath: str):
     """Extrai informações gerais do cabeçalho de um arquivo PDB (título, organismo, etc.)."""
     info = defaultdict(str) # Usando defaultdict para facilitar a concatenação de strings.
     try:
-        with open(pdb_filepath, 'r') as f:
+        with open_text(pdb_filepath) as f:
             for line in f:
-                if line.startswith("HEADER"):
-                    info['classification'] = line[10:50].strip()
-                    info['dep_date'] = line[50:59].strip()
-                elif line.startswith("TITLE"):
-                    # O título pode ocupar várias linhas, então eu concateno.
-                    info['title'] += line[10:80].strip() + " "
-                elif line.startswith("SOURCE"):
-                    # Procuro especificamente pela linha com o nome científico do organismo.
-                    if "ORGANISM_SCIENTIFIC" in line:
-                        info['organism'] += line.split(":")[-1].strip().replace(';','') + " "
+                _collect_header_line(info, line)
     except Exception as e:
         print(f"Aviso: Não foi possível extrair informações do cabeçalho do PDB: {e}", file=sys.stderr)
-    
-    # Limpo espaços extras que podem ter sido criados pela concatenação.
-    for key in info:
-        info[key] = ' '.join(info[key].split())
-    return info
+    return _finish_header(info)
     
 def write_csv(filepath, header, data_rows):
     """Função auxiliar para escrever dados em um arquivo CSV."""
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        with open_text(filepath, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(header) # Escreve o cabeçalho.
             writer.writerows(data_rows) # Escreve todas as linhas de dados.
@@ -207,174 +794,1263 @@ def generate_sphere_points(n_points: int):
         points.append((math.cos(theta) * radius, y, math.sin(theta) * radius))
     return points
 
-# Funções de Download, Conversão e Análise (o coração da ferramenta)
+class CellList:
+    """
+    Índice espacial em grade uniforme (cell list) para buscas de vizinhos por distância.
 
-def filter_pdb_content(pdb_filepath, chains=None, protein_only=False):
+    Os átomos são distribuídos uma única vez em células cúbicas de aresta `cell_size`;
+    uma busca com raio de corte r só precisa visitar as células a até ceil(r / cell_size)
+    de distância, em vez de comparar contra todos os átomos.
     """
-    Filtra o conteúdo de um arquivo PDB baseado em critérios especificados.
-    
+    def __init__(self, coords, cell_size):
+        self.coords = coords
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        for idx, (x, y, z) in enumerate(coords):
+            self.cells[self.cell_of(x, y, z)].append(idx)
+
+    def cell_of(self, x, y, z):
+        """Retorna a chave (i, j, k) da célula que contém o ponto."""
+        size = self.cell_size
+        return (math.floor(x / size), math.floor(y / size), math.floor(z / size))
+
+    def candidates(self, x, y, z, cutoff):
+        """Gera os índices dos átomos nas células que podem estar a até `cutoff` do ponto."""
+        reach = max(1, math.ceil(cutoff / self.cell_size))
+        ci, cj, ck = self.cell_of(x, y, z)
+        cells = self.cells
+        for di in range(-reach, reach + 1):
+            for dj in range(-reach, reach + 1):
+                for dk in range(-reach, reach + 1):
+                    cell = cells.get((ci + di, cj + dj, ck + dk))
+                    if cell: yield from cell
+
+# Motores de cálculo do SASA. Todos devolvem o número de pontos acessíveis de cada átomo
+# em `indices` (por padrão, todos), na mesma ordem, para que possam ser comparados entre si
+# e executados em pedaços pelos processos do pool (--jobs).
+
+def _sasa_brute_force(coords, radii, sphere_points, probe_radius, indices=None, grid=None):
+    """Motor original: testa cada ponto de cada átomo contra todos os outros átomos (O(N² × P))."""
+    counts = []
+    for i in (range(len(coords)) if indices is None else indices):
+        xi, yi, zi = coords[i]
+        extended_radius = radii[i] + probe_radius
+        accessible_points = 0
+        for sp in sphere_points:
+            point_is_accessible = True
+            point = (xi + extended_radius * sp[0], yi + extended_radius * sp[1], zi + extended_radius * sp[2])
+            # Verifico se este ponto está dentro da esfera estendida de qualquer outro átomo.
+            for j, atom_j in enumerate(coords):
+                if i == j: continue
+                # Se a distância do ponto ao centro do átomo j for menor que o raio estendido de j, o ponto está ocluído.
+                if sum((p-c)**2 for p,c in zip(point, atom_j)) < (radii[j] + probe_radius)**2:
+                    point_is_accessible = False; break
+            if point_is_accessible: accessible_points += 1
+        counts.append(accessible_points)
+    return counts
+
+def _sasa_grid(coords, radii, probe_radius):
+    """Monta a cell list usada na busca de vizinhos do SASA."""
+    # Com aresta 2·max(r + sonda), todos os vizinhos possíveis estão nas 27 células ao redor.
+    return CellList(coords, 2 * (max(radii) + probe_radius))
+
+def _sasa_neighbor_lists(coords, radii, probe_radius, indices=None, grid=None):
+    """
+    Monta, para cada átomo i, a lista dos átomos j a menos de r_i + r_j + 2·sonda de distância.
+    Apenas esses átomos podem ocluir pontos da esfera estendida de i.
+    """
+    if not coords: return []
+    if grid is None: grid = _sasa_grid(coords, radii, probe_radius)
+    max_extended = max(radii) + probe_radius
+    neighbor_lists = []
+    for i in (range(len(coords)) if indices is None else indices):
+        xi, yi, zi = coords[i]
+        reach_i = radii[i] + probe_radius
+        neighbors = []
+        for j in grid.candidates(xi, yi, zi, reach_i + max_extended):
+            if j == i: continue
+            xj, yj, zj = coords[j]
+            cutoff = reach_i + radii[j] + probe_radius
+            if (xi-xj)**2 + (yi-yj)**2 + (zi-zj)**2 < cutoff * cutoff:
+                neighbors.append(j)
+        neighbors.sort()
+        neighbor_lists.append(neighbors)
+    return neighbor_lists
+
+def _sasa_cell_list(coords, radii, sphere_points, probe_radius, indices=None, grid=None):
+    """Motor com cell list: cada ponto só é testado contra os vizinhos espaciais do seu átomo."""
+    if indices is None: indices = range(len(coords))
+    neighbor_lists = _sasa_neighbor_lists(coords, radii, probe_radius, indices, grid)
+    counts = []
+    for i, neighbor_list in zip(indices, neighbor_lists):
+        xi, yi, zi = coords[i]
+        extended_radius = radii[i] + probe_radius
+        neighbors = [(coords[j], (radii[j] + probe_radius)**2) for j in neighbor_list]
+        accessible_points = 0
+        last_occluder = None # O último átomo que ocluiu um ponto costuma ocluir o próximo também.
+        for sp in sphere_points:
+            point = (xi + extended_radius * sp[0], yi + extended_radius * sp[1], zi + extended_radius * sp[2])
+            if last_occluder is not None:
+                atom_j, limit_sq = last_occluder
+                if sum((p-c)**2 for p,c in zip(point, atom_j)) < limit_sq: continue
+            for neighbor in neighbors:
+                if sum((p-c)**2 for p,c in zip(point, neighbor[0])) < neighbor[1]:
+                    last_occluder = neighbor; break
+            else:
+                accessible_points += 1
+        counts.append(accessible_points)
+    return counts
+
+def _sasa_numpy(coords, radii, sphere_points, probe_radius, indices=None, grid=None):
+    """
+    Motor vetorizado (NumPy): os P pontos de cada átomo são testados contra todos os seus
+    vizinhos de uma vez, como operações em arrays de formato (P, K).
+    """
+    if indices is None: indices = range(len(coords))
+    neighbor_lists = _sasa_neighbor_lists(coords, radii, probe_radius, indices, grid)
+    xyz = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    extended = np.asarray(radii, dtype=np.float64) + probe_radius
+    limits_sq = extended ** 2
+    sphere = np.asarray(sphere_points, dtype=np.float64).reshape(-1, 3)
+    n_points = len(sphere)
+    counts = []
+    for i, neighbors in zip(indices, neighbor_lists):
+        if not neighbors:
+            counts.append(n_points)
+            continue
+        points = xyz[i] + extended[i] * sphere                       # (P, 3)
+        diff = points[:, np.newaxis, :] - xyz[neighbors][np.newaxis]  # (P, K, 3)
+        dist_sq = (diff * diff).sum(axis=2)                           # (P, K)
+        occluded = (dist_sq < limits_sq[neighbors]).any(axis=1)
+        counts.append(int(n_points - np.count_nonzero(occluded)))
+    return counts
+
+SASA_ENGINES = {"brute": _sasa_brute_force, "grid": _sasa_cell_list, "numpy": _sasa_numpy}
+
+def resolve_sasa_engine(engine):
+    """Resolve 'auto' para o motor mais rápido disponível e recua para 'grid' se faltar o NumPy."""
+    if engine == "auto":
+        return "numpy" if HAS_NUMPY else "grid"
+    if engine == "numpy" and not HAS_NUMPY:
+        print("Aviso: NumPy não disponível, usando o motor 'grid'. Instale com: pip install numpy", file=sys.stderr)
+        return "grid"
+    return engine
+
+# Execução paralela do SASA (--jobs). As coordenadas e os raios são copiados uma única vez
+# para um bloco de memória compartilhada; cada processo do pool o lê na inicialização e
+# as tarefas carregam apenas o intervalo de átomos [início, fim) a calcular.
+_SASA_WORKER = {}
+
+def _sasa_worker_init(shm_name, n_atoms, sphere_points, probe_radius, engine):
+    """Inicializa um processo do pool: lê coordenadas e raios da memória compartilhada e monta a cell list."""
+    # Os processos do pool compartilham o resource_tracker do processo principal, que é quem
+    # cria e remove o bloco; aqui ele é apenas anexado e fechado após a leitura.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = shm.buf.cast('d')
+    coords = [(values[3*i], values[3*i+1], values[3*i+2]) for i in range(n_atoms)]
+    radii = values[3*n_atoms:4*n_atoms].tolist()
+    values.release()
+    shm.close()
+    _SASA_WORKER.update(
+        coords=coords, radii=radii, sphere_points=sphere_points, probe_radius=probe_radius,
+        engine=SASA_ENGINES[engine], grid=_sasa_grid(coords, radii, probe_radius) if engine != "brute" else None
+    )
+
+def _sasa_worker_chunk(start, stop):
+    """Calcula os pontos acessíveis dos átomos [start, stop) em um processo do pool."""
+    w = _SASA_WORKER
+    return w["engine"](w["coords"], w["radii"], w["sphere_points"], w["probe_radius"], range(start, stop), w["grid"])
+
+def _sasa_counts_parallel(coords, radii, sphere_points, probe_radius, engine, jobs):
+    """Distribui o cálculo do SASA em pedaços por um ProcessPoolExecutor e junta os resultados na ordem original."""
+    n_atoms = len(coords)
+    data = array('d')
+    for xyz in coords: data.extend(xyz)
+    data.extend(radii)
+    shm = shared_memory.SharedMemory(create=True, size=data.itemsize * len(data))
+    try:
+        shm.buf[:len(data) * data.itemsize] = data.tobytes()
+        # Vários pedaços por processo equilibram a carga entre regiões densas e esparsas da estrutura.
+        chunk_size = max(1, math.ceil(n_atoms / (jobs * 4)))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_sasa_worker_init,
+                                 initargs=(shm.name, n_atoms, sphere_points, probe_radius, engine)) as executor:
+            futures = [executor.submit(_sasa_worker_chunk, start, min(start + chunk_size, n_atoms))
+                       for start in range(0, n_atoms, chunk_size)]
+            counts = []
+            for future in futures: counts.extend(future.result())
+    finally:
+        shm.close()
+        shm.unlink()
+    return counts
+
+def compute_sasa(structure, num_points, probe_radius, engine="auto", jobs=1, in_pool=False):
+    """
+    Calcula o SASA (Ų) de cada átomo pelo método de Shrake-Rupley.
+
     Args:
-        pdb_filepath: Caminho para o arquivo PDB
-        chains: Lista de IDs de cadeias a manter (ex: ['A', 'B']). Se None, mantém todas.
-        protein_only: Se True, remove água (HOH), ligantes e heteroátomos (mantém apenas ATOM)
-    
+        structure: Estrutura (Structure) com os átomos a analisar
+        num_points: Número de pontos na esfera de cada átomo
+        probe_radius: Raio da sonda do solvente (Å)
+        engine: 'brute' (todos contra todos), 'grid' (cell list), 'numpy' (vetorizado) ou 'auto'
+        jobs: Número de processos; acima de 1, os átomos são divididos em pedaços entre eles
+        in_pool: Calcula no pool de processos mesmo com jobs=1, deixando o GIL livre para outras threads
+
     Returns:
-        Número de átomos mantidos após filtragem
+        array('d') com o SASA de cada átomo, na mesma ordem da estrutura
     """
-    filtered_lines = []
-    atoms_kept = 0
-    atoms_removed = 0
-    
-    with open(pdb_filepath, 'r') as f:
-        for line in f:
-            keep_line = True
-            
-            # Processa linhas ATOM e HETATM
-            if line.startswith("ATOM") or line.startswith("HETATM"):
-                # Se protein_only, mantém apenas linhas ATOM
-                if protein_only and line.startswith("HETATM"):
-                    keep_line = False
-                    atoms_removed += 1
-                
-                # Se protein_only, remove água (HOH)
-                if protein_only and line[17:20].strip() == "HOH":
-                    keep_line = False
-                    atoms_removed += 1
-                
-                # Filtra por chains se especificado
-                if keep_line and chains is not None:
-                    chain_id = line[21]
-                    if chain_id not in chains:
-                        keep_line = False
-                        atoms_removed += 1
-                
-                if keep_line:
-                    atoms_kept += 1
+    coords = structure.coordinates()
+    radius_by_name = structure.name_lookup(VDW_RADII, VDW_RADII['DEFAULT'])
+    radii = [radius_by_name[k] for k in structure.element_ids]
+    # Gero os pontos na esfera que serão usados para testar a acessibilidade de cada átomo.
+    sphere_points = generate_sphere_points(num_points)
+    engine = resolve_sasa_engine(engine)
+    if (jobs > 1 or in_pool) and len(coords) > 1:
+        counts = _sasa_counts_parallel(coords, radii, sphere_points, probe_radius, engine, max(1, jobs))
+    else:
+        counts = SASA_ENGINES[engine](coords, radii, sphere_points, probe_radius)
+    # O SASA do átomo é a proporção de pontos acessíveis multiplicada pela área da esfera estendida.
+    return array('d', (
+        (accessible_points / num_points) * 4.0 * math.pi * (radius + probe_radius)**2 if num_points > 0 else 0
+        for accessible_points, radius in zip(counts, radii)
+    ))
+
+def residue_average(structure, values):
+    """Calcula a média de `values` por resíduo e devolve esse valor médio para cada átomo."""
+    sums = [0.0] * structure.n_residues
+    counts = [0] * structure.n_residues
+    for residue_idx, value in zip(structure.residue_indices, values):
+        sums[residue_idx] += value
+        counts[residue_idx] += 1
+    averages = [total / count if count else 0.0 for total, count in zip(sums, counts)]
+    return averages, array('d', (averages[k] for k in structure.residue_indices))
+
+def atom_rows(structure, values, fmt):
+    """Gera as linhas de saída por átomo (Chain, ResNum, ResName, AtomNum, AtomName, valor)."""
+    for i, value in enumerate(values):
+        yield [structure.chain_id(i), structure.res_nums[i], structure.res_name(i),
+               structure.serials[i], structure.atom_name(i), format(value, fmt)]
+
+def print_atom_rows(rows, with_model=False, limit=20):
+    """Imprime as primeiras `limit` linhas por átomo no terminal e quantas ficaram de fora."""
+    for row in itertools.islice(rows, limit):  # Mostra apenas as primeiras para não poluir o terminal
+        model = f"{row.pop(0):<5} | " if with_model else ""
+        print(f"{model}{row[0]:<5} | {row[1]:<6} | {row[2]:<7} | {row[3]:<7} | {row[4]:<8} | {row[5]}")
+    remaining = sum(1 for _ in rows) # Consome o resto para que todos os modelos sejam processados.
+    if remaining:
+        print(f"... e mais {remaining} átomos. Use -o para salvar todos os dados.")
+
+class AtomValues:
+    """
+    Conta os átomos analisados modelo a modelo e, se houver arquivo de saída, anota o arquivo de
+    entrada à medida que os modelos chegam (ver StructureAnnotator): só os valores do modelo atual
+    ficam na memória, mesmo com --model all.
+    """
+    def __init__(self, input_pdb_path=None, output_pdb_path=None, property_name="Property", target="bfactor",
+                 with_model=False):
+        self.n_atoms = 0
+        self.property_name = property_name
+        self.annotator = None
+        if output_pdb_path:
+            self.annotator = StructureAnnotator(input_pdb_path, output_pdb_path, [(property_name, target)], with_model)
+
+    def __len__(self):
+        return self.n_atoms
+
+    def count(self, structure):
+        """Conta os átomos de um modelo sem guardar valores."""
+        self.n_atoms += len(structure)
+
+    def add(self, structure, values):
+        """Conta os átomos de um modelo e grava seus valores no arquivo anotado, na ordem dos átomos da estrutura."""
+        self.count(structure)
+        if self.annotator is not None:
+            self.annotator.add(structure.serials, structure.model_nums, {self.property_name: values})
+
+    def close(self):
+        """Termina o arquivo anotado (copia as linhas que sobraram e mostra o resumo)."""
+        if self.annotator is not None:
+            self.annotator.close()
+
+# Funções de Download, Conversão e Análise (o coração da ferramenta)
+
+class PDBFilter:
+    """
+    Filtro de linhas de PDB aplicado em fluxo, linha a linha.
+
+    Mantém apenas as cadeias pedidas e/ou apenas proteína e, na mesma passagem, coleta as
+    informações do cabeçalho, para que o arquivo não precise ser relido depois.
+    """
+    def __init__(self, chains=None, protein_only=False):
+        self.chains = chains
+        self.protein_only = protein_only
+        self.atoms_kept = 0
+        self.atoms_removed = 0
+        self.header = defaultdict(str)
+
+    def keep(self, line):
+        """Decide se a linha fica no arquivo filtrado."""
+        keep_line = True
+        
+        # Processa linhas ATOM e HETATM
+        if line.startswith("ATOM") or line.startswith("HETATM"):
+            # Se protein_only, mantém apenas linhas ATOM
+            if self.protein_only and line.startswith("HETATM"):
+                keep_line = False
+                self.atoms_removed += 1
             
-            # Mantém todas as outras linhas (HEADER, TITLE, etc.) exceto HETATM se protein_only
-            elif not (protein_only and line.startswith("HETATM")):
-                pass  # Mantém a linha
-            else:
+            # Se protein_only, remove água (HOH)
+            if self.protein_only and line[17:20].strip() == "HOH":
                 keep_line = False
+                self.atoms_removed += 1
+            
+            # Filtra por chains se especificado
+            if keep_line and self.chains is not None:
+                chain_id = line[21]
+                if chain_id not in self.chains:
+                    keep_line = False
+                    self.atoms_removed += 1
             
             if keep_line:
-                filtered_lines.append(line)
+                self.atoms_kept += 1
+        else:
+            # Mantém todas as outras linhas (HEADER, TITLE, etc.) e aproveita para ler o cabeçalho
+            _collect_header_line(self.header, line)
+        return keep_line
+
+    def filter(self, lines):
+        """Gera apenas as linhas mantidas."""
+        for line in lines:
+            if self.keep(line):
+                yield line
+
+    def header_info(self):
+        """Informações do cabeçalho coletadas até aqui."""
+        return _finish_header(defaultdict(str, self.header))
+
+class CIFFilter(PDBFilter):
+    """
+    Versão do PDBFilter para mmCIF: decide pelas colunas do loop _atom_site (grupo, resíduo e cadeia).
+    Assume uma linha de _atom_site por linha do arquivo, como nos arquivos do RCSB.
+    """
+    def __init__(self, chains=None, protein_only=False):
+        super().__init__(chains, protein_only)
+        self.scanner = _CIFScanner()
+        self._columns, self._idx = None, None
+
+    def keep(self, line):
+        keep_line = True
+        for event in self.scanner.feed(line):
+            if event[0] == "item":
+                _collect_cif_header(self.header, event[1], event[2])
+                continue
+            _, category, columns, values = event
+            if category == "_atom_site":
+                if columns is not self._columns:
+                    self._columns, self._idx = columns, _atom_site_indices(columns)
+                idx = self._idx
+                # Se protein_only, mantém apenas ATOM e remove água (HOH)
+                if self.protein_only and (values[idx["group"]] == "HETATM" or values[idx["res_name"]] == "HOH"):
+                    keep_line = False
+                # Filtra por chains se especificado
+                elif self.chains is not None and values[idx["chain"]] not in self.chains:
+                    keep_line = False
+                if keep_line: self.atoms_kept += 1
+                else: self.atoms_removed += 1
+            elif category in _CIF_HEADER_CATEGORIES:
+                for key, value in zip(columns, values):
+                    _collect_cif_header(self.header, key, value)
+        return keep_line
+
+# Downloads do RCSB. Cada thread mantém uma conexão keep-alive por host, reutilizada entre os
+# arquivos; falhas de rede e respostas 429/5xx são repetidas com espera exponencial. O corpo é
+# repassado em pedaços a "destinos" (arquivo bruto, filtro), cada um gravando em um arquivo
+# temporário que só é renomeado quando o download termina.
+PDB_BASE_URL = os.environ.get("BIOHUB_PDB_BASE_URL", "https://files.rcsb.org/download")
+FETCH_RETRIES = 3        # Novas tentativas após a primeira falha.
+FETCH_BACKOFF = 1.0      # Espera (s) antes da primeira nova tentativa; dobra a cada tentativa.
+FETCH_TIMEOUT = 60       # Tempo limite (s) de conexão e leitura.
+FETCH_CHUNK_SIZE = 1 << 16
+_HTTP_LOCAL = threading.local()
+
+def _http_connection(scheme, host, fresh=False):
+    """Conexão keep-alive do thread atual com `host` (criada na primeira vez ou se `fresh`)."""
+    connections = getattr(_HTTP_LOCAL, "connections", None)
+    if connections is None:
+        connections = _HTTP_LOCAL.connections = {}
+    conn = connections.get((scheme, host))
+    if conn is not None and fresh:
+        conn.close()
+        conn = None
+    if conn is None:
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = connections[(scheme, host)] = connection_class(host, timeout=FETCH_TIMEOUT)
+    return conn
+
+def _partial_path(dest_path):
+    """Nome temporário (oculto, no mesmo diretório) para gravar `dest_path` antes do os.replace final."""
+    directory, name = os.path.split(dest_path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.part")
+
+class _RawFileSink:
+    """Destino de download que grava os bytes como chegam em `path`."""
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = _partial_path(path)
+        self.file = open(self.temp_path, 'wb')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path): os.remove(self.temp_path)
+
+class _FilterSink:
+    """
+    Destino de download que decodifica o corpo em fluxo, passa cada linha pelo filtro (que coleta o
+    cabeçalho na mesma passagem) e grava em `path` apenas as linhas mantidas. A memória usada é a
+    de um pedaço mais a linha incompleta no final dele.
+    """
+    def __init__(self, path, pdb_filter):
+        self.path = path
+        self.pdb_filter = pdb_filter
+        # O arquivo temporário mantém a extensão de compressão do destino, que define o formato em open_text.
+        compression = os.path.splitext(path)[1] if path.lower().endswith(COMPRESSED_SUFFIXES) else ""
+        self.temp_path = _partial_path(path) + compression
+        self.file = open_text(self.temp_path, 'w')
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending = ""
+
+    def _write_lines(self, lines):
+        keep = self.pdb_filter.keep
+        self.file.writelines(line for line in lines if keep(line))
+
+    def write(self, chunk):
+        *lines, self.pending = (self.pending + self.decoder.decode(chunk)).split('\n')
+        self._write_lines(line + '\n' for line in lines)
+
+    def commit(self):
+        tail = self.pending + self.decoder.decode(b"", final=True)
+        if tail: self._write_lines([tail])
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path): os.remove(self.temp_path)
+
+class _BodyReadError(Exception):
+    """Falha de rede ao ler o corpo da resposta; separa as falhas repetíveis das de gravação local."""
+
+def _read_body(response):
+    """Gera os pedaços do corpo da resposta, trocando as falhas de leitura por _BodyReadError."""
+    while True:
+        try:
+            chunk = response.read(FETCH_CHUNK_SIZE)
+        except (OSError, http.client.HTTPException) as e:
+            raise _BodyReadError(e) from e
+        if not chunk: return
+        yield chunk
+
+def _feed_sinks(chunks, sinks):
+    """Repassa os pedaços a todos os destinos e confirma todos; se algo falhar, descarta todos."""
+    digest = hashlib.sha256() # Calculado junto com a escrita, sem reler o arquivo.
+    size = 0
+    try:
+        for chunk in chunks:
+            for sink in sinks:
+                sink.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+        if size == 0: raise ValueError("Arquivo PDB recebido está vazio.") # Checa se o download não falhou silenciosamente.
+        for sink in sinks:
+            sink.commit()
+    except BaseException:
+        for sink in sinks:
+            sink.discard()
+        raise
+    return digest.hexdigest()
+
+def http_download(url, open_sinks, retries=FETCH_RETRIES, headers=None):
+    """
+    Baixa `url` em pedaços, repassando o corpo aos destinos criados por `open_sinks()` (chamada a
+    cada tentativa, para que uma nova tentativa recomece do zero). Segue redirecionamentos e repete
+    falhas de rede e respostas 429/5xx. Levanta urllib.error.HTTPError para as demais respostas de
+    erro. `headers` permite requisições condicionais. Retorna (status, cabeçalhos, SHA-256 do
+    corpo); com status 304 nada é gravado e o SHA-256 é None. Erros ao criar ou gravar os destinos
+    (diretório inexistente, sem permissão, disco cheio) não são repetidos.
+    """
+    attempt = 0
     
-    # Reescreve o arquivo com conteúdo filtrado
-    with open(pdb_filepath, 'w') as f:
-        f.writelines(filtered_lines)
+    def backoff():
+        _http_connection(*urllib.parse.urlsplit(url)[:2], fresh=True)
+        time.sleep(FETCH_BACKOFF * 2**attempt)
     
-    return atoms_kept, atoms_removed
+    while True:
+        fresh = attempt > 0
+        try:
+            target = url
+            for _ in range(5): # Redirecionamentos
+                parts = urllib.parse.urlsplit(target)
+                conn = _http_connection(parts.scheme, parts.netloc, fresh)
+                path = parts.path + (f"?{parts.query}" if parts.query else "")
+                conn.request("GET", path, headers=dict(headers or {}, **{"Accept-Encoding": "identity"}))
+                response = conn.getresponse()
+                if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                    response.read()
+                    target = urllib.parse.urljoin(target, response.getheader("Location"))
+                    continue
+                break
+            if response.status == 429 or response.status >= 500:
+                response.read()
+                raise ConnectionError(f"HTTP {response.status}")
+            if response.status == 304:
+                response.read()
+                return response.status, response.headers, None
+            if response.status != 200:
+                response.read()
+                raise urllib.error.HTTPError(target, response.status, response.reason, response.headers, None)
+        except (OSError, http.client.HTTPException) as e:
+            if isinstance(e, urllib.error.HTTPError) or attempt >= retries:
+                raise
+            backoff()
+            attempt += 1
+            continue
+        # Só as falhas de leitura do corpo são repetidas; as dos destinos locais sobem direto.
+        try:
+            sha256 = _feed_sinks(_read_body(response), open_sinks())
+            return response.status, response.headers, sha256
+        except _BodyReadError as e:
+            if attempt >= retries:
+                raise e.__cause__
+            backoff()
+            attempt += 1
+
+# Espelho local das entradas baixadas. Os arquivos originais (sem filtros) ficam em
+# objects/<sha256[:2]>/<sha256>, e o índice index.sqlite associa cada entrada ("1ABC.pdb") ao caminho,
+# ao checksum, à data do download e aos validadores HTTP (ETag/Last-Modified) usados na revalidação.
+# Cada entrada é gravada com um UPSERT, sem reescrever o índice, e o SQLite faz o bloqueio entre
+# processos: vários fetchpdb podem usar o mesmo espelho ao mesmo tempo.
+PDB_MIRROR_DIR = os.environ.get("BIOHUB_PDB_MIRROR", os.path.join(os.path.expanduser("~"), ".cache", "biohub", "pdb"))
+PDB_MIRROR_VERSION = 2
+PDB_MIRROR_FIELDS = ("path", "sha256", "size", "fetched", "url", "etag", "last_modified")
+
+class PDBMirror:
+    """Espelho local endereçado por conteúdo, com índice SQLite compartilhado entre threads e processos."""
+
+    def __init__(self, directory=PDB_MIRROR_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.sqlite")
+        self.lock = threading.Lock() # Uma conexão para todas as threads de download.
+        self.db = None
+        self.broken = False
+
+    def _connect(self, create=True):
+        """Conexão com o índice, aberta na primeira vez; None se o índice não existe (e `create` é False) ou é inválido."""
+        if self.db is not None or self.broken: return self.db
+        if not create and not os.path.exists(self.index_path): return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(self.index_path, timeout=60, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL") # Leitores não esperam os downloads que estão gravando.
+            if db.execute("PRAGMA user_version").fetchone()[0] != PDB_MIRROR_VERSION:
+                db.execute("DROP TABLE IF EXISTS entries")
+                db.execute(f"PRAGMA user_version = {PDB_MIRROR_VERSION}")
+            db.execute(f"CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, {', '.join(PDB_MIRROR_FIELDS)})")
+        except (OSError, sqlite3.Error) as e:
+            print(f"Aviso: Índice do espelho local '{self.index_path}' inválido ignorado ({e}).", file=sys.stderr)
+            self.broken = True
+            return None
+        self.db = db
+        return db
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def object_path(self, sha256):
+        return os.path.join(self.directory, "objects", sha256[:2], sha256)
+
+    def lookup(self, key):
+        """Entrada do índice para `key`, ou None se não existir ou o arquivo tiver sumido."""
+        with self.lock:
+            db = self._connect(create=False)
+            row = db.execute(f"SELECT {', '.join(PDB_MIRROR_FIELDS)} FROM entries WHERE key = ?", (key,)).fetchone() if db else None
+        entry = dict(zip(PDB_MIRROR_FIELDS, row)) if row else None
+        if entry and os.path.exists(os.path.join(self.directory, entry["path"])):
+            return entry
+        return None
+
+    def _update(self, key, entry):
+        """Grava a entrada no índice, em uma transação que bloqueia só as outras escritas."""
+        with self.lock:
+            db = self._connect()
+            if db is None: return
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                previous = db.execute("SELECT path, sha256 FROM entries WHERE key = ?", (key,)).fetchone()
+                db.execute(f"INSERT OR REPLACE INTO entries (key, {', '.join(PDB_MIRROR_FIELDS)}) "
+                           f"VALUES (?, {', '.join('?' * len(PDB_MIRROR_FIELDS))})", (key,) + tuple(entry[f] for f in PDB_MIRROR_FIELDS))
+                # Remove o conteúdo antigo se nenhuma outra entrada apontar para ele.
+                if previous and previous[1] != entry["sha256"] and \
+                        not db.execute("SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1", (previous[1],)).fetchone():
+                    try:
+                        os.remove(os.path.join(self.directory, previous[0]))
+                    except OSError:
+                        pass
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def validators(self, entry):
+        """Cabeçalhos da requisição condicional para revalidar uma entrada."""
+        headers = {}
+        if entry and entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def incoming_path(self, key):
+        """Onde o original de `key` é gravado durante o download, antes de ir para objects/."""
+        incoming_dir = os.path.join(self.directory, "objects")
+        os.makedirs(incoming_dir, exist_ok=True)
+        return os.path.join(incoming_dir, f"{key}.{os.getpid()}.incoming") # Um por processo que baixa a entrada.
+
+    def revalidated(self, key, entry):
+        """Registra que o servidor confirmou (304) a cópia local; retorna o caminho do original."""
+        self._update(key, dict(entry, fetched=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())))
+        return os.path.join(self.directory, entry["path"])
+
+    def store(self, key, url, incoming, sha256, response_headers):
+        """Move o original recém-baixado para objects/ e o registra no índice."""
+        final_path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        size = os.path.getsize(incoming)
+        os.replace(incoming, final_path) # Conteúdo idêntico gera o mesmo caminho, então substituir é seguro.
+        self._update(key, {"path": os.path.relpath(final_path, self.directory), "sha256": sha256, "size": size,
+                           "fetched": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "url": url,
+                           "etag": response_headers.get("ETag"), "last_modified": response_headers.get("Last-Modified")})
+        return final_path
+
+def read_pdb_id_list(filepath):
+    """Lê IDs de um arquivo (separados por espaço, vírgula ou linha; '#' inicia um comentário)."""
+    ids = []
+    with open_text(filepath) as f:
+        for line in f:
+            ids.extend(line.split('#', 1)[0].replace(',', ' ').split())
+    return ids
+
+def fetch_pdb_entry(pdb_id, file_format, output_file, base_url=PDB_BASE_URL, chains=None, protein_only=False,
+                    retries=FETCH_RETRIES, mirror=None, offline=False):
+    """
+    Baixa uma entrada para `output_file`, filtrando (cadeias, apenas proteína) e coletando o
+    cabeçalho enquanto o corpo chega: uma única escrita, sem reler o arquivo. Com `mirror`, o
+    original é gravado ao mesmo tempo no espelho local; se o servidor confirmar a cópia local
+    (304), ou com `offline`, as variantes filtradas são derivadas do original guardado.
+    Retorna (filtro usado, com contagens e cabeçalho; origem do original).
+    """
+    url = f"{base_url.rstrip('/')}/{pdb_id}.{file_format}"
+    key = f"{pdb_id}.{file_format}"
+    filter_class = CIFFilter if file_format == "cif" else PDBFilter
+    sinks = []
+
+    def open_sinks(tee=True):
+        sinks[:] = [_FilterSink(output_file, filter_class(chains, protein_only))]
+        if tee and mirror is not None: sinks.append(_RawFileSink(mirror.incoming_path(key))) # Cópia do original para o espelho.
+        return sinks
+
+    def from_local(path):
+        with open(path, 'rb') as f:
+            _feed_sinks(iter(lambda: f.read(FETCH_CHUNK_SIZE), b""), open_sinks(tee=False))
+        return sinks[0].pdb_filter
+
+    entry = mirror.lookup(key) if mirror is not None else None
+    if offline:
+        if entry is None:
+            raise FileNotFoundError(f"'{key}' não está no espelho local ({mirror.directory}).")
+        return from_local(os.path.join(mirror.directory, entry["path"])), "offline"
+    status, response_headers, sha256 = http_download(url, open_sinks, retries, mirror.validators(entry) if entry else None)
+    if status == 304:
+        return from_local(mirror.revalidated(key, entry)), "revalidado"
+    if mirror is not None:
+        mirror.store(key, url, sinks[1].path, sha256, response_headers)
+    return sinks[0].pdb_filter, "baixado"
+
+def _print_structure_info(info):
+    """Exibe as informações do cabeçalho de uma estrutura baixada."""
+    if info:
+        print("\n--- Informações da Estrutura ---", file=sys.stderr)
+        if info['title']: print(f"  Título    : {info['title']}", file=sys.stderr)
+        if info['dep_date']: print(f"  Data      : {info['dep_date']}", file=sys.stderr)
+        if info['classification']: print(f"  Classe    : {info['classification']}", file=sys.stderr)
+        if info['organism']: print(f"  Organismo : {info['organism']}", file=sys.stderr)
 
 def handle_fetch_pdb(args):
-    """Baixa um arquivo PDB do banco de dados RCSB PDB."""
-    pdb_id = args.pdb_id.upper()
+    """Baixa um ou mais arquivos PDB (ou mmCIF, com --format cif) do banco de dados RCSB PDB."""
+    pdb_ids = list(args.pdb_id)
+    if args.list:
+        try:
+            pdb_ids.extend(read_pdb_id_list(args.list))
+        except OSError as e:
+            print(f"Erro: Não foi possível ler a lista de IDs '{args.list}': {e}", file=sys.stderr)
+            return
+    pdb_ids = list(dict.fromkeys(pdb_id.upper() for pdb_id in pdb_ids)) # Remove repetidos mantendo a ordem.
+    if not pdb_ids:
+        print("Erro: Informe ao menos um PDB_ID ou uma lista com --list.", file=sys.stderr)
+        return
     # Validação simples do ID do PDB.
-    if len(pdb_id) != 4:
+    invalid = [pdb_id for pdb_id in pdb_ids if len(pdb_id) != 4]
+    for pdb_id in invalid:
         print(f"Erro: O ID do PDB '{pdb_id}' é inválido. Deve conter 4 caracteres.", file=sys.stderr)
+    pdb_ids = [pdb_id for pdb_id in pdb_ids if len(pdb_id) == 4]
+    if not pdb_ids: return
+    if args.output and len(pdb_ids) > 1:
+        print("Erro: -o só pode ser usado com um único PDB_ID; use --outdir para vários.", file=sys.stderr)
+        return
+    if args.output and not os.path.isdir(os.path.dirname(args.output) or "."):
+        print(f"Erro: O diretório de '{args.output}' não existe.", file=sys.stderr)
+        return
+    file_format = args.format if hasattr(args, 'format') and args.format else "pdb"
+    if args.offline and args.no_mirror:
+        print("Erro: --offline usa o espelho local e não pode ser combinado com --no-mirror.", file=sys.stderr)
         return
-    url = f"https://files.rcsb.org/download/{pdb_id}.pdb"
-    output_file = args.output if args.output else f"{pdb_id}.pdb"
+    mirror = None if args.no_mirror else PDBMirror(args.mirror)
+    
+    # Aplica filtros se especificados
+    chains_list = None
+    if args.chains:
+        # No PDB as cadeias têm um caractere maiúsculo; no mmCIF são sensíveis a maiúsculas e podem ter
+        # vários caracteres (ex: "Aa", "b" em ribossomos), então são comparadas como foram digitadas.
+        chains_list = [c.strip() if file_format == "cif" else c.strip().upper() for c in args.chains.split(',')]
+    filtering = bool(chains_list or args.protein_only)
+    single = len(pdb_ids) == 1
+    if args.offline:
+        print(f"Lendo {len(pdb_ids)} entrada(s) do espelho local '{mirror.directory}' (--offline)...", file=sys.stderr)
+    elif single:
+        print(f"Baixando {pdb_ids[0]} de {args.base_url.rstrip('/')}/{pdb_ids[0]}.{file_format}...", file=sys.stderr)
+    else:
+        print(f"Baixando {len(pdb_ids)} entradas de {args.base_url} com {args.jobs} conexões...", file=sys.stderr)
+    
+    if filtering:
+        print("\n--- Aplicando Filtros ---", file=sys.stderr)
+        if chains_list:
+            print(f"  Cadeias selecionadas: {', '.join(chains_list)}", file=sys.stderr)
+        if args.protein_only:
+            print(f"  Modo: Apenas proteína (removendo água e ligantes)", file=sys.stderr)
+    if args.outdir: os.makedirs(args.outdir, exist_ok=True)
+    print_lock = threading.Lock() # Evita que as mensagens dos downloads simultâneos se misturem.
+
+    def fetch_one(pdb_id):
+        output_file = args.output if args.output else os.path.join(args.outdir or "", f"{pdb_id}.{file_format}")
+        try:
+            pdb_filter, origin = fetch_pdb_entry(pdb_id, file_format, output_file, args.base_url, chains_list,
+                                                 args.protein_only, args.retries, mirror, args.offline)
+        except urllib.error.HTTPError as e:
+            with print_lock:
+                print(f"Erro ao baixar o arquivo: Não foi possível encontrar o PDB ID '{pdb_id}'. (HTTP {e.code})", file=sys.stderr)
+            return False
+        except FileNotFoundError as e:
+            with print_lock:
+                print(f"Erro: {e}", file=sys.stderr)
+            return False
+        except Exception as e:
+            with print_lock:
+                print(f"Ocorreu um erro inesperado ao baixar '{pdb_id}': {e}", file=sys.stderr)
+            return False
+        if single:
+            print(f"Arquivo PDB salvo com sucesso em '{output_file}'", file=sys.stderr)
+            if origin != "baixado":
+                print(f"  ✓ Original lido do espelho local ({origin})", file=sys.stderr)
+            if filtering:
+                print(f"  ✓ Filtragem concluída: {pdb_filter.atoms_kept} átomos mantidos, {pdb_filter.atoms_removed} removidos", file=sys.stderr)
+            # Após o download, exibo algumas informações úteis do cabeçalho.
+            _print_structure_info(pdb_filter.header_info())
+        else:
+            with print_lock:
+                print(f"  ✓ {pdb_id} -> {output_file} ({pdb_filter.atoms_kept} átomos, {origin})", file=sys.stderr)
+        return True
+
     try:
-        print(f"Baixando {pdb_id} de {url}...", file=sys.stderr)
-        # Faço o download e salvo o arquivo.
-        with urllib.request.urlopen(url) as response, open(output_file, 'wb') as out_file:
-            data = response.read()
-            if not data: raise ValueError("Arquivo PDB recebido está vazio.") # Checa se o download não falhou silenciosamente.
-            out_file.write(data)
-        print(f"Arquivo PDB salvo com sucesso em '{output_file}'", file=sys.stderr)
-        
-        # Aplica filtros se especificados
-        chains_list = None
-        if args.chains:
-            chains_list = [c.strip().upper() for c in args.chains.split(',')]
-        
-        if chains_list or args.protein_only:
-            print("\n--- Aplicando Filtros ---", file=sys.stderr)
-            if chains_list:
-                print(f"  Cadeias selecionadas: {', '.join(chains_list)}", file=sys.stderr)
-            if args.protein_only:
-                print(f"  Modo: Apenas proteína (removendo água e ligantes)", file=sys.stderr)
-            
-            atoms_kept, atoms_removed = filter_pdb_content(output_file, chains_list, args.protein_only)
-            print(f"  ✓ Filtragem concluída: {atoms_kept} átomos mantidos, {atoms_removed} removidos", file=sys.stderr)
-        
-        # Após o download, exibo algumas informações úteis do cabeçalho.
-        info = extract_pdb_header_info(output_file)
-        if info:
-            print("\n--- Informações da Estrutura ---", file=sys.stderr)
-            if info['title']: print(f"  Título    : {info['title']}", file=sys.stderr)
-            if info['dep_date']: print(f"  Data      : {info['dep_date']}", file=sys.stderr)
-            if info['classification']: print(f"  Classe    : {info['classification']}", file=sys.stderr)
-            if info['organism']: print(f"  Organismo : {info['organism']}", file=sys.stderr)
-
-    except urllib.error.HTTPError as e:
-        print(f"Erro ao baixar o arquivo: Não foi possível encontrar o PDB ID '{pdb_id}'. (HTTP {e.code})", file=sys.stderr)
-        if os.path.exists(output_file): os.remove(output_file) # Limpa o arquivo vazio se o download falhar.
-    except Exception as e:
-        print(f"Ocorreu um erro inesperado: {e}", file=sys.stderr)
-        if os.path.exists(output_file): os.remove(output_file)
+        if single:
+            fetch_one(pdb_ids[0])
+            return
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            results = list(pool.map(fetch_one, pdb_ids))
+    finally:
+        if mirror is not None: mirror.close()
+    print(f"{sum(results)} entradas obtidas, {len(results) - sum(results) + len(invalid)} com erro.", file=sys.stderr)
 
 def handle_pdb_to_fasta(args):
     """Converte um arquivo PDB para o formato FASTA."""
-    sequence = get_sequence_from_pdb(args.pdb_file)
+    sequence = get_sequence_from_pdb(args.pdb_file, use_cache=not args.no_cache)
     if sequence:
         # Monto o cabeçalho FASTA com o nome do arquivo de origem.
-        header = f">sequence_from_{os.path.basename(args.pdb_file)}"
+        header = f">sequence_from_{os.path.basename(strip_compression_suffix(args.pdb_file))}"
         fasta_output = f"{header}\n{sequence}\n"
         # Se o usuário especificou um arquivo de saída, salvo nele. Senão, imprimo na tela.
         if args.output:
-            with open(args.output, 'w') as f: f.write(fasta_output)
+            with open_text(args.output, 'w') as f: f.write(fasta_output)
             print(f"Sequência FASTA salva em '{args.output}'", file=sys.stderr)
         else:
             print(fasta_output)
 
+CSV2FASTA_PROGRESS_EVERY = 100000 # Registros entre as atualizações de --progress.
+
+def write_fasta_records(outfile, records, wrap=0, progress=False):
+    """
+    Grava os registros (ID, sequência) em FASTA à medida que são lidos, sem montar a saída na
+    memória. Com `wrap`, a sequência é quebrada em linhas de `wrap` caracteres. Retorna quantos
+    registros foram gravados. Os registros são separados por quebra de linha, sem uma no final.
+    """
+    count = 0
+    for record_id, sequence in records:
+        if count: outfile.write("\n")
+        outfile.write(f">{record_id}\n")
+        if wrap > 0 and len(sequence) > wrap:
+            outfile.write("\n".join(sequence[i:i + wrap] for i in range(0, len(sequence), wrap)))
+        else:
+            outfile.write(sequence)
+        count += 1
+        if progress and count % CSV2FASTA_PROGRESS_EVERY == 0:
+            print(f"\r  {count} registros convertidos...", end="", file=sys.stderr, flush=True)
+    if progress and count >= CSV2FASTA_PROGRESS_EVERY: print(file=sys.stderr)
+    return count
+
 def handle_csv_to_fasta(args):
-    """Converte um arquivo CSV com IDs e sequências para o formato FASTA."""
+    """Converte um arquivo CSV com IDs e sequências para o formato FASTA, em fluxo (registro a registro)."""
     try:
-        with open(args.csv_file, mode='r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile, delimiter=args.delimiter)
-            id_col_idx, seq_col_idx = -1, -1
-            # Se o arquivo tem cabeçalho, procuro as colunas pelo nome ou índice.
-            if args.header:
-                header_row = next(reader)
-                try: # Tenta converter para inteiro (índice)
-                    id_col_idx, seq_col_idx = int(args.id_col), int(args.seq_col)
-                except ValueError: # Se não for inteiro, é um nome de coluna.
-                    if args.id_col in header_row: id_col_idx = header_row.index(args.id_col)
-                    if args.seq_col in header_row: seq_col_idx = header_row.index(args.seq_col)
-                if id_col_idx == -1 or seq_col_idx == -1:
-                    print(f"Erro: Coluna de ID ('{args.id_col}') ou Sequência ('{args.seq_col}') não encontrada.", file=sys.stderr)
-                    return
-            else: # Se não tem cabeçalho, as colunas devem ser fornecidas como índices numéricos.
-                try:
-                    id_col_idx, seq_col_idx = int(args.id_col), int(args.seq_col)
-                except ValueError:
-                    print("Erro: Sem cabeçalho, as colunas devem ser índices numéricos.", file=sys.stderr)
-                    return
-            
-            # Gero as strings FASTA para cada linha do CSV.
-            fasta_records = [f">{row[id_col_idx].strip()}\n{row[seq_col_idx].strip().replace(' ', '')}" for row in reader if row and len(row) > max(id_col_idx, seq_col_idx)]
-            output_content = "\n".join(fasta_records)
+        with open_text(args.csv_file, mode='r', newline='', encoding='utf-8') as infile:
+            records = iter_csv_sequences(infile, args.id_col, args.seq_col, args.header, csv_delimiter(args.csv_file, args.delimiter))
+            # Leio o primeiro registro antes de abrir a saída, para que um erro de coluna não deixe um arquivo vazio.
+            first = next(records, None)
+            records = itertools.chain([first], records) if first is not None else iter(())
             
             # Salvo em arquivo ou imprimo na tela.
             if args.output:
-                with open(args.output, 'w') as outfile: outfile.write(output_content)
-                print(f"Arquivo FASTA salvo em '{args.output}'", file=sys.stderr)
+                with open_text(args.output, 'w') as outfile:
+                    count = write_fasta_records(outfile, records, args.wrap, args.progress)
+                print(f"Arquivo FASTA salvo em '{args.output}' ({count} registros)", file=sys.stderr)
             else:
-                print(output_content)
+                write_fasta_records(sys.stdout, records, args.wrap, args.progress)
+                print()
     except FileNotFoundError:
         print(f"Erro: Arquivo CSV não encontrado em '{args.csv_file}'", file=sys.stderr)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
     except Exception as e:
         print(f"Ocorreu um erro: {e}", file=sys.stderr)
 
-def calculate_physicochemical_properties(args):
-    """Calcula várias propriedades físico-químicas de uma sequência de proteína."""
-    sequence = args.sequence.upper()
-    if not sequence:
-        print("Erro: Sequência de entrada está vazia.", file=sys.stderr)
+# Modo em lote do physchem (--input): as sequências são lidas em fluxo, agrupadas em pedaços e
+# distribuídas entre processos; no máximo 2 pedaços por processo ficam em andamento ao mesmo
+# tempo, então a memória não cresce com o tamanho da entrada.
+STANDARD_AMINO_ACIDS = frozenset(MOLECULAR_WEIGHT)
+PHYSCHEM_CHUNK_SIZE = 256 # Sequências por tarefa do pool.
+PHYSCHEM_COLUMNS = ["ID", "Comprimento", "Peso_Molecular_Da", "pI", "GRAVY", "Indice_Alifatico",
+                    "Indice_Instabilidade", "Estabilidade", "Meia_Vida", "Acidos", "Basicos", "Polares", "Apolares"]
+
+def iter_fasta(infile):
+    """Gera (ID, sequência) de cada registro de um arquivo FASTA aberto, sem carregar o arquivo inteiro."""
+    record_id, parts = None, []
+    for line in infile:
+        line = line.strip()
+        if line.startswith('>'):
+            if record_id is not None: yield record_id, "".join(parts)
+            record_id, parts = line[1:].strip(), []
+        elif line and record_id is not None:
+            parts.append(line.replace(' ', ''))
+    if record_id is not None: yield record_id, "".join(parts)
+
+def csv_delimiter(path, delimiter=None):
+    """Delimitador do CSV: o de --delimiter ou, se omitido, tabulação para .tsv e vírgula para os demais."""
+    if delimiter: return delimiter
+    ext = os.path.splitext(strip_compression_suffix(path))[1].lower()
+    return '\t' if ext == '.tsv' else ','
+
+def iter_csv_sequences(infile, id_col="0", seq_col="1", header=False, delimiter=",", on_short_row=None):
+    """
+    Gera (ID, sequência) de cada linha de um CSV aberto. As colunas são nomes (com cabeçalho)
+    ou índices baseados em 0. Levanta ValueError se as colunas não forem encontradas.
+    Linhas com menos colunas que o esperado são ignoradas com um aviso (e `on_short_row()`, se passado).
+    """
+    reader = csv.reader(infile, delimiter=delimiter)
+    id_col_idx, seq_col_idx = -1, -1
+    # Se o arquivo tem cabeçalho, procuro as colunas pelo nome ou índice.
+    if header:
+        header_row = next(reader, [])
+        try: # Tenta converter para inteiro (índice)
+            id_col_idx, seq_col_idx = int(id_col), int(seq_col)
+        except ValueError: # Se não for inteiro, é um nome de coluna.
+            if id_col in header_row: id_col_idx = header_row.index(id_col)
+            if seq_col in header_row: seq_col_idx = header_row.index(seq_col)
+        if id_col_idx == -1 or seq_col_idx == -1:
+            raise ValueError(f"Coluna de ID ('{id_col}') ou Sequência ('{seq_col}') não encontrada.")
+    else: # Se não tem cabeçalho, as colunas devem ser fornecidas como índices numéricos.
+        try:
+            id_col_idx, seq_col_idx = int(id_col), int(seq_col)
+        except ValueError:
+            raise ValueError("Sem cabeçalho, as colunas devem ser índices numéricos.")
+    min_columns = max(id_col_idx, seq_col_idx) + 1
+    for row in reader:
+        if not row: continue
+        if len(row) < min_columns:
+            # Uma única coluna em todas as linhas costuma ser delimitador errado (ex: TSV lido com ',').
+            hint = f" (verifique --delimiter, atual: {delimiter!r})" if len(row) == 1 else ""
+            print(f"Aviso: Linha {reader.line_num} ignorada: tem {len(row)} coluna(s), esperava {min_columns}{hint}.", file=sys.stderr)
+            if on_short_row is not None: on_short_row()
+            continue
+        yield row[id_col_idx].strip(), row[seq_col_idx].strip().replace(' ', '')
+
+def _physchem_row(record_id, properties):
+    """Linha de saída do modo em lote a partir da tupla de propriedades de physchem_properties."""
+    (length, mw, pi, gravy, aliphatic_index, instability_index, stability, half_life,
+     acidic, basic, polar, non_polar) = properties
+    return [record_id, length, f"{mw:.2f}", f"{pi:.2f}", f"{gravy:.3f}", f"{aliphatic_index:.2f}",
+            f"{instability_index:.2f}", stability, half_life, acidic, basic, polar, non_polar]
+
+# Núcleos vetorizados do physchem (--engine numpy). As sequências de um pedaço são codificadas
+# em um único array uint8 (um código de 0 a 19 por resíduo) e cada propriedade vira uma
+# consulta a tabelas (gather) e somas por sequência (bincount), para todas as sequências de uma vez.
+# As somas seguem a mesma ordem do cálculo em Python, então os resultados são idênticos.
+_PHYSCHEM_AA = tuple(MOLECULAR_WEIGHT) # Ordem dos códigos 0..19.
+_PHYSCHEM_TABLES = {}
+
+def _physchem_tables():
+    """Tabelas de consulta do núcleo NumPy, montadas uma vez por processo."""
+    if not _PHYSCHEM_TABLES:
+        code_of_byte = np.full(256, 255, dtype=np.uint8)
+        for code, aa in enumerate(_PHYSCHEM_AA): code_of_byte[ord(aa)] = code
+        _PHYSCHEM_TABLES.update(
+            code_of_byte=code_of_byte,
+            mw=np.array([MOLECULAR_WEIGHT[aa] for aa in _PHYSCHEM_AA]),
+            kd=np.array([KYTE_DOOLITTLE.get(aa, 0) for aa in _PHYSCHEM_AA]),
+            diwv=np.array([DIWV[a][b] for a in _PHYSCHEM_AA for b in _PHYSCHEM_AA]), # Índice 20 * a + b.
+        )
+    return _PHYSCHEM_TABLES
+
+def _isoelectric_point_numpy(counts, pka, tolerance=1e-4):
+    """Mesma bisseção de isoelectric_point, feita para todas as sequências (linhas de `counts`) ao mesmo tempo."""
+    column = {aa: code for code, aa in enumerate(_PHYSCHEM_AA)}
+    positive = [(1, 10**pka['N-term'])] + [(counts[:, column[aa]], 10**pka[aa]) for aa in ('R', 'H', 'K')]
+    negative = [(1, 10**pka['C-term'])] + [(counts[:, column[aa]], 10**pka[aa]) for aa in ('D', 'E', 'C', 'Y')]
+
+    def net_charge(ph):
+        h = 10**ph
+        charge = 0
+        for n, k in positive: charge = charge + n * k / (k + h)
+        negative_charge = 0
+        for n, k in negative: negative_charge = negative_charge + n * h / (k + h)
+        return charge - negative_charge
+
+    n = len(counts)
+    low, high = np.zeros(n), np.full(n, 14.0)
+    while high[0] - low[0] > tolerance:
+        mid = (low + high) / 2
+        above = net_charge(mid) > 0
+        low = np.where(above, mid, low)
+        high = np.where(above, high, mid)
+    pi = (low + high) / 2
+    pi = np.where(net_charge(np.full(n, 14.0)) >= 0, 14.0, pi)
+    return np.where(net_charge(np.zeros(n)) <= 0, 0.0, pi)
+
+def physchem_properties_numpy(sequences, pka=PKA_VALUES):
+    """
+    Versão vetorizada de physchem_properties para uma lista de sequências válidas (20 aminoácidos
+    padrão, em maiúsculas, não vazias). Retorna uma tupla de propriedades por sequência.
+    """
+    tables = _physchem_tables()
+    n = len(sequences)
+    lengths = np.array([len(seq) for seq in sequences])
+    codes = tables["code_of_byte"][np.frombuffer("".join(sequences).encode('ascii'), dtype=np.uint8)].astype(np.intp)
+    seq_ids = np.repeat(np.arange(n), lengths)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    counts = np.bincount(seq_ids * 20 + codes, minlength=n * 20).reshape(n, 20)
+    column = {aa: code for code, aa in enumerate(_PHYSCHEM_AA)}
+    mw = 0
+    for code in range(20): mw = mw + tables["mw"][code] * counts[:, code]
+    mw = mw - (lengths - 1) * 18.015
+    gravy = np.bincount(seq_ids, weights=tables["kd"][codes], minlength=n) / lengths
+    aliphatic = (counts[:, column['A']] + 2.9 * counts[:, column['V']]
+                 + 3.9 * (counts[:, column['I']] + counts[:, column['L']])) / lengths * 100
+    # Dipeptídeos: pares de resíduos vizinhos que pertencem à mesma sequência.
+    same_seq = seq_ids[:-1] == seq_ids[1:]
+    pairs = (codes[:-1] * 20 + codes[1:])[same_seq]
+    diwv_sum = np.bincount(seq_ids[:-1][same_seq], weights=tables["diwv"][pairs], minlength=n)
+    instability = np.where(lengths > 1, (10 / lengths) * diwv_sum, 0)
+    pi = _isoelectric_point_numpy(counts, pka)
+
+    def group(aas): return counts[:, [column[aa] for aa in aas]].sum(axis=1)
+    acidic, basic = group('DE'), group('RKH')
+    polar, non_polar = group('NQSTYC'), group('AVLIPFWMG')
+
+    first = [sequences[k][0] for k in range(n)]
+    results = []
+    for k in range(n):
+        half_life = ">10 horas" if first[k] in 'ACGMPSTV' else "2-30 min" if first[k] in 'ILFWYDENQ' else "Desconhecido"
+        results.append((int(lengths[k]), float(mw[k]), float(pi[k]), float(gravy[k]), float(aliphatic[k]),
+                        float(instability[k]), "Estável" if instability[k] < 40 else "Instável", half_life,
+                        int(acidic[k]), int(basic[k]), int(polar[k]), int(non_polar[k])))
+    return results
+
+PHYSCHEM_ENGINES = ("python", "numpy")
+
+def resolve_physchem_engine(engine):
+    """Resolve 'auto' para o núcleo NumPy quando disponível e recua para 'python' se faltar o NumPy."""
+    if engine == "auto":
+        return "numpy" if HAS_NUMPY else "python"
+    if engine == "numpy" and not HAS_NUMPY:
+        print("Aviso: NumPy não disponível, usando o motor 'python'. Instale com: pip install numpy", file=sys.stderr)
+        return "python"
+    return engine
+
+def _physchem_chunk(records, pka_set, engine="python"):
+    """
+    Tarefa do pool: calcula as linhas de um pedaço de registros (ID, sequência), na mesma ordem.
+    Sequências vazias ou com resíduos fora dos 20 padrão recebem None.
+    """
+    pka = PKA_SETS[pka_set]
+    sequences = [sequence.upper() for _, sequence in records]
+    valid = [k for k, seq in enumerate(sequences) if seq and STANDARD_AMINO_ACIDS.issuperset(seq)]
+    if engine == "numpy" and valid:
+        properties = physchem_properties_numpy([sequences[k] for k in valid], pka)
+    else:
+        properties = [physchem_properties(sequences[k], pka)[1] for k in valid]
+    rows = [(record_id, None) for record_id, _ in records]
+    for k, props in zip(valid, properties):
+        rows[k] = (records[k][0], _physchem_row(records[k][0], props))
+    return rows
+
+# Memória de sequências repetidas (clones, construções repetidas): as propriedades são
+# identificadas pelo SHA-256 da sequência e do conjunto de pKa, calculadas uma vez e repetidas
+# para cada ID. Fica em um cache LRU limitado e, opcionalmente, em um banco SQLite persistente.
+PHYSCHEM_MEMO_VERSION = 1 # Incrementar sempre que o cálculo ou o formato das linhas mudar.
+PHYSCHEM_MEMO_SIZE = 100000 # Entradas no cache LRU (--memo-size).
+
+class SequenceMemo:
+    """Cache LRU (com armazenamento SQLite opcional) das linhas de propriedades por sequência."""
+    def __init__(self, max_entries=PHYSCHEM_MEMO_SIZE, db_path=None, namespace=""):
+        self.max_entries = max_entries
+        self.namespace = f"v{PHYSCHEM_MEMO_VERSION}\0{namespace}\0".encode('utf-8')
+        self.entries = OrderedDict()
+        self.lookups = self.hits = self.db_hits = 0
+        self.db = None
+        self.persistent = bool(db_path)
+        if db_path:
+            self.db = sqlite3.connect(db_path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS memo (key BLOB PRIMARY KEY, row TEXT)")
+
+    def key(self, sequence):
+        return hashlib.sha256(self.namespace + sequence.encode('utf-8')).digest()
+
+    def get(self, key):
+        """Devolve (True, linha sem o ID) se a sequência já foi calculada, ou (False, None)."""
+        self.lookups += 1
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+        if self.db is not None:
+            found = self.db.execute("SELECT row FROM memo WHERE key = ?", (key,)).fetchone()
+            if found:
+                self.db_hits += 1
+                value = json.loads(found[0])
+                self._remember(key, value)
+                return True, value
+        return False, None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO memo (key, row) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0: return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def report(self):
+        """Resumo das consultas para dimensionar o cache (--memo-size)."""
+        total_hits = self.hits + self.db_hits
+        rate = 100 * total_hits / self.lookups if self.lookups else 0.0
+        message = f"Memória de sequências: {self.lookups} consultas, {total_hits} acertos ({rate:.1f}%)"
+        if self.persistent: message += f", {self.db_hits} do banco persistente"
+        print(f"{message}; {len(self.entries)} de {self.max_entries} entradas no cache.", file=sys.stderr)
+
+class _PhyschemTask:
+    """
+    Um pedaço de registros em andamento: linhas já conhecidas pela memória e as sequências a calcular.
+    `in_flight` (chave -> pedaço que a calcula) é compartilhado entre os pedaços em andamento: uma
+    sequência que outro pedaço ainda está calculando não é calculada de novo, e conta como acerto.
+    """
+    def __init__(self, chunk, memo, in_flight=None):
+        self.chunk = chunk
+        self.known = {}     # Posição no pedaço -> linha sem o ID (ou None), vinda da memória.
+        self.keys = []      # Chave de cada posição (None sem memória).
+        self.misses = []    # (chave, sequência) únicas que precisam ser calculadas.
+        self.owners = {}    # Posição -> pedaço que calcula a sequência (este ou um anterior).
+        self.result = None  # Resultado (lista) ou Future do cálculo das faltantes.
+        self.computed = None # Chave -> linha sem o ID das sequências calculadas, preenchido em rows().
+        self.in_flight = {} if in_flight is None else in_flight
+        for position, (record_id, sequence) in enumerate(chunk):
+            if memo is None:
+                self.keys.append(position)
+                self.misses.append((position, sequence))
+                continue
+            key = memo.key(sequence.upper())
+            self.keys.append(key)
+            found, value = memo.get(key)
+            if found:
+                self.known[position] = value
+            elif key in self.in_flight:
+                memo.hits += 1 # Já está sendo calculada (neste pedaço ou em um anterior): calculada uma vez só.
+                self.owners[position] = self.in_flight[key]
+            else:
+                self.in_flight[key] = self
+                self.owners[position] = self
+                self.misses.append((key, sequence))
+
+    def rows(self, memo):
+        """Junta as linhas calculadas e as da memória, na ordem do pedaço, repetindo-as para cada ID."""
+        result = self.result if isinstance(self.result, list) else self.result.result()
+        self.computed = {key: (row[1:] if row is not None else None) for key, row in result}
+        for key, value in self.computed.items():
+            if memo is not None: memo.put(key, value)
+            if self.in_flight.get(key) is self: del self.in_flight[key]
+        # Os pedaços saem na ordem em que foram criados, então um pedaço anterior já tem `computed`.
+        for position, (record_id, _) in enumerate(self.chunk):
+            if position in self.known: value = self.known[position]
+            elif memo is None: value = self.computed[self.keys[position]]
+            else: value = self.owners[position].computed[self.keys[position]]
+            yield record_id, ([record_id] + value if value is not None else None)
+
+def physchem_rows(records, pka_set="biohub", jobs=1, chunk_size=PHYSCHEM_CHUNK_SIZE, engine="python", memo=None):
+    """
+    Gera (ID, linha ou None) para cada registro, na ordem da entrada. Com jobs > 1, os pedaços são
+    calculados por um ProcessPoolExecutor com no máximo 2 * jobs pedaços em andamento. Com `memo`
+    (SequenceMemo), cada sequência distinta é calculada uma vez e a linha é repetida para cada ID.
+    """
+    records = iter(records)
+    chunks = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        pending = deque()
+        in_flight = {} # Sequências sendo calculadas pelos pedaços em andamento.
+        for chunk in chunks:
+            task = _PhyschemTask(chunk, memo, in_flight)
+            if pool is None:
+                task.result = _physchem_chunk(task.misses, pka_set, engine)
+            else:
+                task.result = pool.submit(_physchem_chunk, task.misses, pka_set, engine)
+            pending.append(task)
+            if len(pending) >= (2 * jobs if pool is not None else 1):
+                yield from pending.popleft().rows(memo)
+        while pending:
+            yield from pending.popleft().rows(memo)
+    finally:
+        if pool is not None: pool.shutdown()
+
+def open_sequence_records(args, on_short_row=None):
+    """
+    Abre o arquivo de --input e devolve (arquivo, gerador de (ID, sequência)), em FASTA ou CSV.
+    `on_short_row` é chamado para cada linha do CSV ignorada por falta de colunas.
+    """
+    input_format = args.input_format
+    if input_format == "auto":
+        ext = os.path.splitext(strip_compression_suffix(args.input))[1].lower()
+        input_format = "csv" if ext in ('.csv', '.tsv') else "fasta"
+    infile = open_text(args.input, newline='', encoding='utf-8')
+    if input_format == "csv":
+        return infile, iter_csv_sequences(infile, args.id_col, args.seq_col, args.header,
+                                          csv_delimiter(args.input, args.delimiter), on_short_row)
+    return infile, iter_fasta(infile)
+
+def physchem_batch(args):
+    """Calcula as propriedades de todas as sequências de um arquivo FASTA ou CSV, uma linha de CSV por sequência."""
+    counts = {"ok": 0, "skipped": 0}
+    engine = resolve_physchem_engine(args.engine)
+    memo = None
+    if args.memo_size > 0 or args.memo_db:
+        try:
+            memo = SequenceMemo(args.memo_size, args.memo_db, namespace=args.pka_set)
+        except sqlite3.Error as e:
+            print(f"Aviso: Não foi possível abrir a memória persistente '{args.memo_db}': {e}", file=sys.stderr)
+            memo = SequenceMemo(args.memo_size, namespace=args.pka_set)
+
+    def rows(records):
+        for record_id, row in physchem_rows(records, args.pka_set, args.jobs, engine=engine, memo=memo):
+            if row is None:
+                counts["skipped"] += 1
+                print(f"Aviso: Sequência '{record_id}' ignorada (vazia ou com resíduos fora dos 20 aminoácidos padrão).", file=sys.stderr)
+                continue
+            counts["ok"] += 1
+            yield row
+
+    def short_row():
+        counts["skipped"] += 1
+
+    try:
+        infile, records = open_sequence_records(args, short_row)
+        with infile:
+            if args.output:
+                write_csv(args.output, PHYSCHEM_COLUMNS, rows(records))
+            else:
+                writer = csv.writer(sys.stdout)
+                writer.writerow(PHYSCHEM_COLUMNS)
+                writer.writerows(rows(records))
+    except FileNotFoundError:
+        print(f"Erro: Arquivo não encontrado em '{args.input}'", file=sys.stderr)
         return
-    
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return
+    finally:
+        if memo is not None: memo.close()
+    print(f"{counts['ok']} sequências processadas, {counts['skipped']} ignoradas.", file=sys.stderr)
+    if memo is not None: memo.report()
+
+def isoelectric_point(aa_composition, pka=PKA_VALUES, tolerance=1e-4):
+    """
+    Ponto isoelétrico por bisseção: a carga líquida cai monotonamente com o pH, então basta
+    estreitar o intervalo [0, 14] em volta da mudança de sinal até `tolerance` (~17 avaliações,
+    contra 1.401 na varredura com passo de 0.01). As potências 10**pKa são calculadas uma vez.
+    """
+    # (quantidade, 10**pKa) dos grupos positivos (N-terminal, R, H, K) e negativos (C-terminal, D, E, C, Y).
+    positive = [(1, 10**pka['N-term'])] + [(aa_composition.get(aa, 0), 10**pka[aa]) for aa in ('R', 'H', 'K') if aa_composition.get(aa, 0)]
+    negative = [(1, 10**pka['C-term'])] + [(aa_composition.get(aa, 0), 10**pka[aa]) for aa in ('D', 'E', 'C', 'Y') if aa_composition.get(aa, 0)]
+
+    def net_charge(ph):
+        h = 10**ph
+        return sum(n * k / (k + h) for n, k in positive) - sum(n * h / (k + h) for n, k in negative)
+
+    low, high = 0.0, 14.0
+    if net_charge(low) <= 0: return low
+    if net_charge(high) >= 0: return high
+    while high - low > tolerance:
+        mid = (low + high) / 2
+        if net_charge(mid) > 0: low = mid
+        else: high = mid
+    return (low + high) / 2
+
+def physchem_properties(sequence, pka=PKA_VALUES):
+    """
+    Calcula as propriedades físico-químicas de uma sequência (em maiúsculas, não vazia).
+    Retorna a composição de aminoácidos e a tupla (comprimento, peso molecular, pI, GRAVY,
+    índice alifático, índice de instabilidade, estabilidade, meia-vida, ácidos, básicos, polares, apolares).
+    """
     length = len(sequence)
     aa_composition = {aa: sequence.count(aa) for aa in MOLECULAR_WEIGHT.keys()}
     
@@ -384,21 +2060,9 @@ def calculate_physicochemical_properties(args):
     # GRAVY: média dos valores de hidropaticidade de Kyte-Doolittle.
     gravy = sum(KYTE_DOOLITTLE.get(aa, 0) for aa in sequence) / length if length > 0 else 0
     
-    # Ponto Isoelétrico (pI): procuro o pH onde a carga líquida da proteína é mais próxima de zero.
-    pi = 0.0
-    min_charge_diff = float('inf')
-    for ph_int in range(1401): # Itera de pH 0 a 14.00 com passo de 0.01.
-        ph = ph_int * 0.01
-        # Carga dos terminais N e C.
-        net_charge = (10**PKA_VALUES['N-term']) / (10**PKA_VALUES['N-term'] + 10**ph) - (10**ph) / (10**PKA_VALUES['C-term'] + 10**ph)
-        # Carga das cadeias laterais ionizáveis.
-        for aa, count in aa_composition.items():
-            if aa in ['R', 'H', 'K']: net_charge += count * (10**PKA_VALUES[aa]) / (10**PKA_VALUES[aa] + 10**ph)
-            elif aa in ['D', 'E', 'C', 'Y']: net_charge -= count * (10**ph) / (10**PKA_VALUES[aa] + 10**ph)
-        
-        if abs(net_charge) < min_charge_diff:
-            min_charge_diff, pi = abs(net_charge), ph
-            
+    # Ponto Isoelétrico (pI): o pH onde a carga líquida da proteína é zero.
+    pi = isoelectric_point(aa_composition, pka)
+    
     # Índice Alifático: volume relativo ocupado por cadeias laterais alifáticas.
     a, b = 2.9, 3.9
     aliphatic_index = (aa_composition.get('A', 0) + a * aa_composition.get('V', 0) + b * (aa_composition.get('I', 0) + aa_composition.get('L', 0))) / length * 100 if length > 0 else 0
@@ -411,10 +2075,32 @@ def calculate_physicochemical_properties(args):
     n_term = sequence[0]
     half_life_mammal = ">10 horas" if n_term in ['A','C','G','M','P','S','T','V'] else "2-30 min" if n_term in ['I','L','F','W','Y','D','E','N','Q'] else "Desconhecido"
     
-    # Contagem de tipos de resíduos.
-    def count_group(group_aas): return sum(aa_composition.get(aa, 0) for aa in group_aas)
-    acidic, basic = count_group({'D', 'E'}), count_group({'R', 'K', 'H'})
-    polar, non_polar = count_group({'N', 'Q', 'S', 'T', 'Y', 'C'}), count_group({'A', 'V', 'L', 'I', 'P', 'F', 'W', 'M', 'G'})
+    # Contagem de tipos de resíduos.
+    def count_group(group_aas): return sum(aa_composition.get(aa, 0) for aa in group_aas)
+    acidic, basic = count_group({'D', 'E'}), count_group({'R', 'K', 'H'})
+    polar, non_polar = count_group({'N', 'Q', 'S', 'T', 'Y', 'C'}), count_group({'A', 'V', 'L', 'I', 'P', 'F', 'W', 'M', 'G'})
+    
+    return aa_composition, (length, mw, pi, gravy, aliphatic_index, instability_index, stability, half_life_mammal,
+                            acidic, basic, polar, non_polar)
+
+def calculate_physicochemical_properties(args):
+    """Calcula várias propriedades físico-químicas de uma sequência de proteína (ou de um arquivo, com --input)."""
+    if args.input:
+        if args.sequence:
+            print("Erro: Use uma SEQUENCIA ou --input, não os dois.", file=sys.stderr)
+            return
+        return physchem_batch(args)
+    if not args.sequence:
+        print("Erro: Informe uma SEQUENCIA ou um arquivo com --input.", file=sys.stderr)
+        return
+    sequence = args.sequence.upper()
+    if not sequence:
+        print("Erro: Sequência de entrada está vazia.", file=sys.stderr)
+        return
+    
+    aa_composition, properties = physchem_properties(sequence, PKA_SETS[args.pka_set])
+    (length, mw, pi, gravy, aliphatic_index, instability_index, stability, half_life_mammal,
+     acidic, basic, polar, non_polar) = properties
     
     # Formatação da saída.
     results = [
@@ -456,34 +2142,210 @@ def calculate_physicochemical_properties(args):
             print("Aviso: Módulo de visualização não disponível. Instale matplotlib.", file=sys.stderr)
 
 def calculate_intramolecular_contacts(args):
-    """Calcula contatos entre resíduos com base na distância mínima entre quaisquer átomos."""
-    # Dicionário: resíduo -> lista de coordenadas de todos os átomos
-    residue_atoms = {}
+    """
+    Calcula contatos entre resíduos com base na distância mínima entre quaisquer átomos: dentro da
+    primeira cadeia ou, com --interface, entre cadeias (resíduos identificados como 'Cadeia:Número').
+    """
     if not os.path.exists(args.pdb_file):
         print(f"Erro: Arquivo não encontrado em '{args.pdb_file}'", file=sys.stderr)
         return
-    with open(args.pdb_file, 'r') as f:
-        first_chain_id = None
-        for line in f:
-            # Pego todos os átomos (não apenas CA) da primeira cadeia
-            if line.startswith("ATOM"):
-                if first_chain_id is None: first_chain_id = line[21]
-                if line[21] == first_chain_id:
-                    res_num = int(line[22:26])
-                    coords = tuple(float(line[i:i+8]) for i in [30, 38, 46])
-                    if res_num not in residue_atoms:
-                        residue_atoms[res_num] = []
-                    residue_atoms[res_num].append(coords)
+    all_models = args.model == 'all'
+    interface = args.interface is not None
+    thresholds = args.threshold
+    multi = len(thresholds) > 1
+    # Limiar -> contatos (Res1, Res2, Dist), precedidos do modelo com --model all
+    contacts = {threshold: [] for threshold in thresholds}
+    plot_contacts = None # Contatos do primeiro modelo no maior limiar, usados no mapa de contatos
+    for model, structure in select_models(args):
+        # Uma única passagem no maior limiar; os limiares menores são subconjuntos dela.
+        if interface:
+            distances = interface_min_distances(structure, args.interface, max(thresholds), args.jobs)
+        else:
+            distances = residue_min_distances(structure, max(thresholds), args.engine)
+        for threshold in thresholds:
+            model_contacts = contacts_within(distances, threshold)
+            if plot_contacts is None and threshold == max(thresholds): plot_contacts = model_contacts
+            if all_models: contacts[threshold].extend((model,) + c for c in model_contacts)
+            else: contacts[threshold].extend(model_contacts)
+    
+    if args.output:
+        header = ["Residuo_1", "Residuo_2", "Distancia_A"]
+        if multi: header = ["Limiar_A"] + header
+        if all_models: header = ["Modelo"] + header
+        rows = ((c[:1] + (threshold,) + c[1:] if all_models else (threshold,) + c) if multi else c
+                for threshold in thresholds for c in contacts[threshold])
+        write_csv(args.output, header, rows)
+    else:
+        title = "Contatos entre Cadeias" if interface else "Contatos Intramoleculares"
+        for threshold in thresholds:
+            print(f"--- {title} (Limiar = {threshold:.1f} Å) ---")
+            if not contacts[threshold]: print("Nenhum contato encontrado.")
+            elif all_models:
+                for c in contacts[threshold]: print(f"Modelo {c[0]}: Res {c[1]} - Res {c[2]}: {c[3]:.3f} Å")
+            else:
+                for c in contacts[threshold]: print(f"Res {c[0]} - Res {c[1]}: {c[2]:.3f} Å")
+
+    # Gera visualização se solicitado
+    if hasattr(args, 'plot') and args.plot and interface:
+        print("Aviso: --plot não está disponível com --interface; use o CSV (lista de arestas).", file=sys.stderr)
+    elif hasattr(args, 'plot') and args.plot and plot_contacts:
+        if HAS_VIZ:
+            if all_models: print("Aviso: O mapa de contatos mostra apenas o primeiro modelo.", file=sys.stderr)
+            if multi: print(f"Aviso: O mapa de contatos usa o maior limiar ({max(thresholds):.1f} Å).", file=sys.stderr)
+            max_res = max(max(c[0], c[1]) for c in plot_contacts)
+            biohub_viz.plot_contact_map(plot_contacts, max_res, args.plot, max(thresholds))
+        else:
+            print("Aviso: Módulo de visualização não disponível. Instale matplotlib e numpy.", file=sys.stderr)
+
+def threshold_list(value):
+    """Tipo do argparse para -t/--threshold: um limiar ou uma lista separada por vírgulas (ex: 4,6,8,10)."""
+    try:
+        thresholds = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"limiar inválido: '{value}'")
+    if not thresholds:
+        raise argparse.ArgumentTypeError("informe ao menos um limiar")
+    return list(dict.fromkeys(thresholds)) # Remove repetidos mantendo a ordem.
+
+def residue_min_distances(structure, cutoff, engine="grid"):
+    """
+    Menor distância entre átomos de cada par de resíduos da primeira cadeia de uma estrutura
+    (um modelo), para os pares a até `cutoff`: lista (Res1, Res2, Dist) ordenada por resíduo.
+    """
+    # Dicionário: resíduo -> lista de coordenadas de todos os átomos
+    residue_atoms = {}
+    coords = structure.coordinates()
+    # Pego todos os átomos (não apenas CA) da primeira cadeia
+    for i in structure.first_chain_indices():
+        residue_atoms.setdefault(structure.res_nums[i], []).append(coords[i])
+    return CONTACT_ENGINES[engine](residue_atoms, cutoff)
+
+def contacts_within(distances, threshold):
+    """Contatos (Res1, Res2, Dist arredondada) com distância mínima até `threshold`."""
+    return [(r1, r2, round(dist, 3)) for r1, r2, dist in distances if dist <= threshold]
+
+def chain_pairs(value):
+    """Tipo do argparse para --interface: 'all' ou pares de cadeias separados por vírgula (ex: A:B,A:C)."""
+    if value == 'all': return value
+    pairs = []
+    for item in value.split(','):
+        chains = item.strip().split(':')
+        if len(chains) != 2 or not all(chains) or chains[0] == chains[1]:
+            raise argparse.ArgumentTypeError(f"par de cadeias inválido: '{item}' (use, por exemplo, A:B)")
+        pairs.append(tuple(chains))
+    return pairs
+
+def chain_residue_atoms(structure):
+    """Cadeia -> (resíduo -> coordenadas dos átomos ATOM), na ordem em que as cadeias aparecem."""
+    coords = structure.coordinates()
+    chains = {}
+    for i, hetero in enumerate(structure.hetero):
+        if hetero: continue
+        chains.setdefault(structure.chain_id(i), {}).setdefault(structure.res_nums[i], []).append(coords[i])
+    return chains
 
+def _interface_min_distances(residues1, residues2, cutoff):
+    """
+    Menor distância entre cada resíduo da cadeia 1 e cada resíduo da cadeia 2 a até `cutoff`:
+    os átomos da cadeia 2 vão para uma cell list e cada átomo da cadeia 1 só é medido contra as
+    células vizinhas. Devolve (Res1, Res2, Dist) ordenado por resíduo.
+    """
+    coords2, owners2 = [], []
+    for res_num in sorted(residues2):
+        for atom in residues2[res_num]:
+            coords2.append(atom)
+            owners2.append(res_num)
+    if not coords2 or cutoff < 0: return []
+    grid = CellList(coords2, max(cutoff, 1.0))
+    # Margem para o filtro rápido não descartar pares no limite por arredondamento.
+    cutoff_sq = cutoff * cutoff + 1e-6
+    min_dist = {}
+    for r1 in sorted(residues1):
+        for atom1 in residues1[r1]:
+            x1, y1, z1 = atom1
+            for j in grid.candidates(x1, y1, z1, cutoff):
+                x2, y2, z2 = atom2 = coords2[j]
+                dx, dy, dz = x1 - x2, y1 - y2, z1 - z2
+                if dx*dx + dy*dy + dz*dz > cutoff_sq: continue
+                dist = math.sqrt(sum((c1-c2)**2 for c1,c2 in zip(atom1, atom2)))
+                if dist > cutoff: continue
+                key = (r1, owners2[j])
+                if dist < min_dist.get(key, float('inf')):
+                    min_dist[key] = dist
+    return [(r1, r2, dist) for (r1, r2), dist in sorted(min_dist.items())]
+
+# Execução paralela do modo --interface: as coordenadas de todas as cadeias são enviadas uma
+# única vez para cada processo, na inicialização, e as tarefas levam apenas o par de cadeias.
+_CONTACT_WORKER = {}
+
+def _interface_worker_init(chains):
+    _CONTACT_WORKER["chains"] = chains
+
+def _interface_worker_pair(chain1, chain2, cutoff):
+    chains = _CONTACT_WORKER["chains"]
+    return _interface_min_distances(chains[chain1], chains[chain2], cutoff)
+
+def interface_min_distances(structure, pairs, cutoff, jobs=1):
+    """
+    Menor distância entre resíduos de cadeias diferentes, para cada par de cadeias (`pairs`, ou
+    todos os pares se 'all'), como uma lista de arestas ('A:Res1', 'B:Res2', Dist) a até `cutoff`.
+    """
+    chains = chain_residue_atoms(structure)
+    if pairs == 'all':
+        pairs = list(itertools.combinations(chains, 2))
+    else:
+        for pair in pairs:
+            for chain in pair:
+                if chain not in chains:
+                    print(f"Aviso: Cadeia '{chain}' não encontrada; par {pair[0]}:{pair[1]} ignorado.", file=sys.stderr)
+        pairs = [pair for pair in pairs if pair[0] in chains and pair[1] in chains]
+    # Pares de cadeias cujas esferas envolventes estão além do limite não podem ter contatos.
+    spheres = {chain: _bounding_sphere([atom for atoms in chains[chain].values() for atom in atoms]) for chain in chains}
+    pairs = [(c1, c2) for c1, c2 in pairs
+             if math.dist(spheres[c1][0], spheres[c2][0]) - spheres[c1][1] - spheres[c2][1] <= cutoff + 1e-6]
+    if jobs > 1 and len(pairs) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pairs)), initializer=_interface_worker_init,
+                                 initargs=(chains,)) as pool:
+            futures = [pool.submit(_interface_worker_pair, c1, c2, cutoff) for c1, c2 in pairs]
+            results = [future.result() for future in futures]
+    else:
+        results = [_interface_min_distances(chains[c1], chains[c2], cutoff) for c1, c2 in pairs]
+    return [(f"{c1}:{r1}", f"{c2}:{r2}", dist)
+            for (c1, c2), distances in zip(pairs, results) for r1, r2, dist in distances]
+
+# Motores de cálculo de contatos. Ambos recebem resíduo -> coordenadas dos átomos e devolvem
+# a menor distância (sem arredondar) de cada par de resíduos a até `cutoff`, ordenada por
+# resíduo e com a mesma fórmula de distância, para que a saída seja idêntica.
+
+def _bounding_sphere(atoms):
+    """Centroide e raio (maior distância de um átomo ao centroide) de um resíduo."""
+    n = len(atoms)
+    center = (sum(a[0] for a in atoms) / n, sum(a[1] for a in atoms) / n, sum(a[2] for a in atoms) / n)
+    return center, max(math.dist(center, a) for a in atoms)
+
+def _contacts_brute_force(residue_atoms, cutoff):
+    """
+    Motor por pares de resíduos: cada resíduo é envolvido por uma esfera (centroide + raio) e
+    os pares cujas esferas estão a mais de `cutoff` são descartados sem olhar os átomos;
+    nos demais, a distância mínima é procurada entre todos os pares de átomos.
+    """
     residues = sorted(residue_atoms.keys())
+    spheres = {r: _bounding_sphere(residue_atoms[r]) for r in residues}
+    # Margem para a poda não descartar pares no limite por arredondamento.
+    reach = cutoff + 1e-6
 
     # Calcula a distância mínima entre qualquer par de átomos de dois resíduos
-    contacts = []
+    distances = []
     for i, r1 in enumerate(residues):
+        center1, radius1 = spheres[r1]
         for r2 in residues[i+1:]:
             # Ignora vizinhos diretos na sequência
             if abs(r1 - r2) <= 1:
                 continue
+            # Nenhum par de átomos fica mais perto que a distância entre as esferas
+            center2, radius2 = spheres[r2]
+            if math.dist(center1, center2) - radius1 - radius2 > reach:
+                continue
 
             # Calcula distância mínima entre qualquer átomo de r1 e qualquer átomo de r2
             min_dist = float('inf')
@@ -493,77 +2355,485 @@ def calculate_intramolecular_contacts(args):
                     if dist < min_dist:
                         min_dist = dist
 
-            # Se a distância mínima está abaixo do threshold, é um contato
-            if min_dist <= args.threshold:
-                contacts.append((r1, r2, round(min_dist, 3)))
-    
-    if args.output:
-        write_csv(args.output, ["Residuo_1", "Residuo_2", "Distancia_A"], contacts)
-    else:
-        print(f"--- Contatos Intramoleculares (Limiar = {args.threshold:.1f} Å) ---")
-        if not contacts: print("Nenhum contato encontrado.")
-        else:
-            for c in contacts: print(f"Res {c[0]} - Res {c[1]}: {c[2]:.3f} Å")
+            # Se a distância mínima está abaixo do limite, o par pode ser um contato
+            if min_dist <= cutoff:
+                distances.append((r1, r2, min_dist))
+    return distances
 
-    # Gera visualização se solicitado
-    if hasattr(args, 'plot') and args.plot and contacts:
-        if HAS_VIZ:
-            max_res = max(max(c[0], c[1]) for c in contacts) if contacts else 1
-            biohub_viz.plot_contact_map(contacts, max_res, args.plot, args.threshold)
-        else:
-            print("Aviso: Módulo de visualização não disponível. Instale matplotlib e numpy.", file=sys.stderr)
+def _contacts_cell_list(residue_atoms, cutoff):
+    """
+    Distribui os átomos uma única vez em uma cell list com aresta igual ao limite e só mede os
+    pares de átomos em células vizinhas. Basta guardar a menor distância por par de resíduos:
+    se o contato existe, o par de átomos mais próximo está necessariamente dentro do limite.
+    """
+    coords, owners = [], []
+    for res_num in sorted(residue_atoms):
+        for atom in residue_atoms[res_num]:
+            coords.append(atom)
+            owners.append(res_num)
+    if not coords or cutoff < 0: return []
+    grid = CellList(coords, max(cutoff, 1.0))
+    # Margem para o filtro rápido não descartar pares no limite por arredondamento.
+    cutoff_sq = cutoff * cutoff + 1e-6
+    min_dist = {}
+    for i, atom1 in enumerate(coords):
+        r1 = owners[i]
+        x1, y1, z1 = atom1
+        for j in grid.candidates(x1, y1, z1, cutoff):
+            # Cada par é visto duas vezes; fico só com j > i. Mesmo resíduo e vizinhos diretos são ignorados.
+            if j <= i: continue
+            r2 = owners[j]
+            if abs(r1 - r2) <= 1: continue
+            x2, y2, z2 = atom2 = coords[j]
+            dx, dy, dz = x1 - x2, y1 - y2, z1 - z2
+            if dx*dx + dy*dy + dz*dz > cutoff_sq: continue
+            dist = math.sqrt(sum((c1-c2)**2 for c1,c2 in zip(atom1, atom2)))
+            if dist > cutoff: continue
+            key = (r1, r2) if r1 < r2 else (r2, r1)
+            if dist < min_dist.get(key, float('inf')):
+                min_dist[key] = dist
+    return [(r1, r2, dist) for (r1, r2), dist in sorted(min_dist.items())]
+
+CONTACT_ENGINES = {"brute": _contacts_brute_force, "grid": _contacts_cell_list}
+
+# Anotação do arquivo de entrada com valores por átomo. Várias propriedades são gravadas na
+# mesma passagem, cada uma em um destino: a coluna do B-factor, a da ocupância ou um CSV à parte.
+ANNOTATION_TARGETS = ("bfactor", "occupancy", "side")
+_ANNOTATION_COLUMN_NAMES = {"bfactor": "o B-factor atualizado", "occupancy": "a ocupância atualizada"}
+
+# Nome (ASCII) do CSV à parte das propriedades cujo rótulo tem acentos ou espaços.
+ANNOTATION_SIDE_KEYS = {"SASA (média por resíduo)": "sasa_residue_avg"}
+
+def annotation_side_path(output_path, property_name):
+    """Caminho do CSV à parte de uma propriedade (ex.: anotado.pdb -> anotado.sasa_residue_avg.csv)."""
+    root = os.path.splitext(strip_compression_suffix(output_path))[0]
+    name = ANNOTATION_SIDE_KEYS.get(property_name) or re.sub(r'[^A-Za-z0-9.-]+', '_', property_name).strip('_')
+    return f"{root}.{name}.csv"
+
+class _AtomCursor:
+    """
+    Percorre os átomos anotados na ordem em que aparecem no arquivo. Cada registro lido é
+    comparado apenas com o próximo átomo esperado, então o valor é achado pelo índice do átomo,
+    sem montar um dicionário; registros que não foram analisados (outros modelos, linhas
+    ignoradas pelo parser) não avançam o cursor.
+    """
+    def __init__(self, serials, models=None):
+        self.serials = serials
+        self.models = models
+        self.next = 0
+        self.matched = 0    # Átomos achados em todos os modelos recebidos
+        self.closed = False # Se False, mais átomos podem chegar depois dos atuais (ver waiting)
+
+    def reset(self, serials, models=None):
+        """Passa para os átomos do próximo modelo recebido; os índices voltam a contar do zero."""
+        self.serials, self.models, self.next = serials, models, 0
+
+    def waiting(self):
+        """True se todos os átomos recebidos já foram achados e ainda podem chegar outros."""
+        return not self.closed and self.next >= len(self.serials)
+
+    def match(self, model, serial):
+        """Índice do átomo se (modelo, serial) for o próximo esperado, senão None."""
+        k = self.next
+        if k < len(self.serials) and self.serials[k] == serial and (self.models is None or self.models[k] == model):
+            self.next += 1
+            self.matched += 1
+            return k
+        return None
 
-def write_pdb_with_bfactor(input_pdb_path, output_pdb_path, atom_values, property_name="Property"):
+class StructureAnnotator:
     """
-    Reescreve um arquivo PDB substituindo os valores do B-factor por valores calculados.
+    Reescreve um arquivo PDB (ou mmCIF) gravando várias propriedades por átomo em uma única passagem,
+    em fluxo: cada `add` recebe os valores de um modelo e copia o arquivo até os átomos desse modelo,
+    então só os valores do modelo atual ficam na memória. `close` copia o resto e mostra o resumo.
     
     Args:
         input_pdb_path: Caminho do PDB original
         output_pdb_path: Caminho para salvar o PDB anotado
-        atom_values: Lista de dicionários com 'atom_num' e 'value'
-        property_name: Nome da propriedade sendo escrita (para mensagens)
+        properties: Lista de (nome, destino); o destino é 'bfactor', 'occupancy' (colunas do próprio
+            arquivo) ou 'side' (CSV à parte, ver annotation_side_path)
+        with_model: Inclui a coluna Model nos CSVs à parte
     """
-    # Cria um dicionário para lookup rápido por número de átomo
-    value_by_atom = {atom['atom_num']: atom['value'] for atom in atom_values}
-    
-    # Calcula min/max para estatísticas
-    values_list = [atom['value'] for atom in atom_values]
-    min_val = min(values_list)
-    max_val = max(values_list)
+    def __init__(self, input_pdb_path, output_pdb_path, properties, with_model=False):
+        targets = set()
+        for name, target in properties:
+            if target not in ANNOTATION_TARGETS:
+                raise ValueError(f"Destino de anotação desconhecido: '{target}'.")
+            if target != "side" and target in targets:
+                raise ValueError(f"Mais de uma propriedade para a coluna '{target}'.")
+            targets.add(target)
+        self.input_pdb_path, self.output_pdb_path = input_pdb_path, output_pdb_path
+        self.properties = list(properties)
+        self.with_model = with_model
+        self.cursor = _AtomCursor(array('l'), array('l'))
+        self.values = {}  # Nome da propriedade -> valores do modelo atual
+        self.columns = {} # Coluna do arquivo -> valores do modelo atual
+        self.ranges = {}  # Nome da propriedade -> (mínimo, máximo) de todos os modelos
+        self.atoms_updated = 0
+        self._writer, self._finished = None, False
+
+    def _annotate(self):
+        """Gerador que copia o arquivo; para (yield) quando precisa dos valores do próximo modelo."""
+        side_files = []
+        try:
+            side_writers = []
+            for name, target in self.properties:
+                if target != "side": continue
+                side_file = open_text(annotation_side_path(self.output_pdb_path, name), 'w', newline='')
+                side_files.append(side_file)
+                writer = csv.writer(side_file)
+                writer.writerow((["Model"] if self.with_model else []) + ["Chain", "ResNum", "ResName", "AtomNum", "AtomName", name])
+                side_writers.append((writer, name))
+            
+            def write_side(k, model, chain, res_num, res_name, serial, atom_name):
+                for writer, name in side_writers:
+                    writer.writerow(([model] if self.with_model else []) + [chain, res_num, res_name, serial, atom_name, f"{self.values[name][k]:.3f}"])
+            
+            with open_text(self.input_pdb_path) as infile, open_text(self.output_pdb_path, 'w') as outfile:
+                # Entrada mmCIF: a saída também é mmCIF, com os valores em B_iso_or_equiv/occupancy.
+                annotate_lines = _annotate_cif_lines if is_mmcif_file(self.input_pdb_path) else _annotate_pdb_lines
+                self.atoms_updated = yield from annotate_lines(infile, outfile, self.cursor, self.columns,
+                                                               write_side if side_writers else None)
+        finally:
+            for side_file in side_files:
+                side_file.close()
+
+    def _resume(self):
+        """Continua a cópia até precisar do próximo modelo (ou até o fim, depois de close)."""
+        if self._finished: return
+        try:
+            if self._writer is None:
+                self._writer = self._annotate()
+            next(self._writer)
+        except StopIteration:
+            self._finished = True
+        except Exception as e:
+            self._finished, self.ranges = True, None
+            print(f"Erro ao escrever PDB anotado: {e}", file=sys.stderr)
+
+    def add(self, atom_nums, models, values):
+        """
+        Anota os átomos de um modelo. `atom_nums` e `models` são os seriais e o MODEL de cada átomo, na
+        ordem do arquivo (ex: Structure.serials e Structure.model_nums; `models` pode ser None), e `values`
+        mapeia o nome de cada propriedade para seus valores, na mesma ordem.
+        """
+        if self._finished: return
+        self.cursor.reset(atom_nums, models)
+        self.values = values
+        for name, target in self.properties:
+            if target != "side": self.columns[target] = values[name]
+            if len(values[name]):
+                low, high = min(values[name]), max(values[name])
+                if name in self.ranges: low, high = min(low, self.ranges[name][0]), max(high, self.ranges[name][1])
+                self.ranges[name] = (low, high)
+        self._resume()
+
+    def close(self):
+        """Copia o resto do arquivo e mostra o resumo da anotação."""
+        self.cursor.closed = True
+        self._resume()
+        if self.ranges is None: return
+        print(f"PDB anotado salvo em '{self.output_pdb_path}'", file=sys.stderr)
+        for name, target in self.properties:
+            if target == "side":
+                print(f"  {name} por átomo salvo em '{annotation_side_path(self.output_pdb_path, name)}' ({self.cursor.matched} átomos)", file=sys.stderr)
+            else:
+                print(f"  {self.atoms_updated} átomos tiveram {_ANNOTATION_COLUMN_NAMES[target]} com {name}", file=sys.stderr)
+            if name in self.ranges:
+                print(f"  Range de valores: {self.ranges[name][0]:.2f} - {self.ranges[name][1]:.2f}", file=sys.stderr)
+
+def write_annotated_structure(input_pdb_path, output_pdb_path, atom_nums, properties, models=None):
+    """
+    Reescreve um arquivo PDB (ou mmCIF) gravando várias propriedades por átomo em uma única passagem
+    (ver StructureAnnotator).
     
+    Args:
+        atom_nums: Números seriais dos átomos anotados, na ordem do arquivo (ex: Structure.serials)
+        properties: Lista de (nome, valores, destino); os valores seguem a ordem de atom_nums
+        models: Número do MODEL de cada átomo (ex: Structure.model_nums). Os números seriais se
+            repetem entre modelos; com `models`, só os átomos dos modelos analisados são anotados
+    """
+    with_model = models is not None and len(models) > 0 and models[0] != models[-1]
+    annotator = StructureAnnotator(input_pdb_path, output_pdb_path, [(name, target) for name, _, target in properties], with_model)
+    annotator.add(atom_nums, models, {name: values for name, values, _ in properties})
+    annotator.close()
+
+def write_pdb_with_bfactor(input_pdb_path, output_pdb_path, atom_nums, values, property_name="Property", models=None):
+    """Reescreve um arquivo PDB substituindo os valores do B-factor por valores calculados (ver write_annotated_structure)."""
+    write_annotated_structure(input_pdb_path, output_pdb_path, atom_nums, [(property_name, values, "bfactor")], models)
+
+def _annotate_pdb_lines(infile, outfile, cursor, columns, write_side=None):
+    """
+    Copia as linhas de um PDB trocando B-factor/ocupância dos átomos esperados pelo cursor. É um gerador:
+    para (yield) enquanto o cursor espera os valores do próximo modelo e devolve o número de átomos anotados.
+    """
     atoms_updated = 0
+    model, last_model = 1, 0
+    bfactor, occupancy = columns.get("bfactor"), columns.get("occupancy")
+    for line in infile:
+        if line.startswith("ATOM") or line.startswith("HETATM"):
+            # Extrai o número do átomo
+            atom_num = int(line[6:11].strip())
+            while cursor.waiting(): yield # Espera os valores do próximo modelo.
+            k = cursor.match(model, atom_num)
+            if k is not None:
+                # Reconstrói a linha com os novos valores (ocupância: colunas 55-60, B-factor: colunas 61-66)
+                # Formato: %6.2f (6 caracteres, 2 decimais)
+                if occupancy is not None:
+                    line = line[:54] + f"{occupancy[k]:6.2f}" + line[60:]
+                if bfactor is not None:
+                    line = line[:60] + f"{bfactor[k]:6.2f}" + line[66:]
+                if write_side is not None:
+                    write_side(k, model, line[21], line[22:26].strip(), line[17:20].strip(), atom_num, line[12:16].strip())
+                atoms_updated += 1
+        elif line.startswith("MODEL"):
+            model = last_model = _pdb_model_number(line, last_model)
+        # Átomos fora da análise e linhas que não são ATOM/HETATM são mantidos inalterados
+        outfile.write(line)
+    return atoms_updated
+
+def _annotate_cif_lines(infile, outfile, cursor, columns, write_side=None):
+    """Copia as linhas de um mmCIF trocando B_iso_or_equiv/occupancy dos átomos esperados pelo cursor (ver _annotate_pdb_lines)."""
+    atoms_updated = 0
+    scanner = _CIFScanner()
+    columns_seen, idx = None, None
+    for line in infile:
+        events = scanner.feed(line)
+        # Só reescrevo linhas que contêm exatamente uma linha completa de _atom_site (o caso dos arquivos do
+        # RCSB); linhas de _atom_site quebradas em várias linhas do arquivo só avançam o cursor.
+        single_row = len(events) == 1 and not scanner.row
+        for event in events:
+            if event[0] != "row" or event[1] != "_atom_site": continue
+            _, _, row_columns, values = event
+            if row_columns is not columns_seen:
+                columns_seen, idx = row_columns, _atom_site_indices(row_columns)
+            model = _cif_int(values[idx["model"]], 1) if idx["model"] is not None else 1
+            atom_num = int(values[idx["serial"]])
+            while cursor.waiting(): yield # Espera os valores do próximo modelo.
+            k = cursor.match(model, atom_num)
+            if k is None: continue
+            if write_side is not None:
+                field = lambda name: values[idx[name]] if idx[name] is not None else ""
+                write_side(k, model, field("chain"), field("res_num"), field("res_name"), atom_num, field("atom_name"))
+            targets = [(idx[target], values_by_atom[k]) for target, values_by_atom in columns.items() if idx[target] is not None]
+            tokens = _cif_raw_tokens(line.strip()) if single_row and targets else None
+            if tokens is not None and len(tokens) == len(row_columns):
+                for position, value in targets:
+                    tokens[position] = f"{value:.2f}"
+                line = " ".join(tokens) + "\n"
+                atoms_updated += 1
+        outfile.write(line)
+    return atoms_updated
+
+def pymol_script_lines(pdb_path, output_pse, property_type="hydrophobicity", min_val=-4.5, max_val=4.5, column="b"):
+    """Comandos do PyMOL (uma linha por comando, com comentários) da visualização de uma propriedade."""
+    # Cria um script PyMOL
+    script_content = []
     
-    try:
-        with open(input_pdb_path, 'r') as infile, open(output_pdb_path, 'w') as outfile:
-            for line in infile:
-                if line.startswith("ATOM") or line.startswith("HETATM"):
-                    # Extrai o número do átomo
-                    atom_num = int(line[6:11].strip())
-                    
-                    if atom_num in value_by_atom:
-                        # Pega o valor calculado
-                        new_bfactor = value_by_atom[atom_num]
-                        
-                        # Reconstrói a linha com novo B-factor (colunas 61-66)
-                        # Formato: %6.2f (6 caracteres, 2 decimais)
-                        new_line = line[:60] + f"{new_bfactor:6.2f}" + line[66:]
-                        outfile.write(new_line)
-                        atoms_updated += 1
-                    else:
-                        # Átomo não encontrado nos valores calculados, mantém original
-                        outfile.write(line)
-                else:
-                    # Linhas que não são ATOM/HETATM, mantém inalteradas
-                    outfile.write(line)
-        
-        print(f"PDB anotado salvo em '{output_pdb_path}'", file=sys.stderr)
-        print(f"  {atoms_updated} átomos tiveram o B-factor atualizado com {property_name}", file=sys.stderr)
-        print(f"  Range de valores: {min_val:.2f} - {max_val:.2f}", file=sys.stderr)
+    # Carrega o PDB
+    pdb_name = os.path.splitext(os.path.basename(strip_compression_suffix(pdb_path)))[0]
+    script_content.append(f"# Script PyMOL gerado pelo BioHub")
+    script_content.append(f"# Propriedade: {property_type}")
+    script_content.append(f"")
+    script_content.append(f"# Carrega a estrutura")
+    script_content.append(f"load {os.path.abspath(pdb_path)}, {pdb_name}")
+    script_content.append(f"")
+    script_content.append(f"# Remove todas as representações padrão")
+    script_content.append(f"hide everything, {pdb_name}")
+    script_content.append(f"")
+    
+    # Configurações de visualização baseadas no tipo de propriedade
+    if property_type == "hydrophobicity":
+        # Esquema de cores: azul (hidrofílico) -> branco -> vermelho (hidrofóbico)
+        script_content.append(f"# === HIDROFOBICIDADE ===")
+        script_content.append(f"# Azul = Hidrofílico ({min_val}), Vermelho = Hidrofóbico ({max_val})")
+        script_content.append(f"")
+        script_content.append(f"# Representação Cartoon (fita)")
+        script_content.append(f"show cartoon, {pdb_name}")
+        script_content.append(f"cartoon automatic, {pdb_name}")
+        script_content.append(f"set cartoon_fancy_helices, 1")
+        script_content.append(f"spectrum {column}, blue_white_red, {pdb_name}, minimum={min_val}, maximum={max_val}")
+        script_content.append(f"")
+        script_content.append(f"# Representação Sticks (bastões)")
+        script_content.append(f"show sticks, {pdb_name}")
+        script_content.append(f"set stick_radius, 0.2, {pdb_name}")
+        script_content.append(f"set stick_color, gray, {pdb_name}")
+        script_content.append(f"util.cbag {pdb_name}")  # Cores por átomo (C=cinza, N=azul, O=vermelho)
+        script_content.append(f"")
+        script_content.append(f"# Representação Surface (superfície)")
+        script_content.append(f"show surface, {pdb_name}")
+        script_content.append(f"set surface_quality, 1")
+        script_content.append(f"set transparency, 0.5, {pdb_name}")
+        script_content.append(f"# Aplica gradiente de hidrofobicidade na superfície")
+        script_content.append(f"set surface_color, white, {pdb_name}")
+        script_content.append(f"spectrum {column}, blue_white_red, {pdb_name}, minimum={min_val}, maximum={max_val}")
         
-    except Exception as e:
-        print(f"Erro ao escrever PDB anotado: {e}", file=sys.stderr)
+    elif property_type == "sasa":
+        # Esquema de cores INVERTIDO: vermelho (enterrado) -> branco -> azul (exposto)
+        # Invertemos porque alto SASA = exposto ao solvente (água) = deve ser azul
+        script_content.append(f"# === SASA (Acessibilidade ao Solvente) ===")
+        script_content.append(f"# Vermelho = Enterrado ({min_val:.1f} Ų), Azul = Exposto ({max_val:.1f} Ų)")
+        script_content.append(f"")
+        script_content.append(f"# Representação Cartoon (fita)")
+        script_content.append(f"show cartoon, {pdb_name}")
+        script_content.append(f"cartoon automatic, {pdb_name}")
+        script_content.append(f"set cartoon_fancy_helices, 1")
+        script_content.append(f"spectrum {column}, red_white_blue, {pdb_name}, minimum={min_val}, maximum={max_val}")
+        script_content.append(f"")
+        script_content.append(f"# Representação Sticks (bastões)")
+        script_content.append(f"show sticks, {pdb_name}")
+        script_content.append(f"set stick_radius, 0.2, {pdb_name}")
+        script_content.append(f"set stick_color, gray, {pdb_name}")
+        script_content.append(f"util.cbag {pdb_name}")  # Cores por átomo
+        script_content.append(f"")
+        script_content.append(f"# Representação Surface (superfície)")
+        script_content.append(f"show surface, {pdb_name}")
+        script_content.append(f"set surface_quality, 1")
+        script_content.append(f"set transparency, 0.5, {pdb_name}")
+        script_content.append(f"# Aplica gradiente de SASA na superfície")
+        script_content.append(f"set surface_color, white, {pdb_name}")
+        script_content.append(f"spectrum {column}, red_white_blue, {pdb_name}, minimum={min_val}, maximum={max_val}")
+    
+    script_content.append(f"")
+    script_content.append(f"# === Configurações Gerais de Qualidade ===")
+    script_content.append(f"bg_color white")
+    script_content.append(f"set ray_shadow, 0")
+    script_content.append(f"set antialias, 2")
+    script_content.append(f"set orthoscopic, 0")
+    script_content.append(f"set valence, 0")
+    script_content.append(f"")
+    script_content.append(f"# Centra e ajusta visualização")
+    script_content.append(f"center {pdb_name}")
+    script_content.append(f"zoom {pdb_name}")
+    script_content.append(f"orient {pdb_name}")
+    script_content.append(f"")
+    script_content.append(f"# Comandos úteis:")
+    script_content.append(f"# hide surface - ocultar superfície")
+    script_content.append(f"# hide sticks - ocultar bastões")
+    script_content.append(f"# hide cartoon - ocultar cartoon")
+    script_content.append(f"# set transparency, 0.7 - aumentar transparência")
+    script_content.append(f"")
+    script_content.append(f"# Para salvar a sessão, use:")
+    script_content.append(f"# save {os.path.abspath(output_pse)}")
+    return script_content
+
+# PyMOL persistente: um único PyMOL (a API `pymol` no próprio processo ou um `pymol -c -q -p`
+# lendo comandos da entrada padrão) gera todas as sessões de uma execução, em vez de iniciar um
+# PyMOL e gravar um .pml temporário para cada estrutura. Após os comandos de cada sessão, um
+# print do marcador indica que o PyMOL terminou; o executável pode ser trocado com BIOHUB_PYMOL
+# (que também faz o executável ser usado no lugar da API). Na API, os comandos rodam em uma thread
+# com o mesmo tempo limite; se ela travar, as sessões seguintes passam para o executável.
+PYMOL_EXECUTABLE = os.environ.get("BIOHUB_PYMOL", "pymol")
+PYMOL_TIMEOUT = 30 # Tempo limite (s) de cada sessão.
+_PYMOL_SENTINEL = "BIOHUB-PYMOL-OK"
+_PYMOL_WORKER = None
+
+def _pump_lines(stream, lines):
+    """Copia as linhas de `stream` para a fila `lines`, terminando com None no fim do arquivo."""
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+class PyMOLWorker:
+    """Sessão do PyMOL mantida aberta entre as estruturas (API no processo ou subprocesso headless)."""
+
+    def __init__(self, executable=PYMOL_EXECUTABLE, timeout=PYMOL_TIMEOUT, use_api=True):
+        self.executable = shutil.which(executable)
+        self.timeout = timeout
+        self.cmd = None
+        self.process = None
+        if use_api:
+            try:
+                import pymol # Importado só aqui: carregar o PyMOL é caro e só as sessões precisam dele.
+                pymol.finish_launching(['pymol', '-qc'])
+                self.cmd = pymol.cmd
+            except Exception: # PyMOL não instalado como módulo (ou sem suporte a modo headless)
+                self.cmd = None
+
+    @property
+    def available(self):
+        return self.cmd is not None or self.executable is not None
+
+    def _start(self):
+        self.process = subprocess.Popen([self.executable, '-c', '-q', '-K', '-p'], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self.output = queue.Queue()
+        # Uma thread lê a saída do PyMOL, para que a espera pelo marcador possa ter tempo limite.
+        threading.Thread(target=_pump_lines, args=(self.process.stdout, self.output), daemon=True).start()
+
+    def save_session(self, script_lines, output_pse):
+        """Executa os comandos de uma visualização e salva a sessão. Retorna 'ok', 'erro' ou 'timeout'."""
+        commands = [line for line in script_lines if line.strip() and not line.lstrip().startswith('#')]
+        commands = ["reinitialize"] + commands + [f"save {os.path.abspath(output_pse)}"]
+        if os.path.exists(output_pse): os.remove(output_pse) # O .pse existir depois indica sucesso.
+        if self.cmd is not None:
+            return self._save_with_api(commands, output_pse)
+        try:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            self.process.stdin.write("\n".join(commands + [f'print("{_PYMOL_SENTINEL}")']) + "\n")
+            self.process.stdin.flush()
+            deadline = time.monotonic() + self.timeout
+            while True:
+                line = self.output.get(timeout=max(0.0, deadline - time.monotonic()))
+                if line is None: # O PyMOL terminou sem chegar ao marcador.
+                    self.process = None
+                    return "erro"
+                if line.strip() == _PYMOL_SENTINEL: break
+        except queue.Empty:
+            self.close(kill=True)
+            return "timeout"
+        except OSError:
+            self.close(kill=True)
+            return "erro"
+        return "ok" if os.path.exists(output_pse) else "erro"
+
+    def _save_with_api(self, commands, output_pse):
+        """Executa os comandos pela API do PyMOL em uma thread, esperando no máximo `timeout` segundos."""
+        failed = []
+
+        def run():
+            try:
+                for command in commands:
+                    self.cmd.do(command, echo=0, flush=1)
+            except Exception as e:
+                failed.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            # Não dá para interromper a thread; a API fica presa nela e as próximas sessões usam o executável.
+            self.cmd = None
+            return "timeout"
+        if failed: return "erro"
+        return "ok" if os.path.exists(output_pse) else "erro"
+
+    def close(self, kill=False):
+        """Encerra o subprocesso do PyMOL, se houver."""
+        process, self.process = self.process, None
+        if process is None or process.poll() is not None: return
+        try:
+            if not kill:
+                process.stdin.write("quit\n")
+                process.stdin.close()
+                process.wait(timeout=5)
+                return
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        process.kill()
+        process.wait()
+
+def pymol_worker():
+    """PyMOL persistente do processo atual, criado no primeiro uso e encerrado na saída."""
+    global _PYMOL_WORKER
+    if _PYMOL_WORKER is None:
+        # Com BIOHUB_PYMOL, o executável indicado é usado mesmo que a API `pymol` esteja instalada.
+        _PYMOL_WORKER = PyMOLWorker(use_api="BIOHUB_PYMOL" not in os.environ)
+        multiprocessing_util.Finalize(_PYMOL_WORKER, _PYMOL_WORKER.close, exitpriority=10)
+    return _PYMOL_WORKER
 
-def generate_pymol_session(pdb_path, output_pse, property_type="hydrophobicity", min_val=-4.5, max_val=4.5):
+def generate_pymol_session(pdb_path, output_pse, property_type="hydrophobicity", min_val=-4.5, max_val=4.5, column="b"):
     """
     Gera um arquivo de sessão PyMOL (.pse) com visualização configurada.
     Se PyMOL não estiver disponível, gera um script .pml que pode ser executado manualmente.
@@ -574,99 +2844,12 @@ def generate_pymol_session(pdb_path, output_pse, property_type="hydrophobicity",
         property_type: Tipo de propriedade ('hydrophobicity' ou 'sasa')
         min_val: Valor mínimo para o gradiente de cores
         max_val: Valor máximo para o gradiente de cores
+        column: Coluna do PDB com os valores: 'b' (B-factor) ou 'q' (ocupância)
     """
     try:
         # Gera também um script .pml independente do resultado
         pml_script = output_pse.replace('.pse', '.pml')
-        
-        # Cria um script PyMOL
-        script_content = []
-        
-        # Carrega o PDB
-        pdb_name = os.path.splitext(os.path.basename(pdb_path))[0]
-        script_content.append(f"# Script PyMOL gerado pelo BioHub")
-        script_content.append(f"# Propriedade: {property_type}")
-        script_content.append(f"")
-        script_content.append(f"# Carrega a estrutura")
-        script_content.append(f"load {os.path.abspath(pdb_path)}, {pdb_name}")
-        script_content.append(f"")
-        script_content.append(f"# Remove todas as representações padrão")
-        script_content.append(f"hide everything, {pdb_name}")
-        script_content.append(f"")
-        
-        # Configurações de visualização baseadas no tipo de propriedade
-        if property_type == "hydrophobicity":
-            # Esquema de cores: azul (hidrofílico) -> branco -> vermelho (hidrofóbico)
-            script_content.append(f"# === HIDROFOBICIDADE ===")
-            script_content.append(f"# Azul = Hidrofílico ({min_val}), Vermelho = Hidrofóbico ({max_val})")
-            script_content.append(f"")
-            script_content.append(f"# Representação Cartoon (fita)")
-            script_content.append(f"show cartoon, {pdb_name}")
-            script_content.append(f"cartoon automatic, {pdb_name}")
-            script_content.append(f"set cartoon_fancy_helices, 1")
-            script_content.append(f"spectrum b, blue_white_red, {pdb_name}, minimum={min_val}, maximum={max_val}")
-            script_content.append(f"")
-            script_content.append(f"# Representação Sticks (bastões)")
-            script_content.append(f"show sticks, {pdb_name}")
-            script_content.append(f"set stick_radius, 0.2, {pdb_name}")
-            script_content.append(f"set stick_color, gray, {pdb_name}")
-            script_content.append(f"util.cbag {pdb_name}")  # Cores por átomo (C=cinza, N=azul, O=vermelho)
-            script_content.append(f"")
-            script_content.append(f"# Representação Surface (superfície)")
-            script_content.append(f"show surface, {pdb_name}")
-            script_content.append(f"set surface_quality, 1")
-            script_content.append(f"set transparency, 0.5, {pdb_name}")
-            script_content.append(f"# Aplica gradiente de hidrofobicidade na superfície")
-            script_content.append(f"set surface_color, white, {pdb_name}")
-            script_content.append(f"spectrum b, blue_white_red, {pdb_name}, minimum={min_val}, maximum={max_val}")
-            
-        elif property_type == "sasa":
-            # Esquema de cores INVERTIDO: vermelho (enterrado) -> branco -> azul (exposto)
-            # Invertemos porque alto SASA = exposto ao solvente (água) = deve ser azul
-            script_content.append(f"# === SASA (Acessibilidade ao Solvente) ===")
-            script_content.append(f"# Vermelho = Enterrado ({min_val:.1f} Ų), Azul = Exposto ({max_val:.1f} Ų)")
-            script_content.append(f"")
-            script_content.append(f"# Representação Cartoon (fita)")
-            script_content.append(f"show cartoon, {pdb_name}")
-            script_content.append(f"cartoon automatic, {pdb_name}")
-            script_content.append(f"set cartoon_fancy_helices, 1")
-            script_content.append(f"spectrum b, red_white_blue, {pdb_name}, minimum={min_val}, maximum={max_val}")
-            script_content.append(f"")
-            script_content.append(f"# Representação Sticks (bastões)")
-            script_content.append(f"show sticks, {pdb_name}")
-            script_content.append(f"set stick_radius, 0.2, {pdb_name}")
-            script_content.append(f"set stick_color, gray, {pdb_name}")
-            script_content.append(f"util.cbag {pdb_name}")  # Cores por átomo
-            script_content.append(f"")
-            script_content.append(f"# Representação Surface (superfície)")
-            script_content.append(f"show surface, {pdb_name}")
-            script_content.append(f"set surface_quality, 1")
-            script_content.append(f"set transparency, 0.5, {pdb_name}")
-            script_content.append(f"# Aplica gradiente de SASA na superfície")
-            script_content.append(f"set surface_color, white, {pdb_name}")
-            script_content.append(f"spectrum b, red_white_blue, {pdb_name}, minimum={min_val}, maximum={max_val}")
-        
-        script_content.append(f"")
-        script_content.append(f"# === Configurações Gerais de Qualidade ===")
-        script_content.append(f"bg_color white")
-        script_content.append(f"set ray_shadow, 0")
-        script_content.append(f"set antialias, 2")
-        script_content.append(f"set orthoscopic, 0")
-        script_content.append(f"set valence, 0")
-        script_content.append(f"")
-        script_content.append(f"# Centra e ajusta visualização")
-        script_content.append(f"center {pdb_name}")
-        script_content.append(f"zoom {pdb_name}")
-        script_content.append(f"orient {pdb_name}")
-        script_content.append(f"")
-        script_content.append(f"# Comandos úteis:")
-        script_content.append(f"# hide surface - ocultar superfície")
-        script_content.append(f"# hide sticks - ocultar bastões")
-        script_content.append(f"# hide cartoon - ocultar cartoon")
-        script_content.append(f"# set transparency, 0.7 - aumentar transparência")
-        script_content.append(f"")
-        script_content.append(f"# Para salvar a sessão, use:")
-        script_content.append(f"# save {os.path.abspath(output_pse)}")
+        script_content = pymol_script_lines(pdb_path, output_pse, property_type, min_val, max_val, column)
         
         # Salva o script .pml
         with open(pml_script, 'w') as f:
@@ -675,312 +2858,617 @@ def generate_pymol_session(pdb_path, output_pse, property_type="hydrophobicity",
         print(f"Script PyMOL salvo em '{pml_script}'", file=sys.stderr)
         print(f"  Execute com: pymol {pml_script}", file=sys.stderr)
         
-        # Tenta gerar o .pse automaticamente se PyMOL estiver disponível
-        if shutil.which('pymol'):
-            # Adiciona comandos para salvar sessão e sair
-            save_script_content = script_content + [
-                f"",
-                f"save {os.path.abspath(output_pse)}",
-                f"quit"
-            ]
-            
-            # Escreve script temporário
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.pml', delete=False) as f:
-                script_path = f.name
-                f.write('\n'.join(save_script_content))
-            
-            try:
-                result = subprocess.run(
-                    ['pymol', '-c', '-q', script_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                
-                if result.returncode == 0:
-                    print(f"Sessão PyMOL salva em '{output_pse}'", file=sys.stderr)
-                    print(f"  Abra com: pymol {output_pse}", file=sys.stderr)
-                else:
-                    print(f"Aviso: Não foi possível gerar o arquivo .pse automaticamente.", file=sys.stderr)
-                    print(f"  Use o script .pml manualmente: pymol {pml_script}", file=sys.stderr)
-            
-            except subprocess.TimeoutExpired:
+        # Tenta gerar o .pse automaticamente com o PyMOL persistente (API ou processo aberto)
+        worker = pymol_worker()
+        if worker.available:
+            status = worker.save_session(script_content, output_pse)
+            if status == "ok":
+                print(f"Sessão PyMOL salva em '{output_pse}'", file=sys.stderr)
+                print(f"  Abra com: pymol {output_pse}", file=sys.stderr)
+            elif status == "timeout":
                 print(f"Aviso: Timeout ao executar PyMOL.", file=sys.stderr)
-            finally:
-                # Remove script temporário
-                if os.path.exists(script_path):
-                    os.remove(script_path)
+            else:
+                print(f"Aviso: Não foi possível gerar o arquivo .pse automaticamente.", file=sys.stderr)
+                print(f"  Use o script .pml manualmente: pymol {pml_script}", file=sys.stderr)
         else:
             print(f"  Nota: PyMOL não está no PATH. Instale-o para gerar o arquivo .pse automaticamente.", file=sys.stderr)
         
     except Exception as e:
         print(f"Erro ao gerar script PyMOL: {e}", file=sys.stderr)
 
+PYMOL_COLUMNS = {"bfactor": "b", "occupancy": "q"} # Coluna usada pelo spectrum do PyMOL para cada destino da anotação.
+
+def _pymol_column(args):
+    """Coluna do PyMOL que recebe a propriedade anotada, ou None (com aviso) se ela foi para um CSV à parte."""
+    column = PYMOL_COLUMNS.get(args.write_target)
+    if column is None:
+        print("Aviso: --pymol requer a propriedade no B-factor ou na ocupância; sessão não gerada com --write-target side.", file=sys.stderr)
+    return column
+
+def atom_hydrophobicity(structure):
+    """Hidrofobicidade (Kyte-Doolittle) de cada átomo, igual à do seu resíduo."""
+    # Para cada nome de resíduo, pego o score de hidrofobicidade do aminoácido.
+    # Se não for aminoácido padrão (ex: ligante), o score é 0.
+    score_by_name = [KYTE_DOOLITTLE.get(THREE_TO_ONE.get(name), 0.0) for name in structure.names]
+    # Para cada átomo, atribui a hidrofobicidade do seu resíduo
+    return array('d', (score_by_name[k] for k in structure.res_name_ids))
+
 def predict_solvent_hydrophoby(args):
     """Prevê a exposição ao solvente usando hidrofobicidade (Kyte-Doolittle) por átomo."""
-    atoms = parse_pdb_atoms(args.pdb_file)
-    if not atoms: return
-    
-    results = []
-    
-    # Para cada átomo, atribui a hidrofobicidade do seu resíduo
-    for atom in atoms:
-        res_name = atom["res_name"]
-        # Converte nome de 3 letras para 1 letra
-        aa_code = THREE_TO_ONE.get(res_name, None)
-        
-        if aa_code:
-            # Pega o score de hidrofobicidade do aminoácido
-            hydro_score = KYTE_DOOLITTLE.get(aa_code, 0.0)
-        else:
-            # Se não for aminoácido padrão (ex: ligante), define como 0
-            hydro_score = 0.0
-        
-        results.append({
-            "chain_id": atom["chain_id"],
-            "res_num": atom["res_num"],
-            "res_name": atom["res_name"],
-            "atom_num": atom["atom_num"],
-            "atom_name": atom["atom_name"],
-            "hydrophobicity": hydro_score
-        })
+    models = select_models(args)
+    first = next(models, None)
+    if first is None: return
+    all_models = args.model == 'all'
+    annotated_pdb = args.write_pdb
+    if not annotated_pdb and args.pymol and _pymol_column(args):
+        # Se --pymol foi especificado mas --write-pdb não, avisa o usuário
+        print("Aviso: --pymol requer --write-pdb. Gerando PDB temporário...", file=sys.stderr)
+        annotated_pdb = "temp_hydro.pdb"
+    # Anota o arquivo modelo a modelo, junto com a saída, para --write-pdb
+    annotation = AtomValues(args.pdb_file, annotated_pdb, "Hydrophobicity", args.write_target, with_model=all_models)
+    plot_data = []            # Registros por átomo do primeiro modelo, para o gráfico
     
-    print(f"Total de átomos analisados: {len(results)}", file=sys.stderr)
+    def model_rows():
+        # Os modelos são processados um por vez, à medida que as linhas de saída são consumidas.
+        for model, structure in itertools.chain([first], models):
+            hydrophobicity = atom_hydrophobicity(structure)
+            if args.plot_hydrophoby and not plot_data:
+                plot_data.extend(structure.atom_records(hydrophobicity=hydrophobicity))
+            annotation.add(structure, hydrophobicity)
+            for row in atom_rows(structure, hydrophobicity, ".3f"):
+                yield [model] + row if all_models else row
     
     # Gera dados para saída
-    results_data = [
-        [atom["chain_id"], atom["res_num"], atom["res_name"], atom["atom_num"], atom["atom_name"], f"{atom['hydrophobicity']:.3f}"]
-        for atom in results
-    ]
+    results_data = model_rows()
+    header = ["Chain", "ResNum", "ResName", "AtomNum", "AtomName", "Hydrophobicity"]
     
     if args.output:
-        write_csv(args.output, ["Chain", "ResNum", "ResName", "AtomNum", "AtomName", "Hydrophobicity"], results_data)
+        write_csv(args.output, ["Model"] + header if all_models else header, results_data)
     else:
         print(f"--- Hidrofobicidade por Átomo (Escala Kyte-Doolittle) ---")
-        print("Chain | ResNum | ResName | AtomNum | AtomName | Hydrophobicity")
-        for row in results_data[:20]:  # Mostra apenas os primeiros 20
-            print(f"{row[0]:<5} | {row[1]:<6} | {row[2]:<7} | {row[3]:<7} | {row[4]:<8} | {row[5]}")
-        if len(results_data) > 20:
-            print(f"... e mais {len(results_data) - 20} átomos. Use -o para salvar todos os dados.")
+        print(" | ".join(["Model"] + header if all_models else header))
+        print_atom_rows(results_data, all_models)
+    
+    print(f"Total de átomos analisados: {len(annotation)}", file=sys.stderr)
     
     # Gera visualização se solicitado
     if hasattr(args, 'plot_hydrophoby') and args.plot_hydrophoby:
         if HAS_VIZ:
-            biohub_viz.plot_hydrophoby_profile(results, args.plot_hydrophoby)
+            if all_models: print("Aviso: O perfil de hidrofobicidade mostra apenas o primeiro modelo.", file=sys.stderr)
+            biohub_viz.plot_hydrophoby_profile(plot_data, args.plot_hydrophoby)
         else:
             print("Aviso: Módulo de visualização não disponível. Instale matplotlib e numpy.", file=sys.stderr)
     
-    # Gera PDB anotado se solicitado
-    if args.write_pdb:
-        # Prepara dados para escrita no B-factor
-        atom_values = [{'atom_num': atom['atom_num'], 'value': atom['hydrophobicity']} for atom in results]
-        write_pdb_with_bfactor(args.pdb_file, args.write_pdb, atom_values, "Hydrophobicity")
-        
-        # Gera sessão PyMOL se solicitado
-        if args.pymol:
-            generate_pymol_session(args.write_pdb, args.pymol, property_type="hydrophobicity", min_val=-4.5, max_val=4.5)
-    elif args.pymol:
-        # Se --pymol foi especificado mas --write-pdb não, avisa o usuário
-        print("Aviso: --pymol requer --write-pdb. Gerando PDB temporário...", file=sys.stderr)
-        temp_pdb = "temp_hydro.pdb"
-        atom_values = [{'atom_num': atom['atom_num'], 'value': atom['hydrophobicity']} for atom in results]
-        write_pdb_with_bfactor(args.pdb_file, temp_pdb, atom_values, "Hydrophobicity")
-        generate_pymol_session(temp_pdb, args.pymol, property_type="hydrophobicity", min_val=-4.5, max_val=4.5)
+    # Termina o PDB anotado se solicitado
+    annotation.close()
+    
+    # Gera sessão PyMOL se solicitado
+    if args.pymol and annotated_pdb and _pymol_column(args):
+        generate_pymol_session(annotated_pdb, args.pymol, property_type="hydrophobicity", min_val=-4.5, max_val=4.5,
+                               column=_pymol_column(args))
+
+def _sasa_pymol_range(residue_avg_sasa):
+    """Define o range de cores do SASA no PyMOL a partir das médias por resíduo (percentil 70 dos expostos)."""
+    avg_sasa_values = sorted(residue_avg_sasa)
+    
+    # Remove valores muito baixos para análise (resíduos quase completamente enterrados)
+    non_zero_sasa = [v for v in avg_sasa_values if v > 0.5]
+    
+    if len(non_zero_sasa) > 0:
+        # Usa percentil 70 dos valores não-zero para melhor sensibilidade
+        percentil_70_idx = int(len(non_zero_sasa) * 0.70)
+        max_sasa = non_zero_sasa[percentil_70_idx]
+        min_sasa = 0.0
+    else:
+        min_sasa = 0.0
+        max_sasa = max(avg_sasa_values) if avg_sasa_values else 1.0
+    
+    print(f"Range de visualização SASA (média por resíduo): 0.00 - {max_sasa:.2f} Ų (percentil 70)", file=sys.stderr)
+    print(f"  Resíduos totais: {len(avg_sasa_values)}", file=sys.stderr)
+    print(f"  Resíduos enterrados (SASA<0.5): {len(avg_sasa_values) - len(non_zero_sasa)}", file=sys.stderr)
+    print(f"  Resíduos expostos (SASA≥0.5): {len(non_zero_sasa)}", file=sys.stderr)
+    return min_sasa, max_sasa
 
 def calculate_sasa(args):
     """Calcula a Área de Superfície Acessível ao Solvente (SASA) usando o método de Shrake-Rupley."""
-    atoms = parse_pdb_atoms(args.pdb_file)
-    if not atoms: return
-    # Gero os pontos na esfera que serão usados para testar a acessibilidade de cada átomo.
-    sphere_points = generate_sphere_points(args.num_points)
-    total_sasa = 0.0
-    sasa_per_atom = []  # Lista para armazenar SASA de cada átomo
+    models = select_models(args)
+    first = next(models, None)
+    if first is None: return
+    all_models = args.model == 'all'
+    annotated_pdb = args.write_pdb
+    if not annotated_pdb and args.pymol and _pymol_column(args):
+        # Se --pymol foi especificado mas --write-pdb não, avisa o usuário
+        print("Aviso: --pymol requer --write-pdb. Gerando PDB temporário...", file=sys.stderr)
+        annotated_pdb = "temp_sasa.pdb"
+    # SASA médio por resíduo, anotado modelo a modelo junto com a saída, para --write-pdb
+    annotation = AtomValues(args.pdb_file, annotated_pdb, "SASA (média por resíduo)", args.write_target, with_model=all_models)
+    residue_avg_sasa = []     # Médias por resíduo de todos os modelos, só para o range do PyMOL
+    plot_data = []            # Registros por átomo do primeiro modelo, para o gráfico
     
-    # Para cada átomo...
-    for i, atom_i in enumerate(atoms):
-        radius_i = VDW_RADII.get(atom_i["element"], VDW_RADII['DEFAULT'])
-        extended_radius = radius_i + args.probe_radius # Raio do átomo + raio da sonda (água).
-        accessible_points = 0
-        # ... testo cada ponto na sua superfície estendida.
-        for sp in sphere_points:
-            point_is_accessible = True
-            point = (atom_i["x"] + extended_radius * sp[0], atom_i["y"] + extended_radius * sp[1], atom_i["z"] + extended_radius * sp[2])
-            # Verifico se este ponto está dentro da esfera estendida de qualquer outro átomo.
-            for j, atom_j in enumerate(atoms):
-                if i == j: continue
-                radius_j = VDW_RADII.get(atom_j["element"], VDW_RADII['DEFAULT'])
-                # Se a distância do ponto ao centro do átomo j for menor que o raio estendido de j, o ponto está ocluído.
-                if sum((p-c)**2 for p,c in zip(point, (atom_j["x"], atom_j["y"], atom_j["z"]))) < (radius_j + args.probe_radius)**2:
-                    point_is_accessible = False; break
-            if point_is_accessible: accessible_points += 1
-        
-        # O SASA do átomo é a proporção de pontos acessíveis multiplicada pela área da esfera estendida.
-        atom_sasa = (accessible_points / args.num_points) * 4.0 * math.pi * extended_radius**2 if args.num_points > 0 else 0
-        total_sasa += atom_sasa
-        
-        # Armazena dados do átomo com SASA
-        sasa_per_atom.append({
-            "chain_id": atom_i["chain_id"],
-            "res_num": atom_i["res_num"],
-            "res_name": atom_i["res_name"],
-            "atom_num": atom_i["atom_num"],
-            "atom_name": atom_i["atom_name"],
-            "sasa": atom_sasa
-        })
-        
-    print(f"SASA Total da Molécula: {total_sasa:.2f} Å²", file=sys.stderr)
-    print(f"Total de átomos analisados: {len(sasa_per_atom)}", file=sys.stderr)
+    def model_rows():
+        # Os modelos são processados um por vez, à medida que as linhas de saída são consumidas.
+        for model, structure in itertools.chain([first], models):
+            sasa_values = compute_sasa(structure, args.num_points, args.probe_radius, args.engine, args.jobs)
+            label = f"do Modelo {model}" if all_models else "da Molécula"
+            print(f"SASA Total {label}: {sum(sasa_values):.2f} Å²", file=sys.stderr)
+            if args.plot_profile and not plot_data:
+                plot_data.extend(structure.atom_records(sasa=sasa_values))
+            if annotated_pdb:
+                # Usa o SASA MÉDIO POR RESÍDUO para visualização mais biologicamente relevante:
+                # a média do resíduo é atribuída a todos os átomos daquele resíduo.
+                residue_avg, atom_avg_sasa = residue_average(structure, sasa_values)
+                if args.pymol: residue_avg_sasa.extend(residue_avg)
+                annotation.add(structure, atom_avg_sasa)
+            else:
+                annotation.count(structure)
+            for row in atom_rows(structure, sasa_values, ".2f"):
+                yield [model] + row if all_models else row
     
     # Gera dados para saída
-    results_data = [
-        [atom["chain_id"], atom["res_num"], atom["res_name"], atom["atom_num"], atom["atom_name"], f"{atom['sasa']:.2f}"]
-        for atom in sasa_per_atom
-    ]
+    results_data = model_rows()
+    header = ["Chain", "ResNum", "ResName", "AtomNum", "AtomName", "SASA_A2"]
     
     if args.output:
-        write_csv(args.output, ["Chain", "ResNum", "ResName", "AtomNum", "AtomName", "SASA_A2"], results_data)
+        write_csv(args.output, ["Model"] + header if all_models else header, results_data)
     else:
         print("--- SASA por Átomo ---")
-        print("Chain | ResNum | ResName | AtomNum | AtomName | SASA (Å²)")
-        for row in results_data[:20]:  # Mostra apenas os primeiros 20 para não poluir o terminal
-            print(f"{row[0]:<5} | {row[1]:<6} | {row[2]:<7} | {row[3]:<7} | {row[4]:<8} | {row[5]}")
-        if len(results_data) > 20:
-            print(f"... e mais {len(results_data) - 20} átomos. Use -o para salvar todos os dados.")
+        print(" | ".join(["Model"] + header[:-1] if all_models else header[:-1]) + " | SASA (Å²)")
+        print_atom_rows(results_data, all_models)
+    
+    print(f"Total de átomos analisados: {len(annotation)}", file=sys.stderr)
 
     # Gera visualização se solicitado
     if hasattr(args, 'plot_profile') and args.plot_profile:
         if HAS_VIZ:
-            biohub_viz.plot_sasa_profile(sasa_per_atom, args.plot_profile)
+            if all_models: print("Aviso: O perfil de SASA mostra apenas o primeiro modelo.", file=sys.stderr)
+            biohub_viz.plot_sasa_profile(plot_data, args.plot_profile)
         else:
             print("Aviso: Módulo de visualização não disponível. Instale matplotlib e numpy.", file=sys.stderr)
 
-    # Gera PDB anotado se solicitado
-    if args.write_pdb:
-        # Calcula SASA MÉDIO POR RESÍDUO para visualização mais biologicamente relevante
-        from collections import defaultdict
-        residue_sasa = defaultdict(list)
-        
-        # Agrupa SASA por resíduo (chain + res_num)
-        for atom in sasa_per_atom:
-            residue_key = (atom['chain_id'], atom['res_num'])
-            residue_sasa[residue_key].append(atom['sasa'])
-        
-        # Calcula média por resíduo
-        residue_avg_sasa = {}
-        for residue_key, sasa_list in residue_sasa.items():
-            residue_avg_sasa[residue_key] = sum(sasa_list) / len(sasa_list)
-        
-        # Atribui a média do resíduo a todos os átomos daquele resíduo
-        atom_values = []
-        for atom in sasa_per_atom:
-            residue_key = (atom['chain_id'], atom['res_num'])
-            avg_sasa = residue_avg_sasa[residue_key]
-            atom_values.append({'atom_num': atom['atom_num'], 'value': avg_sasa})
-        
-        write_pdb_with_bfactor(args.pdb_file, args.write_pdb, atom_values, "SASA (média por resíduo)")
-        
-        # Gera sessão PyMOL se solicitado
+    # Termina o PDB anotado se solicitado
+    annotation.close()
+    
+    # Gera sessão PyMOL se solicitado
+    if args.pymol and annotated_pdb and _pymol_column(args):
+        # Para SASA, usa a média por resíduo para definir o range
+        min_sasa, max_sasa = _sasa_pymol_range(residue_avg_sasa)
+        generate_pymol_session(annotated_pdb, args.pymol, property_type="sasa", min_val=min_sasa, max_val=max_sasa,
+                               column=_pymol_column(args))
+
+# Pipeline "analyze": as etapas rodam sobre uma única estrutura lida uma vez. As etapas não
+# dependem umas das outras e rodam em threads, que compartilham a estrutura sem copiá-la; as
+# saídas (CSVs, FASTA, PDB anotado, gráficos) são gravadas depois, na ordem das etapas.
+# contacts e o SASA seguram o GIL quase o tempo todo e, em threads, rodariam um depois do outro;
+# quando as duas etapas são pedidas, o SASA vai para o pool de processos do --jobs (coordenadas
+# em memória compartilhada), mesmo com -j 1. fasta e hydrophoby são rápidas e ficam nas threads.
+# O batch desliga isso (sasa_in_pool): os arquivos já são divididos entre os processos.
+ANALYZE_STAGES = ("fasta", "contacts", "hydrophoby", "sasa")
+
+def analyze_stages(value):
+    """Tipo do argparse para --stages: etapas separadas por vírgula (ex: sasa,contacts) ou 'all'."""
+    if value == 'all': return list(ANALYZE_STAGES)
+    stages = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [stage for stage in stages if stage not in ANALYZE_STAGES]
+    if unknown or not stages:
+        raise argparse.ArgumentTypeError(f"etapa inválida: '{value}' (use {', '.join(ANALYZE_STAGES)} ou all)")
+    return [stage for stage in ANALYZE_STAGES if stage in stages] # Ordem fixa das saídas.
+
+def _timed(function, *args):
+    """Executa `function(*args)` e retorna (resultado, segundos)."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def run_analysis(args):
+    """
+    Executa várias análises (fasta, contacts, hydrophoby, sasa) sobre uma única leitura da estrutura.
+    Retorna o número de átomos e as etapas que falharam, ou None se a estrutura não pôde ser lida.
+    """
+    if not os.path.exists(args.pdb_file):
+        print(f"Erro: Arquivo não encontrado em '{args.pdb_file}'", file=sys.stderr)
+        return
+    selected = next(select_models(args), None)
+    if selected is None: return None
+    model, structure = selected
+    stages = args.stages
+    thresholds = args.threshold
+    input_name = os.path.basename(strip_compression_suffix(args.pdb_file))
+    stem, ext = os.path.splitext(input_name)
+    prefix = os.path.join(args.outdir, args.prefix or stem)
+    if args.outdir: os.makedirs(args.outdir, exist_ok=True)
+    
+    tasks = {
+        "fasta": lambda: sequence_from_structure(structure),
+        "contacts": lambda: residue_min_distances(structure, max(thresholds), args.contact_engine),
+        "hydrophoby": lambda: atom_hydrophobicity(structure),
+        "sasa": lambda: compute_sasa(structure, args.num_points, args.probe_radius, args.sasa_engine, args.jobs,
+                                     in_pool="contacts" in stages and getattr(args, "sasa_in_pool", True)),
+    }
+    print(f"Analisando '{args.pdb_file}' ({len(structure)} átomos, modelo {model}): {', '.join(stages)}", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+        futures = {stage: pool.submit(_timed, tasks[stage]) for stage in stages}
+        results = {}
+        for stage in stages:
+            try:
+                results[stage], elapsed = futures[stage].result()
+                print(f"  ✓ {stage}: {elapsed:.2f} s", file=sys.stderr)
+            except Exception as e:
+                print(f"Erro na etapa '{stage}': {e}", file=sys.stderr)
+    summary = {"atoms": len(structure), "failed": [stage for stage in stages if stage not in results]}
+    
+    atom_header = ["Chain", "ResNum", "ResName", "AtomNum", "AtomName"]
+    if "fasta" in results:
+        sequence = results["fasta"]
+        if sequence:
+            fasta_path = f"{prefix}.fasta"
+            with open_text(fasta_path, 'w') as f: f.write(f">sequence_from_{input_name}\n{sequence}\n")
+            print(f"Sequência FASTA salva em '{fasta_path}'", file=sys.stderr)
+    if "contacts" in results:
+        contacts = {threshold: contacts_within(results["contacts"], threshold) for threshold in thresholds}
+        multi = len(thresholds) > 1
+        write_csv(f"{prefix}.contacts.csv", (["Limiar_A"] if multi else []) + ["Residuo_1", "Residuo_2", "Distancia_A"],
+                  ((threshold,) + c if multi else c for threshold in thresholds for c in contacts[threshold]))
+    if "hydrophoby" in results:
+        write_csv(f"{prefix}.hydrophoby.csv", atom_header + ["Hydrophobicity"], atom_rows(structure, results["hydrophoby"], ".3f"))
+    if "sasa" in results:
+        print(f"SASA Total da Molécula: {sum(results['sasa']):.2f} Å²", file=sys.stderr)
+        write_csv(f"{prefix}.sasa.csv", atom_header + ["SASA_A2"], atom_rows(structure, results["sasa"], ".2f"))
+    
+    # PDB anotado: todas as propriedades por átomo em uma única reescrita do arquivo de entrada.
+    properties, sessions = [], []
+    if "hydrophoby" in results:
+        properties.append(("Hydrophobicity", results["hydrophoby"], "bfactor"))
+        sessions.append(("hydrophoby", "hydrophobicity", -4.5, 4.5))
+    if "sasa" in results:
+        residue_avg, atom_avg_sasa = residue_average(structure, results["sasa"])
+        properties.append(("SASA (média por resíduo)", atom_avg_sasa, "occupancy" if properties else "bfactor"))
+        sessions.append(("sasa", "sasa") + (_sasa_pymol_range(residue_avg) if args.pymol else (0.0, 0.0)))
+    annotated_pdb = f"{prefix}.annotated{ext}"
+    if properties and not args.no_annotate:
+        write_annotated_structure(args.pdb_file, annotated_pdb, structure.serials, properties,
+                                  models=structure.model_nums)
+        # Uma sessão por propriedade, todas do mesmo PDB anotado e pelo mesmo PyMOL persistente.
         if args.pymol:
-            # Para SASA, usa a média por resíduo para definir o range
-            avg_sasa_values = sorted(list(residue_avg_sasa.values()))
+            for (stage, property_type, min_val, max_val), (_, _, target) in zip(sessions, properties):
+                generate_pymol_session(annotated_pdb, f"{prefix}.{stage}.pse", property_type, min_val, max_val,
+                                       column=PYMOL_COLUMNS[target])
+    elif args.pymol:
+        print("Aviso: --pymol requer o PDB anotado (etapas hydrophoby ou sasa, sem --no-annotate).", file=sys.stderr)
+    
+    # Gráficos (matplotlib não é seguro entre threads, então ficam para o final).
+    if args.plots:
+        if not HAS_VIZ:
+            print("Aviso: Módulo de visualização não disponível. Instale matplotlib e numpy.", file=sys.stderr)
+            return summary
+        if "contacts" in results:
+            plot_contacts = contacts[max(thresholds)]
+            if plot_contacts:
+                max_res = max(max(c[0], c[1]) for c in plot_contacts)
+                biohub_viz.plot_contact_map(plot_contacts, max_res, f"{prefix}.contacts.png", max(thresholds))
+        if "hydrophoby" in results:
+            biohub_viz.plot_hydrophoby_profile(structure.atom_records(hydrophobicity=results["hydrophoby"]), f"{prefix}.hydrophoby.png")
+        if "sasa" in results:
+            biohub_viz.plot_sasa_profile(structure.atom_records(sasa=results["sasa"]), f"{prefix}.sasa.png")
+    return summary
+
+# Comando batch: o pipeline do analyze aplicado a muitos arquivos, um por processo do pool. Os
+# arquivos maiores são agendados primeiro, para que um arquivo grande não fique sozinho no
+# final. Cada resultado é acrescentado ao manifest.csv assim que termina; ao recomeçar, os
+# arquivos já concluídos (mesmo caminho, tamanho e opções de análise) são pulados.
+STRUCTURE_SUFFIXES = ('.pdb', '.ent', '.cif', '.mmcif')
+BATCH_MANIFEST_HEADER = ["Arquivo", "Tamanho_bytes", "Status", "Segundos", "Atomos", "Saida", "Opcoes", "Erro"]
+
+def batch_input_files(patterns, list_file=None):
+    """Arquivos de estrutura de diretórios, padrões glob, arquivos avulsos e de uma lista (um caminho por linha)."""
+    entries = list(patterns)
+    if list_file:
+        with open_text(list_file) as f:
+            entries.extend(line.split('#', 1)[0].strip() for line in f)
+    files = []
+    for entry in filter(None, entries):
+        if os.path.isdir(entry):
+            for root, _, names in os.walk(entry):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if strip_compression_suffix(name).lower().endswith(STRUCTURE_SUFFIXES))
+        elif glob.has_magic(entry):
+            files.extend(sorted(path for path in glob.glob(entry, recursive=True) if os.path.isfile(path)))
+        else:
+            files.append(entry)
+    return list(dict.fromkeys(os.path.normpath(path) for path in files))
+
+def read_batch_manifest(manifest_path):
+    """
+    Última linha do manifesto para cada arquivo (o manifesto só recebe linhas novas), ou None se
+    ele não existe ou tem outras colunas (de outra versão) e precisa ser recriado.
+    """
+    last = {}
+    try:
+        with open(manifest_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != BATCH_MANIFEST_HEADER: return None
+            for row in reader:
+                last[row["Arquivo"]] = row
+    except FileNotFoundError:
+        return None
+    return last
+
+def batch_options_fingerprint(options):
+    """Identificador curto das opções que mudam as saídas (não inclui --no-cache nem -j)."""
+    relevant = {key: value for key, value in options.items() if key not in ("no_cache", "jobs", "sasa_in_pool")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def _batch_output_names(files, previous=None):
+    """
+    Nome da pasta de saída de cada arquivo (nome sem extensão, com sufixo se houver repetidos).
+    Arquivos que já estão no manifesto (`previous`) mantêm a pasta de antes, e nenhum arquivo novo
+    recebe uma pasta que o manifesto já usa, para que uma retomada não escreva por cima de outro arquivo.
+    """
+    previous = previous or {}
+    recorded = {path: os.path.basename(os.path.normpath(row["Saida"])) for path, row in previous.items() if row.get("Saida")}
+    names, used = {}, set(recorded.values())
+    for path in sorted(files):
+        # Reaproveito a pasta registrada, se nenhum outro arquivo desta execução já ficou com ela.
+        if path in recorded and recorded[path] not in names.values():
+            names[path] = recorded[path]
+    for path in sorted(files):
+        if path in names: continue
+        stem = os.path.splitext(os.path.basename(strip_compression_suffix(path)))[0]
+        name, n = stem, 1
+        while name in used:
+            n += 1
+            name = f"{stem}_{n}"
+        used.add(name)
+        names[path] = name
+    return names
+
+def _batch_worker(path, output_dir, options):
+    """Analisa um arquivo no processo do pool, com as mensagens gravadas em log.txt na pasta de saída."""
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    log = io.StringIO()
+    error = ""
+    try:
+        with contextlib.redirect_stderr(log), contextlib.redirect_stdout(log):
+            summary = run_analysis(argparse.Namespace(pdb_file=path, outdir=output_dir, prefix=None, **options))
+        if summary is None:
+            status, atoms = "erro", ""
+            error = next((line for line in log.getvalue().splitlines() if line.startswith("Erro")), "estrutura vazia")
+        else:
+            atoms = summary["atoms"]
+            status = "erro" if summary["failed"] else "ok"
+            if summary["failed"]: error = f"etapas com erro: {', '.join(summary['failed'])}"
+    except Exception as e:
+        status, atoms, error = "erro", "", f"{type(e).__name__}: {e}"
+    with open(os.path.join(output_dir, "log.txt"), 'w', encoding='utf-8') as f:
+        f.write(log.getvalue())
+    return status, round(time.perf_counter() - start, 3), atoms, error
+
+def run_batch(args):
+    """Executa o pipeline do analyze em muitos arquivos com um pool de processos, retomando execuções interrompidas."""
+    try:
+        files = batch_input_files(args.inputs, args.list)
+    except OSError as e:
+        print(f"Erro: Não foi possível ler a lista de arquivos: {e}", file=sys.stderr)
+        return
+    missing = [path for path in files if not os.path.isfile(path)]
+    for path in missing:
+        print(f"Aviso: Arquivo não encontrado ignorado: '{path}'", file=sys.stderr)
+    sizes = {path: os.path.getsize(path) for path in files if path not in missing}
+    if not sizes:
+        print("Erro: Nenhum arquivo de estrutura encontrado.", file=sys.stderr)
+        return
+    os.makedirs(args.outdir, exist_ok=True)
+    options = {"stages": args.stages, "no_cache": args.no_cache, "model": args.model, "threshold": args.threshold,
+               "contact_engine": args.contact_engine, "probe_radius": args.probe_radius, "num_points": args.num_points,
+               "sasa_engine": args.sasa_engine, "jobs": 1, "no_annotate": args.no_annotate, "plots": args.plots,
+               "pymol": args.pymol, "sasa_in_pool": False} # Cada processo do pool já ocupa um núcleo.
+    fingerprint = batch_options_fingerprint(options)
+    manifest_path = os.path.join(args.outdir, "manifest.csv")
+    recorded = read_batch_manifest(manifest_path)
+    previous = None if args.force else recorded
+    new_manifest = previous is None
+    # Um arquivo só é pulado se a última execução dele terminou bem com as mesmas opções.
+    done = [path for path in sizes if (previous or {}).get(path, {}).get("Status") == "ok"
+            and previous[path].get("Tamanho_bytes") == str(sizes[path]) and previous[path].get("Opcoes") == fingerprint]
+    stale = sum(1 for path in sizes if path not in done and (previous or {}).get(path, {}).get("Status") == "ok")
+    pending = sorted((path for path in sizes if path not in done), key=lambda path: (-sizes[path], path)) # Maiores primeiro.
+    names = _batch_output_names(sizes, recorded) # Com --force, as pastas de antes também são mantidas.
+    print(f"{len(sizes)} arquivos: {len(done)} já concluídos, {len(pending)} a processar com {args.jobs} processos.", file=sys.stderr)
+    if stale:
+        print(f"  {stale} concluídos antes com outras opções (ou arquivo alterado) serão refeitos.", file=sys.stderr)
+    if not pending: return
+    
+    counts = defaultdict(int)
+    start = time.perf_counter()
+    with open(manifest_path, 'w' if new_manifest else 'a', newline='', encoding='utf-8') as manifest, \
+         ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        writer = csv.writer(manifest)
+        if new_manifest: writer.writerow(BATCH_MANIFEST_HEADER)
+        futures = {pool.submit(_batch_worker, path, os.path.join(args.outdir, names[path]), options): path for path in pending}
+        for n, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                status, seconds, atoms, error = future.result()
+            except Exception as e: # O processo pode ter morrido (ex: falta de memória).
+                status, seconds, atoms, error = "erro", "", "", f"{type(e).__name__}: {e}"
+            writer.writerow([path, sizes[path], status, seconds, atoms, os.path.join(args.outdir, names[path]), fingerprint, error])
+            manifest.flush() # Cada linha vai para o disco assim que o arquivo termina.
+            counts[status] += 1
+            print(f"[{n}/{len(pending)}] {status:<4} {path} ({seconds} s){' - ' + error if error else ''}", file=sys.stderr)
+    print(f"Concluído em {time.perf_counter() - start:.1f} s: {counts['ok']} ok, {counts['erro']} com erro. "
+          f"Manifesto em '{manifest_path}'", file=sys.stderr)
+
+def _add_analyze_options(parser):
+    """Opções das etapas do pipeline, comuns aos comandos analyze e batch."""
+    parser.add_argument("--stages", metavar="ETAPA[,ETAPA...]", type=analyze_stages, default=list(ANALYZE_STAGES), help=f"Etapas a executar, separadas por vírgula, ou 'all' (padrão: {','.join(ANALYZE_STAGES)}).\nAs etapas rodam ao mesmo tempo sobre a mesma estrutura (com contacts, o sasa roda em outro processo).")
+    parser.add_argument("--no-cache", action="store_true", help="Ignora o cache de estruturas já analisadas e relê o arquivo PDB.")
+    parser.add_argument("--model", metavar="N", type=int, default=None, help="Modelo (MODEL) a analisar em arquivos com vários modelos (padrão: o primeiro).")
+    parser.add_argument("-t", "--threshold", metavar="FLOAT[,FLOAT...]", type=threshold_list, default=[8.0], help="Limiar(es) de contato em Angstroms (padrão: 8.0).")
+    parser.add_argument("--contact-engine", choices=sorted(CONTACT_ENGINES), default="grid", help="Motor de cálculo dos contatos (padrão: grid).")
+    parser.add_argument("--probe-radius", metavar="FLOAT", type=float, default=1.4, help="Raio da sonda do solvente em Angstroms (padrão: 1.4).")
+    parser.add_argument("--num-points", metavar="INT", type=int, default=200, help="Número de pontos na superfície de cada átomo para o SASA (padrão: 200).")
+    parser.add_argument("--sasa-engine", choices=["auto"] + sorted(SASA_ENGINES), default="auto", help="Motor de cálculo do SASA (padrão: auto).")
+    parser.add_argument("--no-annotate", action="store_true", help="Não gera o PDB anotado (hidrofobicidade no B-factor e SASA médio por resíduo na ocupância).")
+    parser.add_argument("--plots", action="store_true", help="Gera também os gráficos de cada etapa (requer matplotlib e numpy).")
+    parser.add_argument("--pymol", action="store_true", help="Gera uma sessão PyMOL por propriedade (PREFIXO.hydrophoby.pse, PREFIXO.sasa.pse) a partir do\nPDB anotado, com um único PyMOL mantido aberto entre as sessões (BIOHUB_PYMOL troca o executável).")
+
+# APBS em lote: cada arquivo passa por pdb2pqr e apbs em processos assíncronos, com no máximo
+# --jobs arquivos ao mesmo tempo e um tempo limite por etapa. A conversão para PQR é guardada em
+# cache pelo SHA-256 da entrada e pelo campo de força, então repetir um arquivo só roda o APBS.
+# Os executáveis podem ser trocados (BIOHUB_PDB2PQR, BIOHUB_APBS ou --pdb2pqr/--apbs).
+PDB2PQR_EXECUTABLE = os.environ.get("BIOHUB_PDB2PQR", "pdb2pqr")
+APBS_EXECUTABLE = os.environ.get("BIOHUB_APBS", "apbs")
+PDB2PQR_TIMEOUT = 60  # Tempo limite (s) padrão do pdb2pqr.
+APBS_TIMEOUT = 300    # Tempo limite (s) padrão do apbs.
+PQR_CACHE_DIR = os.environ.get("BIOHUB_PQR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "biohub", "pqr"))
+APBS_COLUMNS = ["Arquivo", "Energia_kJ_mol", "Status", "PQR", "Segundos", "Erro"]
+
+def _pqr_cache_file(pdb_filepath, force_field, pdb2pqr, cache_dir=PQR_CACHE_DIR):
+    """
+    Caminho do PQR em cache para um arquivo, um campo de força e um executável do pdb2pqr (caminho
+    absoluto): trocar de pdb2pqr não reaproveita os PQRs gerados por outra instalação.
+    """
+    digest = hashlib.sha256(pdb2pqr.encode() + b"\0")
+    with open(pdb_filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return os.path.join(cache_dir, f"{digest.hexdigest()}-{force_field}.pqr")
+
+async def _run_tool(command, timeout, cwd=None):
+    """
+    Executa um programa externo e retorna o stdout. O programa roda em um grupo de processos próprio:
+    se passar do tempo limite, o grupo inteiro é encerrado, incluindo os processos filhos de scripts
+    intermediários (ex: os wrappers do conda ou de módulos de ambiente).
+    """
+    new_group = hasattr(os, "killpg")
+    process = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE, start_new_session=new_group)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            if new_group: os.killpg(process.pid, signal.SIGKILL)
+            else: process.kill()
+        except ProcessLookupError:
+            pass
+        # Não espero os pipes: um processo que saiu do grupo ainda pode mantê-los abertos.
+        try:
+            await asyncio.wait_for(process.wait(), 5)
+        except asyncio.TimeoutError:
+            pass
+        raise subprocess.TimeoutExpired(command, timeout)
+    stdout, stderr = stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace')
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout
+
+async def _apbs_job(pdb_file, options, slots, verbose=False):
+    """pdb2pqr (ou o PQR do cache) e apbs para um arquivo; retorna a linha da tabela de energias."""
+    async with slots:
+        start = time.perf_counter()
+        work_dir = tempfile.mkdtemp(prefix="biohub-apbs-") # Um diretório temporário por arquivo.
+        pqr_path = os.path.join(work_dir, f"{os.path.basename(pdb_file)}.pqr")
+        pqr_status, energy, status, error = "", "", "erro", ""
+        try:
+            # 1. Converter PDB para PQR usando pdb2pqr (ou reaproveitar a conversão do cache).
+            # O hash lê o arquivo inteiro: roda em uma thread para não parar os outros jobs.
+            cache_file = (await asyncio.to_thread(_pqr_cache_file, pdb_file, options["ff"], options["pdb2pqr"], options["cache_dir"])
+                          if options["cache_dir"] else None)
+            if cache_file and os.path.exists(cache_file):
+                if verbose: print(f"1. PQR encontrado no cache ({cache_file})", file=sys.stderr)
+                shutil.copyfile(cache_file, pqr_path)
+                pqr_status = "cache"
+            else:
+                if verbose: print(f"1. Executando pdb2pqr...", file=sys.stderr)
+                await _run_tool([options["pdb2pqr"], f"--ff={options['ff']}", os.path.abspath(pdb_file), pqr_path],
+                                options["pdb2pqr_timeout"])
+                pqr_status = "calculado"
+                if cache_file:
+                    # Grava em um arquivo temporário e renomeia, para nunca deixar uma entrada pela metade.
+                    os.makedirs(options["cache_dir"], exist_ok=True)
+                    fd, temp_path = tempfile.mkstemp(dir=options["cache_dir"], suffix=".tmp")
+                    os.close(fd)
+                    shutil.copyfile(pqr_path, temp_path)
+                    os.replace(temp_path, cache_file)
             
-            # Remove valores muito baixos para análise (resíduos quase completamente enterrados)
-            non_zero_sasa = [v for v in avg_sasa_values if v > 0.5]
+            # 2. Criar o arquivo de entrada para o APBS.
+            with open(os.path.join(work_dir, "apbs.in"), 'w') as f: f.write(f"read\n    mol pqr {os.path.basename(pqr_path)}\nend\nelec\n    mg-auto\nend\nquit\n")
             
-            if len(non_zero_sasa) > 0:
-                # Usa percentil 70 dos valores não-zero para melhor sensibilidade
-                percentil_70_idx = int(len(non_zero_sasa) * 0.70)
-                max_sasa = non_zero_sasa[percentil_70_idx]
-                min_sasa = 0.0
-            else:
-                min_sasa = 0.0
-                max_sasa = max(avg_sasa_values) if avg_sasa_values else 1.0
+            # 3. Executar o APBS.
+            if verbose: print("2. Executando APBS...", file=sys.stderr)
+            output = await _run_tool([options["apbs"], "apbs.in"], options["apbs_timeout"], cwd=work_dir)
             
-            print(f"Range de visualização SASA (média por resíduo): 0.00 - {max_sasa:.2f} Ų (percentil 70)", file=sys.stderr)
-            print(f"  Resíduos totais: {len(residue_avg_sasa)}", file=sys.stderr)
-            print(f"  Resíduos enterrados (SASA<0.5): {len(avg_sasa_values) - len(non_zero_sasa)}", file=sys.stderr)
-            print(f"  Resíduos expostos (SASA≥0.5): {len(non_zero_sasa)}", file=sys.stderr)
-            generate_pymol_session(args.write_pdb, args.pymol, property_type="sasa", min_val=min_sasa, max_val=max_sasa)
-    elif args.pymol:
-        # Se --pymol foi especificado mas --write-pdb não, avisa o usuário
-        print("Aviso: --pymol requer --write-pdb. Gerando PDB temporário...", file=sys.stderr)
-        
-        # Calcula média por resíduo também para o caso temporário
-        from collections import defaultdict
-        residue_sasa = defaultdict(list)
-        for atom in sasa_per_atom:
-            residue_key = (atom['chain_id'], atom['res_num'])
-            residue_sasa[residue_key].append(atom['sasa'])
-        
-        residue_avg_sasa = {}
-        for residue_key, sasa_list in residue_sasa.items():
-            residue_avg_sasa[residue_key] = sum(sasa_list) / len(sasa_list)
-        
-        atom_values = []
-        for atom in sasa_per_atom:
-            residue_key = (atom['chain_id'], atom['res_num'])
-            avg_sasa = residue_avg_sasa[residue_key]
-            atom_values.append({'atom_num': atom['atom_num'], 'value': avg_sasa})
-        
-        temp_pdb = "temp_sasa.pdb"
-        write_pdb_with_bfactor(args.pdb_file, temp_pdb, atom_values, "SASA (média por resíduo)")
-        
-        avg_sasa_values = sorted(list(residue_avg_sasa.values()))
-        non_zero_sasa = [v for v in avg_sasa_values if v > 0.5]
-        
-        if len(non_zero_sasa) > 0:
-            percentil_70_idx = int(len(non_zero_sasa) * 0.70)
-            max_sasa = non_zero_sasa[percentil_70_idx]
-            min_sasa = 0.0
-        else:
-            min_sasa = 0.0
-            max_sasa = max(avg_sasa_values) if avg_sasa_values else 1.0
-        
-        print(f"Range de visualização SASA (média por resíduo): 0.00 - {max_sasa:.2f} Ų (percentil 70)", file=sys.stderr)
-        print(f"  Resíduos totais: {len(residue_avg_sasa)}", file=sys.stderr)
-        print(f"  Resíduos enterrados (SASA<0.5): {len(avg_sasa_values) - len(non_zero_sasa)}", file=sys.stderr)
-        print(f"  Resíduos expostos (SASA≥0.5): {len(non_zero_sasa)}", file=sys.stderr)
-        generate_pymol_session(temp_pdb, args.pymol, property_type="sasa", min_val=min_sasa, max_val=max_sasa)
+            # 4. Extrair a energia de solvatação do resultado.
+            if verbose: print("3. Analisando resultados...", file=sys.stderr)
+            for line in output.splitlines():
+                if "Global net ELEC energy" in line:
+                    energy = f"{float(line.split()[-2]):.4f}"; break
+            status = "ok" if energy else "sem energia"
+        except subprocess.CalledProcessError as e:
+            error = f"{os.path.basename(e.cmd[0])} falhou (código {e.returncode}): {e.stderr.strip()}"
+        except subprocess.TimeoutExpired as e:
+            status, error = "timeout", f"{os.path.basename(e.cmd[0])} passou de {e.timeout} s"
+        except (OSError, ValueError) as e:
+            error = str(e)
+        finally:
+            # Limpo os arquivos temporários, a menos que o usuário peça para mantê-los.
+            if not options["keep"]: shutil.rmtree(work_dir, ignore_errors=True)
+            elif verbose: print(f"Arquivos intermediários mantidos em: {work_dir}", file=sys.stderr)
+        return [pdb_file, energy, status, pqr_status, round(time.perf_counter() - start, 3), error]
+
+async def run_apbs_jobs(pdb_files, options, jobs=1, verbose=False, on_result=None):
+    """Executa os arquivos com no máximo `jobs` ao mesmo tempo; retorna as linhas na ordem de entrada."""
+    slots = asyncio.Semaphore(max(1, jobs))
+    async def job(pdb_file):
+        row = await _apbs_job(pdb_file, options, slots, verbose)
+        if on_result: on_result(row)
+        return row
+    return await asyncio.gather(*(job(pdb_file) for pdb_file in pdb_files))
 
 def run_apbs_analysis(args): #BETA, TALVEZ SERÁ DESCONTINUADO
-    """Executa PDB2PQR e APBS para calcular a energia de solvatação eletrostática."""
+    """Executa PDB2PQR e APBS para calcular a energia de solvatação eletrostática de um ou mais arquivos."""
     # Verifico se os programas externos necessários estão instalados e no PATH do sistema.
-    for exe in ["pdb2pqr", "apbs"]:
-        if not shutil.which(exe):
+    executables = {}
+    for name, exe in [("pdb2pqr", args.pdb2pqr), ("apbs", args.apbs)]:
+        executables[name] = shutil.which(exe)
+        if not executables[name]:
             print(f"Erro: '{exe}' não encontrado no PATH.", file=sys.stderr); return
-            
-    work_dir = tempfile.mkdtemp() # Crio um diretório temporário para os arquivos.
-    try:
-        # 1. Converter PDB para PQR usando pdb2pqr.
-        pqr_path = os.path.join(work_dir, f"{os.path.basename(args.pdb_file)}.pqr")
-        print(f"1. Executando pdb2pqr...", file=sys.stderr)
-        subprocess.run(["pdb2pqr", "--ff=amber", args.pdb_file, pqr_path], check=True, capture_output=True, text=True, timeout=60)
-        
-        # 2. Criar o arquivo de entrada para o APBS.
-        apbs_in_path = os.path.join(work_dir, "apbs.in")
-        with open(apbs_in_path, 'w') as f: f.write(f"read\n    mol pqr {os.path.basename(pqr_path)}\nend\nelec\n    mg-auto\nend\nquit\n")
-        
-        # 3. Executar o APBS.
-        print("2. Executando APBS...", file=sys.stderr)
-        result = subprocess.run(["apbs", "apbs.in"], check=True, capture_output=True, text=True, cwd=work_dir, timeout=300)
-        
-        # 4. Extrair a energia de solvatação do resultado.
-        print("3. Analisando resultados...", file=sys.stderr)
-        energy = "Não encontrada"
-        for line in result.stdout.splitlines():
-            if "Global net ELEC energy" in line:
-                energy = f"{float(line.split()[-2]):.4f} kJ/mol"; break
-                
-        print(f"--- Energia de Solvatação Eletrostática ---")
-        print(f"Energia: {energy}")
-        
-    except subprocess.CalledProcessError as e:
-        # Se algum dos programas externos falhar, mostro o erro.
-        print(f"Erro ao executar processo externo:\n{e.stderr}", file=sys.stderr)
-    finally:
-        # Limpo os arquivos temporários, a menos que o usuário peça para mantê-los.
-        if not args.no_cleanup: shutil.rmtree(work_dir)
-        else: print(f"Arquivos intermediários mantidos em: {work_dir}", file=sys.stderr)
+        # O apbs roda no diretório temporário de cada arquivo, então caminhos relativos (ex: ./apbs) não servem.
+        executables[name] = os.path.abspath(executables[name])
+    pdb_files = list(dict.fromkeys(args.pdb_files))
+    for pdb_file in pdb_files:
+        if not os.path.exists(pdb_file):
+            print(f"Erro: Arquivo não encontrado em '{pdb_file}'", file=sys.stderr); return
+    options = {"pdb2pqr": executables["pdb2pqr"], "apbs": executables["apbs"], "ff": args.ff,
+               "cache_dir": None if args.no_pqr_cache else args.pqr_cache, "keep": args.no_cleanup,
+               "pdb2pqr_timeout": args.timeout or PDB2PQR_TIMEOUT, "apbs_timeout": args.timeout or APBS_TIMEOUT}
+    single = len(pdb_files) == 1
+    
+    def report(row):
+        if not single:
+            print(f"  {row[2]:<7} {row[0]} ({row[4]} s, PQR {row[3] or '-'}){' - ' + row[5] if row[5] else ''}", file=sys.stderr)
+    
+    if not single:
+        print(f"Executando pdb2pqr/APBS em {len(pdb_files)} arquivos, {args.jobs} por vez...", file=sys.stderr)
+    rows = asyncio.run(run_apbs_jobs(pdb_files, options, args.jobs, verbose=single, on_result=report))
+    
+    if single and not args.output:
+        row = rows[0]
+        if row[2] in ("ok", "sem energia"):
+            print(f"--- Energia de Solvatação Eletrostática ---")
+            print(f"Energia: {row[1] + ' kJ/mol' if row[1] else 'Não encontrada'}")
+        else:
+            # Se algum dos programas externos falhar, mostro o erro.
+            print(f"Erro ao executar processo externo:\n{row[5]}", file=sys.stderr)
+    elif args.output:
+        write_csv(args.output, APBS_COLUMNS, rows)
+    else:
+        print(f"--- Energias de Solvatação Eletrostática (kJ/mol) ---")
+        for row in rows:
+            print(f"{row[0]}: {row[1] or 'Não encontrada'}{'' if row[2] == 'ok' else f' ({row[2]})'}")
+    if not single:
+        ok = sum(1 for row in rows if row[2] == "ok")
+        print(f"{ok} de {len(rows)} arquivos com energia calculada.", file=sys.stderr)
 
 # Configuração da Interface de Linha de Comando
 
@@ -1001,29 +3489,52 @@ def main():
 
     # Comando fetchpdb 
     parser_fetch = subparsers.add_parser("fetchpdb", help="Baixa um arquivo PDB do RCSB.", formatter_class=argparse.RawTextHelpFormatter)
-    parser_fetch.add_argument("pdb_id", metavar="PDB_ID", help="O ID de 4 caracteres do PDB a ser baixado (ex: 1A2B).")
-    parser_fetch.add_argument("-o", "--output", metavar="ARQUIVO", help="Nome do arquivo de saída (padrão: [PDB_ID].pdb).")
-    parser_fetch.add_argument("--chains", metavar="CHAINS", help="Cadeias a serem mantidas, separadas por vírgula (ex: A,B). Se omitido, mantém todas.")
+    parser_fetch.add_argument("pdb_id", metavar="PDB_ID", nargs="*", help="Um ou mais IDs de 4 caracteres do PDB a serem baixados (ex: 1A2B 4HHB).")
+    parser_fetch.add_argument("--list", metavar="ARQUIVO", help="Arquivo com IDs a baixar (separados por espaço, vírgula ou linha).")
+    parser_fetch.add_argument("-o", "--output", metavar="ARQUIVO", help="Nome do arquivo de saída, para um único ID (padrão: [PDB_ID].pdb ou [PDB_ID].cif).")
+    parser_fetch.add_argument("--outdir", metavar="DIRETORIO", help="Diretório onde salvar os arquivos (padrão: diretório atual).")
+    parser_fetch.add_argument("-j", "--jobs", metavar="INT", type=int, default=4, help="Número de downloads simultâneos (padrão: 4).")
+    parser_fetch.add_argument("--retries", metavar="INT", type=int, default=FETCH_RETRIES, help=f"Novas tentativas em falhas de rede ou HTTP 429/5xx, com espera exponencial (padrão: {FETCH_RETRIES}).")
+    parser_fetch.add_argument("--base-url", metavar="URL", default=PDB_BASE_URL, help="URL base dos downloads (padrão: RCSB, ou a variável BIOHUB_PDB_BASE_URL).")
+    parser_fetch.add_argument("--mirror", metavar="DIRETORIO", default=PDB_MIRROR_DIR, help="Diretório do espelho local dos originais baixados (padrão: ~/.cache/biohub/pdb, ou a variável BIOHUB_PDB_MIRROR).")
+    parser_fetch.add_argument("--no-mirror", action="store_true", help="Não usa o espelho local: sempre baixa e não guarda o original.")
+    parser_fetch.add_argument("--offline", action="store_true", help="Usa apenas o espelho local, sem acessar a rede.")
+    parser_fetch.add_argument("--format", choices=["pdb", "cif"], default="pdb", help="Formato a baixar: 'pdb' (padrão) ou 'cif' (mmCIF, necessário para estruturas grandes).")
+    parser_fetch.add_argument("--chains", metavar="CHAINS", help="Cadeias a serem mantidas, separadas por vírgula (ex: A,B). Com --format cif, maiúsculas e minúsculas são diferenciadas. Se omitido, mantém todas.")
     parser_fetch.add_argument("--protein-only", action="store_true", help="Mantém apenas átomos de proteína (remove água, ligantes e heteroátomos).")
 
     # Comando fasta 
     parser_fasta = subparsers.add_parser("fasta", help="Converte um arquivo PDB em uma sequência FASTA.", formatter_class=argparse.RawTextHelpFormatter)
     parser_fasta.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
+    parser_fasta.add_argument("--no-cache", action="store_true", help="Ignora o cache de estruturas já analisadas e relê o arquivo PDB.")
     parser_fasta.add_argument("-o", "--output", metavar="ARQUIVO", help="Salva a saída em um arquivo FASTA (padrão: stdout).")
     
     # Comando csv2fasta 
     parser_csv = subparsers.add_parser("csv2fasta", help="Converte um arquivo CSV em um formato FASTA.", formatter_class=argparse.RawTextHelpFormatter)
     parser_csv.add_argument("csv_file", metavar="ARQUIVO_CSV", help="Caminho para o arquivo CSV de entrada.")
-    parser_csv.add_argument("-o", "--output", metavar="ARQUIVO", help="Salva a saída em um arquivo FASTA (padrão: stdout).")
+    parser_csv.add_argument("-o", "--output", metavar="ARQUIVO", help="Salva a saída em um arquivo FASTA (padrão: stdout). Com .gz ou .bz2, a saída é comprimida.")
     parser_csv.add_argument("--id-col", metavar="COLUNA", default="0", help="Coluna do identificador (nome ou índice baseado em 0). Padrão: 0.")
     parser_csv.add_argument("--seq-col", metavar="COLUNA", default="1", help="Coluna da sequência (nome ou índice baseado em 0). Padrão: 1.")
     parser_csv.add_argument("--header", action="store_true", help="Flag para indicar que a primeira linha do CSV é um cabeçalho.")
-    parser_csv.add_argument("--delimiter", metavar="CHAR", default=",", help="Caractere usado como delimitador no CSV. Padrão: ','.")
+    parser_csv.add_argument("--delimiter", metavar="CHAR", help="Caractere usado como delimitador no CSV. Padrão: tabulação para .tsv, ',' para os demais.")
+    parser_csv.add_argument("--wrap", metavar="INT", type=int, default=0, help="Quebra as sequências em linhas de INT caracteres (padrão: 0, sem quebra).")
+    parser_csv.add_argument("--progress", action="store_true", help=f"Mostra no stderr quantos registros já foram convertidos (a cada {CSV2FASTA_PROGRESS_EVERY}).")
 
     # Comando physchem
     parser_physchem = subparsers.add_parser("physchem", help="Calcula um conjunto expandido de propriedades físico-químicas.", formatter_class=argparse.RawTextHelpFormatter)
-    parser_physchem.add_argument("sequence", metavar="SEQUENCIA", help="A sequência de aminoácidos a ser analisada.")
+    parser_physchem.add_argument("sequence", metavar="SEQUENCIA", nargs="?", help="A sequência de aminoácidos a ser analisada.")
+    parser_physchem.add_argument("-i", "--input", metavar="ARQUIVO", help="Modo em lote: lê as sequências de um arquivo FASTA ou CSV e grava uma linha de CSV\npor sequência, em fluxo.")
+    parser_physchem.add_argument("--input-format", choices=["auto", "fasta", "csv"], default="auto", help="Formato de --input (padrão: 'auto', CSV para .csv/.tsv e FASTA para os demais).")
+    parser_physchem.add_argument("--id-col", metavar="COLUNA", default="0", help="Com --input CSV: coluna do identificador (nome ou índice baseado em 0). Padrão: 0.")
+    parser_physchem.add_argument("--seq-col", metavar="COLUNA", default="1", help="Com --input CSV: coluna da sequência (nome ou índice baseado em 0). Padrão: 1.")
+    parser_physchem.add_argument("--header", action="store_true", help="Com --input CSV: a primeira linha é um cabeçalho.")
+    parser_physchem.add_argument("--delimiter", metavar="CHAR", help="Com --input CSV: caractere delimitador. Padrão: tabulação para .tsv, ',' para os demais.")
+    parser_physchem.add_argument("--engine", choices=["auto"] + list(PHYSCHEM_ENGINES), default="auto", help="Com --input: 'numpy' (núcleos vetorizados por pedaço de sequências), 'python'\nou 'auto' (padrão: 'numpy' se disponível, senão 'python').")
+    parser_physchem.add_argument("--memo-size", metavar="INT", type=int, default=PHYSCHEM_MEMO_SIZE, help=f"Com --input: sequências repetidas são calculadas uma vez; tamanho do cache LRU\n(padrão: {PHYSCHEM_MEMO_SIZE}; 0 desativa).")
+    parser_physchem.add_argument("--memo-db", metavar="ARQUIVO", help="Com --input: banco SQLite que guarda as propriedades entre execuções.")
+    parser_physchem.add_argument("-j", "--jobs", metavar="INT", type=int, default=1, help="Com --input: número de processos para o cálculo (padrão: 1).")
     parser_physchem.add_argument("-o", "--output", metavar="ARQUIVO_CSV", help="Salva os resultados em um arquivo CSV.")
+    parser_physchem.add_argument("--pka-set", choices=sorted(PKA_SETS), default="biohub", help="Conjunto de pKa usado no ponto isoelétrico (padrão: 'biohub', os valores originais).")
     parser_physchem.add_argument("--plot-treemap", metavar="ARQUIVO_PNG", help="Gera treemap de composição de aminoácidos (requer matplotlib, numpy, squarify).")
     parser_physchem.add_argument("--plot-composition", metavar="ARQUIVO_PNG", help="Gera gráfico de barras de composição de aminoácidos (requer matplotlib).")
     parser_physchem.add_argument("--plot-hydro", metavar="ARQUIVO_PNG", help="Gera perfil de hidrofobicidade Kyte-Doolittle (requer matplotlib).")
@@ -1032,36 +3543,74 @@ def main():
     # Comando contacts
     parser_contacts = subparsers.add_parser("contacts", help="Calcula contatos intramoleculares com base na distância entre C-Alfas.", formatter_class=argparse.RawTextHelpFormatter)
     parser_contacts.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
-    parser_contacts.add_argument("-t", "--threshold", metavar="FLOAT", type=float, default=8.0, help="Distância máxima em Angstroms para considerar um contato. Padrão: 8.0.")
+    parser_contacts.add_argument("--no-cache", action="store_true", help="Ignora o cache de estruturas já analisadas e relê o arquivo PDB.")
+    parser_contacts.add_argument("--model", metavar="N|all", type=model_arg, default=None, help="Modelo (MODEL) a analisar em arquivos com vários modelos (NMR):\num número ou 'all' para todos, um por vez (padrão: o primeiro).")
+    parser_contacts.add_argument("--engine", choices=sorted(CONTACT_ENGINES), default="grid", help="Motor de cálculo: 'grid' (cell list, padrão) ou 'brute' (pares de resíduos com poda por esferas envolventes).")
+    parser_contacts.add_argument("-t", "--threshold", metavar="FLOAT[,FLOAT...]", type=threshold_list, default=[8.0], help="Distância máxima em Angstroms para considerar um contato. Padrão: 8.0.\nVários limiares separados por vírgula (ex: 4,6,8,10) são calculados em uma única passagem,\ncom a coluna Limiar_A na saída.")
+    parser_contacts.add_argument("--interface", metavar="A:B[,C:D...]", nargs="?", const="all", type=chain_pairs, default=None, help="Calcula contatos entre cadeias em vez de dentro da primeira cadeia: entre todos os\npares de cadeias ou só os pares indicados. Resíduos identificados como 'Cadeia:Número'.")
+    parser_contacts.add_argument("-j", "--jobs", metavar="INT", type=int, default=1, help="Número de processos para dividir os pares de cadeias do modo --interface (padrão: 1).")
     parser_contacts.add_argument("-o", "--output", metavar="ARQUIVO_CSV", help="Salva os resultados em um arquivo CSV.")
     parser_contacts.add_argument("--plot", metavar="ARQUIVO_PNG", help="Gera mapa de contatos (contact map) (requer matplotlib e numpy).")
 
     # Comando hydrophoby 
     parser_hydrophoby = subparsers.add_parser("hydrophoby", help="Calcula hidrofobicidade por átomo (escala Kyte-Doolittle).", formatter_class=argparse.RawTextHelpFormatter)
     parser_hydrophoby.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
+    parser_hydrophoby.add_argument("--no-cache", action="store_true", help="Ignora o cache de estruturas já analisadas e relê o arquivo PDB.")
+    parser_hydrophoby.add_argument("--model", metavar="N|all", type=model_arg, default=None, help="Modelo (MODEL) a analisar em arquivos com vários modelos (NMR):\num número ou 'all' para todos, um por vez (padrão: o primeiro).")
     parser_hydrophoby.add_argument("-o", "--output", metavar="ARQUIVO_CSV", help="Salva os resultados em um arquivo CSV.")
     parser_hydrophoby.add_argument("--write-pdb", metavar="ARQUIVO_PDB", help="Gera um arquivo PDB com a hidrofobicidade escrita no B-factor.")
+    parser_hydrophoby.add_argument("--write-target", choices=ANNOTATION_TARGETS, default="bfactor", help="Onde o --write-pdb grava o valor: 'bfactor' (padrão), 'occupancy' ou 'side'\n(CSV à parte, ex.: anotado.Hydrophobicity.csv, mantendo o PDB original).")
     parser_hydrophoby.add_argument("--pymol", metavar="ARQUIVO_PSE", help="Gera um arquivo de sessão PyMOL (.pse) com visualização de hidrofobicidade.")
     parser_hydrophoby.add_argument("--plot-hydrophoby", metavar="ARQUIVO_PNG", help="Gera perfil de hidrofobicidade por resíduo (requer matplotlib e numpy).")
     
     # Comando sasa
     parser_sasa = subparsers.add_parser("sasa", help="Calcula a Área de Superfície Acessível ao Solvente (SASA).", formatter_class=argparse.RawTextHelpFormatter)
     parser_sasa.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
+    parser_sasa.add_argument("--no-cache", action="store_true", help="Ignora o cache de estruturas já analisadas e relê o arquivo PDB.")
+    parser_sasa.add_argument("--model", metavar="N|all", type=model_arg, default=None, help="Modelo (MODEL) a analisar em arquivos com vários modelos (NMR):\num número ou 'all' para todos, um por vez (padrão: o primeiro).")
     parser_sasa.add_argument("--probe-radius", metavar="FLOAT", type=float, default=1.4, help="Raio da sonda do solvente em Angstroms (padrão: 1.4 para água).")
     # MUDANÇA v0.1.3: Reduzido de 960 para 200 pontos por questões de performance.
     # Com 960 pontos, o cálculo fica muito pesado (O(N² × P)) e pode levar >20 minutos ou travar.
     # 200 pontos oferece um bom balanceamento entre precisão e tempo de execução (~2-8 minutos).
     # Usuários que precisarem de maior precisão podem aumentar manualmente com --num-points.
     parser_sasa.add_argument("--num-points", metavar="INT", type=int, default=200, help="Número de pontos na superfície de cada átomo para o cálculo. Padrão: 200 (reduzido de 960 por performance).")
+    parser_sasa.add_argument("--engine", choices=["auto"] + sorted(SASA_ENGINES), default="auto", help="Motor de cálculo: 'numpy' (vetorizado), 'grid' (cell list), 'brute' (todos contra todos, original)\nou 'auto' (padrão: 'numpy' se disponível, senão 'grid').")
+    parser_sasa.add_argument("-j", "--jobs", metavar="INT", type=int, default=1, help="Número de processos para dividir o cálculo entre núcleos (padrão: 1).")
     parser_sasa.add_argument("-o", "--output", metavar="ARQUIVO_CSV", help="Salva os resultados por átomo em um arquivo CSV.")
     parser_sasa.add_argument("--write-pdb", metavar="ARQUIVO_PDB", help="Gera um arquivo PDB com o SASA escrito no B-factor.")
+    parser_sasa.add_argument("--write-target", choices=ANNOTATION_TARGETS, default="bfactor", help="Onde o --write-pdb grava o valor: 'bfactor' (padrão), 'occupancy' ou 'side'\n(CSV à parte, ex.: anotado.SASA_média_por_resíduo.csv, mantendo o PDB original).")
     parser_sasa.add_argument("--pymol", metavar="ARQUIVO_PSE", help="Gera um arquivo de sessão PyMOL (.pse) com visualização de SASA.")
     parser_sasa.add_argument("--plot-profile", metavar="ARQUIVO_PNG", help="Gera perfil de SASA por resíduo (requer matplotlib e numpy).")
 
+    # Comando analyze
+    parser_analyze = subparsers.add_parser("analyze", help="Executa várias análises (fasta, contacts, hydrophoby, sasa) com uma única leitura da estrutura.", formatter_class=argparse.RawTextHelpFormatter)
+    parser_analyze.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
+    parser_analyze.add_argument("--outdir", metavar="DIRETORIO", default="", help="Diretório das saídas (padrão: diretório atual).")
+    parser_analyze.add_argument("--prefix", metavar="NOME", help="Prefixo dos arquivos de saída (padrão: nome do arquivo de entrada sem extensão),\nex.: 1TUP.fasta, 1TUP.contacts.csv, 1TUP.hydrophoby.csv, 1TUP.sasa.csv, 1TUP.annotated.pdb.")
+    _add_analyze_options(parser_analyze)
+    parser_analyze.add_argument("-j", "--jobs", metavar="INT", type=int, default=1, help="Número de processos para o cálculo do SASA (padrão: 1).")
+
+    # Comando batch
+    parser_batch = subparsers.add_parser("batch", help="Executa o pipeline do analyze em muitos arquivos, com um pool de processos e retomada.", formatter_class=argparse.RawTextHelpFormatter)
+    parser_batch.add_argument("inputs", metavar="ENTRADA", nargs="*", help="Diretórios, padrões glob (entre aspas, ex: 'pdbs/**/*.cif') ou arquivos.")
+    parser_batch.add_argument("--list", metavar="ARQUIVO", help="Arquivo com um caminho por linha ('#' inicia um comentário).")
+    parser_batch.add_argument("--outdir", metavar="DIRETORIO", default="biohub_batch", help="Diretório das saídas: uma pasta por arquivo e o manifest.csv (padrão: biohub_batch).")
+    parser_batch.add_argument("-j", "--jobs", metavar="INT", type=int, default=os.cpu_count() or 1, help="Número de arquivos processados ao mesmo tempo (padrão: número de núcleos).")
+    parser_batch.add_argument("--force", action="store_true", help="Reprocessa todos os arquivos, ignorando os já concluídos no manifesto.")
+    _add_analyze_options(parser_batch)
+
     # Comando apbs 
     parser_apbs = subparsers.add_parser("apbs", help="Calcula a energia de solvatação eletrostática (requer PDB2PQR e APBS).", formatter_class=argparse.RawTextHelpFormatter)
-    parser_apbs.add_argument("pdb_file", metavar="ARQUIVO_PDB", help="Caminho para o arquivo PDB de entrada.")
+    parser_apbs.add_argument("pdb_files", metavar="ARQUIVO_PDB", nargs="+", help="Caminho para o(s) arquivo(s) PDB de entrada.")
     parser_apbs.add_argument("--no-cleanup", action="store_true", help="Previne a remoção dos arquivos temporários (PQR, apbs.in, etc.).")
+    parser_apbs.add_argument("-o", "--output", metavar="ARQUIVO_CSV", help="Salva a tabela de energias (arquivo, energia, status, origem do PQR, tempo, erro) em CSV.")
+    parser_apbs.add_argument("-j", "--jobs", metavar="INT", type=int, default=os.cpu_count() or 1, help="Número de arquivos processados ao mesmo tempo (padrão: número de núcleos).")
+    parser_apbs.add_argument("--ff", metavar="CAMPO", default="amber", help="Campo de força do pdb2pqr (padrão: amber).")
+    parser_apbs.add_argument("--timeout", metavar="SEG", type=float, help=f"Tempo limite de cada etapa por arquivo (padrão: {PDB2PQR_TIMEOUT} s no pdb2pqr, {APBS_TIMEOUT} s no apbs).")
+    parser_apbs.add_argument("--pqr-cache", metavar="DIRETORIO", default=PQR_CACHE_DIR, help="Cache das conversões para PQR (padrão: ~/.cache/biohub/pqr, ou BIOHUB_PQR_CACHE).")
+    parser_apbs.add_argument("--no-pqr-cache", action="store_true", help="Sempre executa o pdb2pqr, sem usar nem gravar o cache de PQR.")
+    parser_apbs.add_argument("--pdb2pqr", metavar="EXECUTAVEL", default=PDB2PQR_EXECUTABLE, help="Executável do pdb2pqr (padrão: pdb2pqr, ou BIOHUB_PDB2PQR).")
+    parser_apbs.add_argument("--apbs", metavar="EXECUTAVEL", default=APBS_EXECUTABLE, help="Executável do APBS (padrão: apbs, ou BIOHUB_APBS).")
 
     # Se nenhum comando for fornecido, exibo a ajuda e saio.
     if len(sys.argv) == 1:
@@ -1075,7 +3624,8 @@ def main():
     command_functions = {
         "fetchpdb": handle_fetch_pdb, "fasta": handle_pdb_to_fasta, "csv2fasta": handle_csv_to_fasta,
         "physchem": calculate_physicochemical_properties, "contacts": calculate_intramolecular_contacts,
-        "hydrophoby": predict_solvent_hydrophoby, "sasa": calculate_sasa, "apbs": run_apbs_analysis
+        "hydrophoby": predict_solvent_hydrophoby, "sasa": calculate_sasa, "analyze": run_analysis,
+        "batch": run_batch, "apbs": run_apbs_analysis
     }
     
     # Chamo a função correspondente ao comando que o usuário escolheu.